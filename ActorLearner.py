@@ -0,0 +1,179 @@
+# Actor-learner DQN training: experience collection and gradient updates in separate processes.
+# Each actor process plays envs_per_actor local battles at once (VectorBattleEnv) against the
+# opponent pool, choosing actions with a NumpyModel copy of the policy, and sends its
+# transitions to the learner in batches of send_interval vector steps.
+# The learner (the calling process, which owns the Keras model) adds them to the VectorDQN
+# replay memory and trains one batch after another while they arrive. Every publish_interval
+# updates it writes the model weights to shared memory (WeightBroadcast), and actors copy them
+# when they notice a new version, at most every refresh_interval vector steps.
+# Epsilon anneals over the number of transitions the learner has received, like VectorDQN.
+# Opponents are PlayerModels.create_player names, every player of PlayerModels.TRAINING_POOL by
+# default (OPPONENT_POOL without the slow MCTSPlayer). Actors are spawned, so env_player_class must be
+# importable (a module-level class) and the training script must start training under
+# if __name__ == "__main__".
+
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+from NumpyModel import NumpyModel, model_architecture
+from PlayerModels import TRAINING_POOL, create_player
+from VectorEnv import VectorBattleEnv, linear_epsilon, select_actions
+
+# Model weights in one shared float32 buffer, with a version number that increases on every publish
+class WeightBroadcast:
+
+    def __init__(self, weights, context):
+        self.shapes = [np.shape(array) for array in weights]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.buffer = context.RawArray("f", sum(self.sizes))
+        self.version = context.RawValue("l", 0)
+        self.lock = context.Lock()
+        self.publish(weights)
+
+    def publish(self, weights):
+        flat = np.concatenate([np.ravel(array) for array in weights]).astype(np.float32)
+        with self.lock:
+            np.frombuffer(self.buffer, dtype=np.float32)[:] = flat
+            self.version.value += 1
+
+    # Returns (version, weights), or (version, None) if there is nothing newer than version
+    def read(self, version=0):
+        with self.lock:
+            if self.version.value == version:
+                return version, None
+            flat = np.frombuffer(self.buffer, dtype=np.float32).copy()
+            version = self.version.value
+        weights = []
+        offset = 0
+        for shape, size in zip(self.shapes, self.sizes):
+            weights.append(flat[offset:offset + size].reshape(shape))
+            offset += size
+        return version, weights
+
+def run_actor(actor_index, env_player_class, opponent_names, envs_per_actor, architecture, broadcast, transitions, steps, stop, settings):
+    env_player = env_player_class(battle_format="gen8randombattle", start_listening=False)
+    opponents = [create_player(name) for name in opponent_names]
+    env = VectorBattleEnv(env_player, [opponents[index % len(opponents)] for index in range(envs_per_actor)], seed=settings["seed"] + actor_index * 1000000)
+    version, weights = broadcast.read()
+    model = NumpyModel.from_weights(weights, *architecture)
+    rng = np.random.default_rng(settings["seed"] + actor_index)
+    observations = env.reset()
+    pending = []
+    vector_steps = 0
+    while not stop.is_set():
+        epsilon = linear_epsilon(steps.value, settings["value_max"], settings["value_min"], settings["nb_annealing_steps"])
+        actions = select_actions(model, observations, epsilon, rng)
+        next_observations, rewards, dones, info = env.step(actions)
+        stored_observations = next_observations
+        if info["terminal_observations"]:
+            stored_observations = next_observations.copy()
+            for index, observation in info["terminal_observations"].items():
+                stored_observations[index] = observation
+        pending.append((observations, actions, rewards, stored_observations, dones))
+        observations = next_observations
+        vector_steps += 1
+        if len(pending) >= settings["send_interval"]:
+            batch = tuple(np.concatenate(arrays) for arrays in zip(*pending))
+            transitions.put((actor_index, batch, (env.episodes, env.wins, env.losses, env.ties)))
+            env.reset_results()
+            pending = []
+        if vector_steps % settings["refresh_interval"] == 0:
+            new_version, weights = broadcast.read(version)
+            if weights is not None:
+                model.set_weights(weights)
+                version = new_version
+
+# Trains dqn (a VectorDQN with a Keras model) for nb_steps transitions collected by n_actors actor
+# processes, and returns the throughput and results
+def train_actor_learner(dqn, env_player_class, opponent_names=TRAINING_POOL, nb_steps=90000, n_actors=4, envs_per_actor=8, send_interval=4, refresh_interval=16, publish_interval=10, seed=0):
+    context = multiprocessing.get_context("spawn")
+    architecture = model_architecture(dqn.model)
+    weights = dqn.model.get_weights()
+    if len(weights) != 2 * len(architecture[0]):
+        raise ValueError("The actors need a model of Dense layers with biases")
+    broadcast = WeightBroadcast(weights, context)
+    # Bounded, so actors wait for a learner that can't keep up instead of filling the memory
+    transitions = context.Queue(maxsize=4 * n_actors)
+    steps = context.RawValue("l", dqn.step)
+    stop = context.Event()
+    settings = {
+        "seed": seed,
+        "send_interval": send_interval,
+        "refresh_interval": refresh_interval,
+        "value_max": dqn.value_max,
+        "value_min": dqn.value_min,
+        "nb_annealing_steps": dqn.nb_annealing_steps,
+    }
+    # Every actor plays the whole pool, each starting at a different opponent
+    actors = [
+        context.Process(
+            target=run_actor,
+            args=(index, env_player_class, [opponent_names[(index + offset) % len(opponent_names)] for offset in range(len(opponent_names))], envs_per_actor, architecture, broadcast, transitions, steps, stop, settings),
+            daemon=True,
+        )
+        for index in range(n_actors)
+    ]
+    for actor in actors:
+        actor.start()
+    first_step = dqn.step
+    first_updates = dqn.updates
+    results = np.zeros(4, dtype=np.int64)
+    start = None
+    try:
+        while dqn.step - first_step < nb_steps:
+            received = receive_transitions(dqn, transitions, results, actors, block=dqn.memory is None or dqn.step <= dqn.nb_steps_warmup)
+            if received and start is None:
+                # Timing starts with the first transitions, after the actors have started up
+                start = time.perf_counter()
+            steps.value = dqn.step
+            if dqn.step > dqn.nb_steps_warmup:
+                dqn.train_batch()
+                dqn.update_target()
+                if (dqn.updates - first_updates) % publish_interval == 0:
+                    broadcast.publish(dqn.model.get_weights())
+    finally:
+        stop.set()
+        # Actors can be blocked on a full queue, so keep emptying it until they have all exited
+        while any(actor.is_alive() for actor in actors):
+            try:
+                transitions.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    steps_done = dqn.step - first_step
+    updates = dqn.updates - first_updates
+    return {
+        "transitions": steps_done,
+        "updates": updates,
+        "episodes": int(results[0]),
+        "wins": int(results[1]),
+        "losses": int(results[2]),
+        "ties": int(results[3]),
+        "seconds": elapsed,
+        "transitions_per_second": steps_done / elapsed if elapsed else 0.0,
+        "updates_per_second": updates / elapsed if elapsed else 0.0,
+    }
+
+# Adds every queued batch of transitions to the replay memory (waiting for one if block) and
+# returns how many batches there were
+def receive_transitions(dqn, transitions, results, actors, block):
+    received = 0
+    while True:
+        try:
+            _, batch, batch_results = transitions.get(timeout=1.0) if block and not received else transitions.get_nowait()
+        except queue.Empty:
+            if not block or received:
+                return received
+            if not any(actor.is_alive() for actor in actors):
+                raise RuntimeError("Every actor process has exited")
+            continue
+        dqn.setup_memory(batch[0].shape[1])
+        dqn.memory.append_batch(*batch)
+        dqn.step += len(batch[1])
+        results += batch_results
+        received += 1
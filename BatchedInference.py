@@ -0,0 +1,106 @@
+# Shared, micro-batched model inference for TrainedRLPlayer.
+# model.predict on a single embedding pays the whole Keras predict-loop set-up for one row.
+# Instead, players await BatchedInference.predict with their embedding; requests are queued
+# and run as one predict_on_batch call when the batch is full or the oldest request has waited
+# max_wait seconds. Each waiting player then gets its own row of the result.
+# Everything runs on the asyncio event loop of the players, so the model is never used
+# from two threads at once. One instance per model is shared through get_batched_inference.
+
+import asyncio
+import time
+import weakref
+
+import numpy as np
+
+from collections import Counter
+
+MAX_BATCH_SIZE = 32
+MAX_WAIT = 0.005
+
+class BatchedInference:
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT):
+        # Weak, so that get_batched_inference's entry for the model goes away with the model
+        # (its players hold it)
+        self.model_ref = weakref.ref(model)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # (embedding, future, time queued) for requests waiting for the next batch
+        self.queue = []
+        self.flush_handle = None
+        self.reset_stats()
+
+    @property
+    def model(self):
+        return self.model_ref()
+
+    async def predict(self, embedding):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.queue.append((embedding, future, time.perf_counter()))
+        self.requests += 1
+        self.queue_depth_total += len(self.queue)
+        self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+        if len(self.queue) >= self.max_batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    # Runs every queued request as one batch (in chunks of max_batch_size)
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.queue:
+            batch = self.queue[:self.max_batch_size]
+            del self.queue[:self.max_batch_size]
+            self.run_batch(batch)
+
+    def run_batch(self, batch):
+        now = time.perf_counter()
+        # The models take a window of one embedding per sample: (batch, 1, embedding size)
+        inputs = np.stack([embedding for embedding, _, _ in batch])[:, np.newaxis]
+        try:
+            predictions = np.asarray(self.model.predict_on_batch(inputs))
+        except Exception as error:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        self.batch_sizes[len(batch)] += 1
+        for (_, future, queued), prediction in zip(batch, predictions):
+            self.wait_total += now - queued
+            # A player whose decision timed out no longer waits for its result
+            if not future.done():
+                future.set_result(prediction)
+
+    def reset_stats(self):
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = Counter()
+        self.queue_depth_total = 0
+        self.max_queue_depth = 0
+        self.wait_total = 0.0
+
+    # Queue depth is measured when each request is queued, wait time from queueing to the forward pass
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "mean_queue_depth": self.queue_depth_total / self.requests if self.requests else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+            "mean_wait_seconds": self.wait_total / self.requests if self.requests else 0.0,
+        }
+
+# Maps model -> BatchedInference, so players built from the same model share one queue. Weak keys
+# drop the queue with its model, so a later model can't be given the queue of a collected one
+batched_inferences = weakref.WeakKeyDictionary()
+
+def get_batched_inference(model):
+    if model not in batched_inferences:
+        batched_inferences[model] = BatchedInference(model)
+    return batched_inferences[model]
@@ -0,0 +1,272 @@
+# Plain, picklable copies of the parts of a poke_env Battle that the search reads:
+# * MoveSnapshot: base power, category, type, PP (and the dynamaxed version)
+# * PokemonSnapshot: species, level, stats, types, HP, boosts and known moves
+# * BattleSnapshot: both teams, the active Pokemon, available moves and dynamax/trapped flags
+# The snapshots hold no live poke_env objects, so they can be sent to worker processes and searched
+# there with GameNode and BattleUtilities. Move categories and types are pickled as their enum
+# names and mapped back to the enums when the worker loads them.
+# Object identity is kept inside a snapshot: the active Pokemon is the same object as its
+# team entry, and available moves are the same objects as the active Pokemon's moves.
+
+import random
+
+from poke_env.data import GEN8_MOVES, GEN8_POKEDEX
+from poke_env.environment.move import Move
+from poke_env.environment.move_category import MoveCategory
+from poke_env.environment.pokemon import Pokemon
+from poke_env.environment.pokemon_type import PokemonType
+from poke_env.utils import to_id_str
+
+# Subclasses Move so that isinstance checks in poke_env (BattleOrder.message) treat it as a move.
+# Its slots replace Move's properties and Move.__init__ isn't called, so only the attributes
+# listed here can be read
+class MoveSnapshot(Move):
+    __slots__ = ('id', 'base_power', 'category', 'type', 'current_pp', 'dynamaxed')
+
+    def __init__(self, id, base_power, category, type, current_pp, dynamaxed=None):
+        self.id = id
+        self.base_power = base_power
+        self.category = category
+        self.type = type
+        self.current_pp = current_pp
+        self.dynamaxed = dynamaxed
+
+    def __repr__(self):
+        return f"{self.id} (move snapshot)"
+
+    def __getstate__(self):
+        return (self.id, self.base_power, self.category.name, self.type.name, self.current_pp, self.dynamaxed)
+
+    def __setstate__(self, state):
+        self.id, self.base_power, category, move_type, self.current_pp, self.dynamaxed = state
+        self.category = MoveCategory[category]
+        self.type = PokemonType[move_type]
+
+    @staticmethod
+    def from_move(move):
+        dynamaxed = MoveSnapshot(move.dynamaxed.id, move.dynamaxed.base_power, move.dynamaxed.category, move.dynamaxed.type, move.dynamaxed.current_pp)
+        return MoveSnapshot(move.id, move.base_power, move.category, move.type, move.current_pp, dynamaxed)
+
+
+class PokemonSnapshot:
+    __slots__ = ('species', 'level', 'base_stats', 'stats', 'type_1', 'type_2', 'current_hp', 'max_hp', 'moves', 'boosts', 'is_dynamaxed', 'active')
+
+    def __init__(self, species, level, base_stats, stats, type_1, type_2, current_hp, max_hp, moves, boosts, is_dynamaxed, active):
+        self.species = species
+        self.level = level
+        self.base_stats = base_stats
+        self.stats = stats
+        self.type_1 = type_1
+        self.type_2 = type_2
+        self.current_hp = current_hp
+        self.max_hp = max_hp
+        self.moves = moves
+        self.boosts = boosts
+        self.is_dynamaxed = is_dynamaxed
+        self.active = active
+
+    def __repr__(self):
+        return f"{self.species} (pokemon snapshot)"
+
+    def __getstate__(self):
+        state = [getattr(self, slot) for slot in self.__slots__]
+        state[4] = self.type_1.name
+        state[5] = self.type_2.name if self.type_2 is not None else None
+        return tuple(state)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+        self.type_1 = PokemonType[self.type_1]
+        self.type_2 = PokemonType[self.type_2] if self.type_2 is not None else None
+
+    @property
+    def fainted(self):
+        return self.current_hp is not None and self.current_hp <= 0
+
+    @property
+    def current_hp_fraction(self):
+        return self.current_hp / self.max_hp if self.current_hp else 0
+
+    # Status conditions aren't tracked
+    @property
+    def status(self):
+        return None
+
+    # Same as Pokemon.damage_multiplier
+    def damage_multiplier(self, type_or_move):
+        if isinstance(type_or_move, MOVE_CLASSES):
+            type_or_move = type_or_move.type
+        if isinstance(type_or_move, PokemonType):
+            return type_or_move.damage_multiplier(self.type_1, self.type_2)
+        return 1
+
+    @staticmethod
+    def from_pokemon(pokemon, moves):
+        return PokemonSnapshot(
+            pokemon.species,
+            pokemon.level,
+            dict(pokemon.base_stats),
+            dict(pokemon.stats),
+            pokemon.type_1,
+            pokemon.type_2,
+            pokemon.current_hp,
+            pokemon.max_hp,
+            moves,
+            dict(pokemon.boosts),
+            pokemon.is_dynamaxed,
+            pokemon.active,
+        )
+
+
+class BattleSnapshot:
+
+    def __init__(self, battle_tag, team, opponent_team, active_pokemon, opponent_active_pokemon, available_moves, available_switches, trapped, can_dynamax, opponent_can_dynamax, turn=0, previous_action=None):
+        self.battle_tag = battle_tag
+        self.team = team
+        self.opponent_team = opponent_team
+        self.active_pokemon = active_pokemon
+        self.opponent_active_pokemon = opponent_active_pokemon
+        self.available_moves = available_moves
+        self.available_switches = available_switches
+        self.trapped = trapped
+        self.can_dynamax = can_dynamax
+        self.opponent_can_dynamax = opponent_can_dynamax
+        self.turn = turn
+        self.finished = False
+        # The player's last action, mapped onto this snapshot's moves and Pokemon
+        self.previous_action = previous_action
+
+    # Copies a live battle. previous_action (a Move or Pokemon of that battle, or None) is
+    # translated to the matching snapshot object
+    @staticmethod
+    def from_battle(battle, previous_action=None):
+        copies = {}
+
+        def copy_move(move):
+            if id(move) not in copies:
+                copies[id(move)] = MoveSnapshot.from_move(move)
+                # Dynamaxed moves in available_moves are the cached move.dynamaxed objects
+                copies[id(move.dynamaxed)] = copies[id(move)].dynamaxed
+            return copies[id(move)]
+
+        def copy_team(team):
+            snapshot_team = {}
+            for key, pokemon in team.items():
+                if pokemon is None:
+                    continue
+                moves = {move_id : copy_move(move) for move_id, move in pokemon.moves.items()}
+                copies[id(pokemon)] = PokemonSnapshot.from_pokemon(pokemon, moves)
+                snapshot_team[key] = copies[id(pokemon)]
+            return snapshot_team
+
+        team = copy_team(battle.team)
+        opponent_team = copy_team(battle.opponent_team)
+        available_moves = [copy_move(move) for move in battle.available_moves]
+        snapshot = BattleSnapshot(
+            battle.battle_tag,
+            team,
+            opponent_team,
+            copies.get(id(battle.active_pokemon)),
+            copies.get(id(battle.opponent_active_pokemon)),
+            available_moves,
+            [copies[id(pokemon)] for pokemon in battle.available_switches],
+            battle.trapped,
+            battle.can_dynamax,
+            battle.opponent_can_dynamax,
+            battle.turn,
+        )
+        if previous_action is not None:
+            snapshot.previous_action = copies.get(id(previous_action))
+        return snapshot
+
+
+# Move and Pokemon classes the search accepts, for isinstance checks on actions. MoveSnapshot is a
+# Move; PokemonSnapshot isn't a Pokemon, but has the species that BattleOrder uses for switches
+MOVE_CLASSES = (Move, MoveSnapshot)
+POKEMON_CLASSES = (Pokemon, PokemonSnapshot)
+
+
+# Species and damaging moves that random Pokemon are drawn from: fully evolved base formes
+# from the gen 8 pokedex, and every damaging move grouped by type. Built on first use
+random_pool = None
+
+def get_random_pool():
+    global random_pool
+    if random_pool is None:
+        species_pool = sorted(
+            species for species, entry in GEN8_POKEDEX.items()
+            if entry.get("num", 0) > 0 and "forme" not in entry and not entry.get("evos") and to_id_str(entry["name"]) == species
+        )
+        moves_by_type = {}
+        for move_id, entry in GEN8_MOVES.items():
+            if entry.get("basePower", 0) > 0 and entry.get("category") != "Status" and not entry.get("isZ") and not entry.get("isMax"):
+                moves_by_type.setdefault(entry["type"].upper(), []).append(move_id)
+        all_moves = sorted(move for moves in moves_by_type.values() for move in moves)
+        random_pool = (species_pool, moves_by_type, all_moves)
+    return random_pool
+
+# A random Pokemon with four damaging moves (mostly of its own types) and average EVs/IVs, like the
+# estimates in BattleUtilities. own=False gives the opponent's view: HP in percent and unknown stats
+def random_pokemon(rng, level_range=(72, 88), own=True):
+    species_pool, moves_by_type, all_moves = get_random_pool()
+    species = rng.choice(species_pool)
+    entry = GEN8_POKEDEX[species]
+    types = [PokemonType.from_name(name) for name in entry["types"]]
+    level = rng.randint(*level_range)
+    base_stats = dict(entry["baseStats"])
+    stats = {stat : int(((2 * base_stats[stat] + 36) * level) / 100 + 5) for stat in ("atk", "def", "spa", "spd", "spe")}
+    max_hp = int(((2 * base_stats["hp"] + 36) * level) / 100 + level + 10)
+    move_ids = set()
+    while len(move_ids) < 4:
+        pool = moves_by_type.get(rng.choice(types).name) if rng.random() < 0.6 else None
+        move_ids.add(rng.choice(sorted(pool) if pool else all_moves))
+    moves = {}
+    for move_id in sorted(move_ids):
+        move = GEN8_MOVES[move_id]
+        category = MoveCategory[move["category"].upper()]
+        move_type = PokemonType.from_name(move["type"])
+        moves[move_id] = MoveSnapshot(move_id, move["basePower"], category, move_type, move["pp"], MoveSnapshot("max" + move_id, min(150, move["basePower"] + 40), category, move_type, move["pp"]))
+    current_hp = rng.randint(1, max_hp) if own else rng.randint(1, 100)
+    return PokemonSnapshot(
+        species,
+        level,
+        base_stats,
+        stats if own else {"atk": None, "def": None, "spa": None, "spd": None, "spe": None},
+        types[0],
+        types[1] if len(types) > 1 else None,
+        current_hp,
+        max_hp if own else 100,
+        moves,
+        {"accuracy": 0, "atk": 0, "def": 0, "evasion": 0, "spa": 0, "spd": 0, "spe": 0},
+        False,
+        False,
+    )
+
+# Random positions for benchmarking the search without a Showdown server
+def random_snapshot(seed=None, team_size=6, opponent_team_size=6, level_range=(72, 88)):
+    rng = random.Random(seed)
+    team = {}
+    while len(team) < team_size:
+        pokemon = random_pokemon(rng, level_range, True)
+        team.setdefault(pokemon.species, pokemon)
+    opponent_team = {}
+    while len(opponent_team) < opponent_team_size:
+        pokemon = random_pokemon(rng, level_range, False)
+        opponent_team.setdefault(pokemon.species, pokemon)
+    active_pokemon = next(iter(team.values()))
+    opponent_active_pokemon = next(iter(opponent_team.values()))
+    active_pokemon.active = True
+    opponent_active_pokemon.active = True
+    return BattleSnapshot(
+        "snapshot-%s" % seed,
+        team,
+        opponent_team,
+        active_pokemon,
+        opponent_active_pokemon,
+        list(active_pokemon.moves.values()),
+        [pokemon for pokemon in team.values() if pokemon is not active_pokemon],
+        False,
+        True,
+        True,
+    )
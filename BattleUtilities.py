@@ -1,5 +1,15 @@
+import numpy as np
+import threading
+import TypeChart
+
+from collections import OrderedDict
 from poke_env.environment.move_category import MoveCategory
 
+# Maximum number of damage values kept by the damage cache for each battle, across turns
+DAMAGE_CACHE_SIZE = 4096
+# Maximum number of battles the damage cache keeps tables for
+DAMAGE_CACHE_BATTLES = 64
+
 def calculate_damage(move, attacker, defender, pessimistic, is_bot_turn):
     if move is None:
         print("Why is move none?")
@@ -26,11 +36,89 @@ def calculate_damage(move, attacker, defender, pessimistic, is_bot_turn):
         damage = damage * 0.85
     if move.type == attacker.type_1 or move.type == attacker.type_2:
         damage = damage * 1.5
-    type_multiplier = defender.damage_multiplier(move)
+    type_multiplier = TypeChart.move_multiplier(move, defender)
     damage = damage * type_multiplier
     # print(f"Damage calculation for move {move} against opponent {battle.opponent_active_pokemon} is {damage}")
     return damage
 
+# Batched counterpart to calculate_damage. Row i is moves[i] used by attackers[i] (pass a single
+# Pokemon to use it for every move), column j is defenders[j]. Every step is the same formula as
+# calculate_damage, applied to whole arrays at once:
+# * my moves against the opponent's team: calculate_damage_matrix(moves, my_pokemon, opponent_team, True, True)
+# * the opponent's team against my Pokemon: calculate_damage_matrix(*team_moves(opponent_team), [my_pokemon], False, False)
+def calculate_damage_matrix(moves, attackers, defenders, pessimistic, is_bot_turn):
+    moves = list(moves)
+    defenders = list(defenders)
+    if not isinstance(attackers, (list, tuple)):
+        attackers = [attackers] * len(moves)
+    if not moves or not defenders:
+        return np.zeros((len(moves), len(defenders)))
+    base_power = np.array([move.base_power if move is not None else 0 for move in moves], dtype=float)
+    physical = np.array([move is not None and move.category == MoveCategory.PHYSICAL for move in moves])
+    special = np.array([move is not None and move.category == MoveCategory.SPECIAL for move in moves])
+    same_type = np.array([move is not None and (move.type == attacker.type_1 or move.type == attacker.type_2) for move, attacker in zip(moves, attackers)])
+    levels = np.array([attacker.level for attacker in attackers], dtype=float)
+    # Column 0 is the physical stat, column 1 the special one
+    if is_bot_turn:
+        attack = np.array([[attacker.stats["atk"], attacker.stats["spa"]] for attacker in attackers], dtype=float)
+        defense = estimate_stats(defenders, ("def", "spd"))
+    else:
+        attack = estimate_stats(attackers, ("atk", "spa"))
+        defense = np.array([[defender.stats["def"], defender.stats["spd"]] for defender in defenders], dtype=float)
+    physical_ratio = attack[:, 0:1] / defense[:, 0]
+    special_ratio = attack[:, 1:2] / defense[:, 1]
+    ratio = np.where(physical[:, None], physical_ratio, np.where(special[:, None], special_ratio, 1.0))
+    damage = base_power[:, None] * ratio
+    level_multiplier = ((2 * levels) / 5) + 2
+    damage = damage * level_multiplier[:, None]
+    damage = (damage / 50) + 2
+    if pessimistic:
+        damage = damage * 0.85
+    damage = damage * np.where(same_type, 1.5, 1.0)[:, None]
+    damage = damage * TypeChart.move_multipliers(moves, defenders)
+    # Status moves (and missing moves) don't do damage
+    damage[~(physical | special)] = 0
+    return damage
+
+# Flattens every known move of a team into parallel (moves, attackers) lists for calculate_damage_matrix
+def team_moves(team):
+    moves = []
+    attackers = []
+    for pokemon in team:
+        for move in pokemon.moves.values():
+            moves.append(move)
+            attackers.append(pokemon)
+    return moves, attackers
+
+# Estimated stats (see the comment below) for several Pokemon at once, one row per Pokemon
+def estimate_stats(pokemon, stats):
+    return np.array([[estimated_stats(mon)[stat] for stat in stats] for mon in pokemon], dtype=float)
+
+# Estimated stats only depend on a Pokemon's species and level (and dynamax, for HP), so they are
+# calculated once for each (species, level, is_dynamaxed) and shared by every battle. That is at
+# most a few thousand entries. Each entry holds:
+# * atk, def, spa, spd, spe: average EVs and IVs, as in the ratio functions below
+# * max_spe: the highest possible speed, as in opponent_can_outspeed
+# * hp: calculate_total_HP
+stat_estimates = {}
+
+def estimated_stats(pokemon, is_dynamaxed=False):
+    key = (pokemon.species, pokemon.level, is_dynamaxed)
+    estimates = stat_estimates.get(key)
+    if estimates is None:
+        estimates = calculate_stat_estimates(pokemon, is_dynamaxed)
+        stat_estimates[key] = estimates
+    return estimates
+
+def calculate_stat_estimates(pokemon, is_dynamaxed):
+    base_stats = pokemon.base_stats
+    level = pokemon.level
+    estimates = {stat : (((2 * base_stats[stat] + 36) * level) / 100) + 5 for stat in ("atk", "def", "spa", "spd", "spe")}
+    estimates["max_spe"] = (((2 * base_stats["spe"] + 52) * level) / 100) + 5
+    HP = (((base_stats["hp"] * 2 + 36) * level) / 100) + level + 10
+    estimates["hp"] = HP * 2 if is_dynamaxed else HP
+    return estimates
+
 # The following two functions work very similarly, just focusing on different stats.
 # They get the ratio between my Pokemon's attack and my opponent's estimated defense
 # In random battles each Pokemon has 85 EVs in each stat and a neutral nature
@@ -39,64 +127,175 @@ def calculate_physical_ratio(attacker, defender, is_bot_turn):
     if is_bot_turn:
         # Get my attack value
         attack = attacker.stats["atk"]
-        defense = 2 * defender.base_stats["def"]
-        # I am adding 36 because it represents a very average amount of evs and ivs in the stat
-        defense = defense + 36
-        defense = ((defense * defender.level) / 100 ) + 5
+        # Estimated with 36 added to the doubled base stat, which represents a very average amount of evs and ivs
+        defense = estimated_stats(defender)["def"]
     else:
         defense = defender.stats["def"]
-        attack = 2 * attacker.base_stats["atk"]
-        attack = attack + 36
-        attack = ((attack * attacker.level) / 100) + 5
+        attack = estimated_stats(attacker)["atk"]
     return attack / defense   
 
 def calculate_special_ratio(attacker, defender, is_bot_turn):
     if is_bot_turn:
         # Get my special attack value
         spatk = attacker.stats["spa"]
-        spdef = 2 * defender.base_stats["spd"]
-        # I am adding 36 because it represents a very average amount of evs and ivs in the stat
-        spdef = spdef + 36
-        spdef = ((spdef * defender.level) / 100 ) + 5
+        spdef = estimated_stats(defender)["spd"]
     else: 
         spdef = defender.stats["spd"]
-        spatk = 2 * attacker.base_stats["spa"]
-        spatk = spatk + 36
-        spatk = ((spatk * attacker.level) / 100) + 5
+        spatk = estimated_stats(attacker)["spa"]
     return spatk / spdef
 
 def opponent_can_outspeed(my_pokemon, opponent_pokemon):
     my_speed = my_pokemon.stats["spe"]
     # Assume the worst - max IVs for opponent speed
-    opponent_max_speed = 2 * opponent_pokemon.base_stats["spe"]
-    # Add 52 - thats 31 for IVs and 21 for EVs (which are distributed evenly)
-    opponent_max_speed = opponent_max_speed + 52
-    opponent_max_speed = ((opponent_max_speed * opponent_pokemon.level) / 100) + 5
+    # (52 is added to the doubled base stat - thats 31 for IVs and 21 for EVs, which are distributed evenly)
+    opponent_max_speed = estimated_stats(opponent_pokemon)["max_spe"]
     if opponent_max_speed > my_speed: 
         return True
     else: 
         return False
 
+# Doubled base stat with average EVs and IVs added, doubled again when dynamaxed
 def calculate_total_HP(pokemon, is_dynamaxed): 
-    HP = pokemon.base_stats["hp"] * 2
-    # Add average EVs and IVs to stat
-    HP = HP + 36
-    HP = ((HP * pokemon.level) / 100)
-    HP = HP + pokemon.level + 10
-    if is_dynamaxed: 
-        HP = HP * 2
-    return HP
+    return estimated_stats(pokemon, is_dynamaxed)["hp"]
 
 # Returns a value that determines how well my_pokemon matches up with
 # opponent_pokemon defensively. If opponent_pokemon has multiple types,
 # return the value associated with the worse matchup
 def get_defensive_type_multiplier(my_pokemon, opponent_pokemon):
-    multiplier = 1
-    first_type = opponent_pokemon.type_1
-    first_multiplier = my_pokemon.damage_multiplier(first_type)
-    second_type = opponent_pokemon.type_2
-    if second_type is None:
-        return first_multiplier
-    second_multiplier = my_pokemon.damage_multiplier(second_type)
-    multiplier = first_multiplier if first_multiplier > second_multiplier else second_multiplier
-    return  multiplier
\ No newline at end of file
+    return TypeChart.defensive_multiplier(my_pokemon, opponent_pokemon)
+
+# Gets a number that determines how well my_pokemon matches up with opponent_pokemon. Lower scores are better
+def get_matchup_score(my_pokemon, opponent_pokemon):
+    score = 0
+    defensive_multiplier = get_defensive_type_multiplier(my_pokemon, opponent_pokemon)
+    # A multiplier greater than 1 means we are at a type disadvantage. If there is a better type match, switch
+    if defensive_multiplier == 4:
+        score += 1
+    elif defensive_multiplier == 2:
+        score += 0.5
+    elif defensive_multiplier == 0.5:
+        score -= 0.5
+    elif defensive_multiplier == 0.25:
+        score -= 1
+    if opponent_can_outspeed(my_pokemon, opponent_pokemon):
+        score += 0.5
+    return score
+
+# Memoizes calculate_damage for (move, attacker, defender, pessimistic, is_bot_turn).
+# The same matchups are calculated in every sibling node of the search tree and again
+# on later turns. Pokemon objects belong to a single battle, so every battle gets its own
+# bounded LRU tables, and the tables of battles that finished are dropped (like the
+# transposition tables); at most max_battles battles are kept.
+# Players call sync(battle) at the start of each decision: it switches to the battle's tables
+# and drops the entries of Pokemon whose damage_state changed since they were calculated.
+# Calls without a sync (snapshots in workers, benchmarks) use a table of their own.
+# Every thread has its own tables and counters (a threading.local), so searches offloaded to the
+# decision thread never share an OrderedDict with players on the event loop.
+class DamageCache(threading.local):
+
+    def __init__(self, max_size=DAMAGE_CACHE_SIZE, max_battles=DAMAGE_CACHE_BATTLES):
+        self.max_size = max_size
+        self.max_battles = max_battles
+        # Maps battle tag -> (battle, entries, matrices, states)
+        self.battles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.use_tables(OrderedDict(), OrderedDict(), {})
+
+    def use_tables(self, entries, matrices, states):
+        self.entries = entries
+        self.matrices = matrices
+        self.states = states
+
+    def calculate_damage(self, move, attacker, defender, pessimistic, is_bot_turn):
+        key = (move, attacker, defender, pessimistic, is_bot_turn)
+        damage = self.entries.get(key)
+        if damage is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return damage
+        self.misses += 1
+        damage = calculate_damage(move, attacker, defender, pessimistic, is_bot_turn)
+        self.entries[key] = damage
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return damage
+
+    # Same as calculate_damage_matrix with a single attacker, memoized as one entry per matrix
+    def calculate_damage_matrix(self, moves, attacker, defenders, pessimistic, is_bot_turn):
+        key = (tuple(moves), attacker, tuple(defenders), pessimistic, is_bot_turn)
+        damage = self.matrices.get(key)
+        if damage is not None:
+            self.hits += 1
+            self.matrices.move_to_end(key)
+            return damage
+        self.misses += 1
+        damage = calculate_damage_matrix(key[0], attacker, key[2], pessimistic, is_bot_turn)
+        self.matrices[key] = damage
+        if len(self.matrices) > self.max_size:
+            self.matrices.popitem(last=False)
+        return damage
+
+    # Switches to the battle's tables and invalidates the Pokemon whose state changed. Pokemon seen
+    # for the first time have no entries yet, so only real changes (forme changes, levels that
+    # became known) cost a scan, and only of this battle's tables
+    def sync(self, battle):
+        tables = self.battles.get(battle.battle_tag)
+        if tables is None or tables[0] is not battle:
+            for tag, (old_battle, _, _, _) in list(self.battles.items()):
+                if old_battle.finished:
+                    del self.battles[tag]
+            tables = (battle, OrderedDict(), OrderedDict(), {})
+            self.battles[battle.battle_tag] = tables
+            if len(self.battles) > self.max_battles:
+                self.battles.popitem(last=False)
+        else:
+            self.battles.move_to_end(battle.battle_tag)
+        _, entries, matrices, states = tables
+        self.use_tables(entries, matrices, states)
+        changed = set()
+        for pokemon in list(battle.team.values()) + list(battle.opponent_team.values()):
+            if pokemon is None:
+                continue
+            state = damage_state(pokemon)
+            old_state = states.get(pokemon)
+            if old_state != state:
+                states[pokemon] = state
+                if old_state is not None:
+                    changed.add(pokemon)
+        if changed:
+            self.invalidate(changed)
+
+    # Removes every entry of the current tables where one of the given Pokemon is the attacker or defender
+    def invalidate(self, pokemon):
+        stale = [key for key in self.entries if key[1] in pokemon or key[2] in pokemon]
+        for key in stale:
+            del self.entries[key]
+        stale = [key for key in self.matrices if key[1] in pokemon or not pokemon.isdisjoint(key[2])]
+        for key in stale:
+            del self.matrices[key]
+
+    def clear(self):
+        self.battles.clear()
+        self.use_tables(OrderedDict(), OrderedDict(), {})
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.entries) + len(self.matrices),
+        }
+
+# The parts of a Pokemon's state that calculate_damage reads: species and level (for the stat
+# estimates), types, and the real stats of my own Pokemon
+def damage_state(pokemon):
+    return (pokemon.species, pokemon.level, pokemon.type_1, pokemon.type_2, tuple(pokemon.stats.values()))
+
+# Shared cache used by the search and damage-based players
+damage_cache = DamageCache()
@@ -0,0 +1,501 @@
+# Offline benchmarks for the search players. Positions come from BattleSnapshot.random_snapshot,
+# so none of these need a Showdown server.
+# Run with: python Benchmarks.py <benchmark> [options]
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import BattleUtilities
+import BattleSnapshot
+import LocalSimulator
+import Instrumentation
+import PlayerModels
+import ReplayMemory
+import VectorEnv
+
+from poke_env.player.random_player import RandomPlayer
+from PlayerModels import MinimaxPlayer
+
+# Times the same searches with workers=1 and with the given number of workers,
+# and checks that both pick the same actions
+def parallel_search_speedup(workers=4, depth=2, positions=20, use_alpha_beta=False):
+    snapshots = [BattleSnapshot.random_snapshot(seed) for seed in range(positions)]
+    results = {}
+    for worker_count in (1, workers):
+        searcher = MinimaxPlayer.searcher(depth, use_alpha_beta)
+        searcher.workers = worker_count
+        if worker_count > 1:
+            # Start the pool before timing so process start-up isn't counted
+            searcher.search_root(snapshots[0], 1)
+        BattleUtilities.damage_cache.clear()
+        start = time.perf_counter()
+        actions = [searcher.search_root(snapshot, depth) for snapshot in snapshots]
+        elapsed = time.perf_counter() - start
+        results[worker_count] = ([str(node.action) if node is not None else None for node in actions], elapsed)
+    serial_actions, serial_time = results[1]
+    parallel_actions, parallel_time = results[workers]
+    return {
+        "positions": positions,
+        "depth": depth,
+        "workers": workers,
+        "serial_seconds": serial_time,
+        "parallel_seconds": parallel_time,
+        "speedup": serial_time / parallel_time,
+        "same_actions": serial_actions == parallel_actions,
+    }
+
+# Runs in a fresh interpreter for each inference path, so start-up time and peak RSS
+# include the imports. Prints the measurements as JSON
+INFERENCE_PATH_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+kind, path, decisions = sys.argv[1], sys.argv[2], int(sys.argv[3])
+import numpy as np
+if kind == "keras":
+    import tensorflow as tf
+    model = tf.keras.models.load_model(path)
+else:
+    from NumpyModel import NumpyModel
+    model = NumpyModel(path)
+startup = time.perf_counter() - start
+embeddings = np.random.default_rng(0).random((decisions, 11))
+start = time.perf_counter()
+for embedding in embeddings:
+    np.argmax(model.predict(np.expand_dims([embedding], 0)))
+decision_time = (time.perf_counter() - start) / decisions
+print(json.dumps({"startup_seconds": startup, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "decision_ms": decision_time * 1000}))
+"""
+
+# Start-up time, peak RSS and per-decision latency (one model.predict call on a single embedding,
+# as in TrainedRLPlayer.choose_move) of the Keras model and its NumPy export
+def inference_paths(decisions=1000, keras_path="model_10000", numpy_path="model_10000.npz"):
+    results = {}
+    for kind, path in (("keras", keras_path), ("numpy", numpy_path)):
+        process = subprocess.run([sys.executable, "-c", INFERENCE_PATH_SCRIPT, kind, path, str(decisions)], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if process.returncode == 0:
+            results[kind] = json.loads(process.stdout.strip().splitlines()[-1])
+        else:
+            results[kind] = {"error": process.stderr.strip().splitlines()[-1]}
+    return results
+
+# Runs in a fresh interpreter: imports PlayerModels and builds one player without connecting
+# to a server, or only imports a module when no player class is given
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter() - start
+if len(sys.argv) > 2:
+    getattr(module, sys.argv[2])(*sys.argv[3:], start_listening=False)
+ready = time.perf_counter() - start
+print(json.dumps({"import_seconds": imported, "ready_seconds": ready, "tensorflow_loaded": "tensorflow" in sys.modules}))
+"""
+
+# Cold-start time of each player class (and of the training script's module), averaged over repeats
+def cold_start_times(repeats=5):
+    targets = {
+        "RandomPlayer": ["PlayerModels", "RandomPlayer"],
+        "MaxDamagePlayer": ["PlayerModels", "MaxDamagePlayer"],
+        "SmartDamagePlayer": ["PlayerModels", "SmartDamagePlayer"],
+        "MinimaxPlayer": ["PlayerModels", "MinimaxPlayer"],
+        "TrainedRLPlayer (numpy)": ["PlayerModels", "TrainedRLPlayer", "model_10000.npz"],
+        "TrainedRLPlayer (keras)": ["PlayerModels", "TrainedRLPlayer", "model_10000"],
+        "ProfessorShowdownV2 import": ["ProfessorShowdownV2"],
+    }
+    results = {}
+    for name, arguments in targets.items():
+        runs = []
+        for _ in range(repeats):
+            process = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT] + arguments, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if process.returncode != 0:
+                runs = {"error": process.stderr.strip().splitlines()[-1]}
+                break
+            runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+        if isinstance(runs, dict):
+            results[name] = runs
+        else:
+            results[name] = {
+                "import_seconds": sum(run["import_seconds"] for run in runs) / repeats,
+                "ready_seconds": sum(run["ready_seconds"] for run in runs) / repeats,
+                "tensorflow_loaded": runs[0]["tensorflow_loaded"],
+            }
+    return results
+
+# The stat estimates as they were calculated before the cache: each function works out only the
+# stats it reads from the base stats and level, on every call
+def baseline_estimate_stats(pokemon, stats):
+    base = np.array([[mon.base_stats[stat] for stat in stats] for mon in pokemon], dtype=float)
+    levels = np.array([mon.level for mon in pokemon], dtype=float)[:, None]
+    return (((2 * base + 36) * levels) / 100) + 5
+
+def baseline_physical_ratio(attacker, defender, is_bot_turn):
+    if is_bot_turn:
+        attack = attacker.stats["atk"]
+        defense = (((2 * defender.base_stats["def"] + 36) * defender.level) / 100) + 5
+    else:
+        defense = defender.stats["def"]
+        attack = (((2 * attacker.base_stats["atk"] + 36) * attacker.level) / 100) + 5
+    return attack / defense
+
+def baseline_special_ratio(attacker, defender, is_bot_turn):
+    if is_bot_turn:
+        spatk = attacker.stats["spa"]
+        spdef = (((2 * defender.base_stats["spd"] + 36) * defender.level) / 100) + 5
+    else:
+        spdef = defender.stats["spd"]
+        spatk = (((2 * attacker.base_stats["spa"] + 36) * attacker.level) / 100) + 5
+    return spatk / spdef
+
+def baseline_opponent_can_outspeed(my_pokemon, opponent_pokemon):
+    opponent_max_speed = (((2 * opponent_pokemon.base_stats["spe"] + 52) * opponent_pokemon.level) / 100) + 5
+    return opponent_max_speed > my_pokemon.stats["spe"]
+
+def baseline_total_HP(pokemon, is_dynamaxed):
+    HP = (((pokemon.base_stats["hp"] * 2 + 36) * pokemon.level) / 100) + pokemon.level + 10
+    return HP * 2 if is_dynamaxed else HP
+
+BASELINE_STAT_FUNCTIONS = {
+    "estimate_stats": baseline_estimate_stats,
+    "calculate_physical_ratio": baseline_physical_ratio,
+    "calculate_special_ratio": baseline_special_ratio,
+    "opponent_can_outspeed": baseline_opponent_can_outspeed,
+    "calculate_total_HP": baseline_total_HP,
+}
+
+# Search cost per node with the stat estimate cache, and with the original per-stat formulas swapped
+# back into BattleUtilities. Both runs also check that the searches pick the same actions
+def stat_cache_node_cost(depth=2, positions=20, use_alpha_beta=False):
+    snapshots = [BattleSnapshot.random_snapshot(seed) for seed in range(positions)]
+    cached_functions = {name : getattr(BattleUtilities, name) for name in BASELINE_STAT_FUNCTIONS}
+    results = {}
+    for name, functions in (("uncached", BASELINE_STAT_FUNCTIONS), ("cached", cached_functions)):
+        for function_name, function in functions.items():
+            setattr(BattleUtilities, function_name, function)
+        try:
+            searcher = MinimaxPlayer.searcher(depth, use_alpha_beta)
+            BattleUtilities.damage_cache.clear()
+            BattleUtilities.stat_estimates.clear()
+            nodes = 0
+            actions = []
+            start = time.perf_counter()
+            for snapshot in snapshots:
+                searcher.nodes_visited = 0
+                node = searcher.search_root(snapshot, depth)
+                nodes += searcher.nodes_visited
+                actions.append(str(node.action) if node is not None else None)
+            elapsed = time.perf_counter() - start
+        finally:
+            for function_name, function in cached_functions.items():
+                setattr(BattleUtilities, function_name, function)
+        results[name] = (nodes, elapsed, actions)
+    return {
+        "positions": positions,
+        "depth": depth,
+        "nodes": results["cached"][0],
+        "uncached_us_per_node": results["uncached"][1] / results["uncached"][0] * 1e6,
+        "cached_us_per_node": results["cached"][1] / results["cached"][0] * 1e6,
+        "same_actions": results["uncached"][2] == results["cached"][2],
+    }
+
+# Battles per minute of the local simulator for a few pairings of the heuristic players
+def local_battle_throughput(battles=200, depth=1):
+    pairings = {
+        "MaxDamagePlayer vs RandomPlayer": (PlayerModels.MaxDamagePlayer(start_listening=False), RandomPlayer(start_listening=False)),
+        "SmartDamagePlayer vs MaxDamagePlayer": (PlayerModels.SmartDamagePlayer(start_listening=False), PlayerModels.MaxDamagePlayer(start_listening=False)),
+        "MinimaxPlayer vs SmartDamagePlayer": (MinimaxPlayer(start_listening=False), PlayerModels.SmartDamagePlayer(start_listening=False)),
+    }
+    pairings["MinimaxPlayer vs SmartDamagePlayer"][0].maxDepth = depth
+    return {name : LocalSimulator.play_battles(player_1, player_2, battles) for name, (player_1, player_2) in pairings.items()}
+
+# Environment steps per second of the vectorized environment (batched forward pass of the NumPy
+# model_10000 plus stepping every battle) with 1 and n_envs battles against MaxDamagePlayer
+def vector_env_throughput(n_envs=32, steps=5000):
+    from NumpyModel import NumpyModel
+    from ProfessorShowdownV2 import SelfBattler1
+
+    model = NumpyModel("model_10000.npz")
+    env_player = SelfBattler1(start_listening=False)
+    opponent = PlayerModels.MaxDamagePlayer(start_listening=False)
+    results = {}
+    for size in (1, n_envs):
+        env = VectorEnv.VectorBattleEnv(env_player, [opponent] * size)
+        observations = env.reset()
+        start = time.perf_counter()
+        for _ in range(steps // size):
+            observations, _, _, _ = env.step(VectorEnv.select_actions(model, observations))
+        elapsed = time.perf_counter() - start
+        results[size] = {"steps": steps // size * size, "episodes": env.episodes, "seconds": elapsed, "steps_per_second": steps // size * size / elapsed}
+    return results
+
+# Heap growth of storing transitions 11-dim transitions with keras-rl's append, and batches of
+# batch_size sampled per second, for SequentialMemory (if keras-rl is installed) and the ReplayMemory variants
+def replay_memory_costs(transitions=100000, batch_size=32, samples=2000):
+    memories = {
+        "ReplayMemory (KerasRLMemory)": lambda: ReplayMemory.KerasRLMemory(ReplayMemory.ReplayMemory(transitions, 11)),
+        "PrioritizedReplayMemory (KerasRLMemory)": lambda: ReplayMemory.KerasRLMemory(ReplayMemory.PrioritizedReplayMemory(transitions, 11)),
+        "ReplayMemory (memory-mapped, KerasRLMemory)": lambda: ReplayMemory.KerasRLMemory(ReplayMemory.ReplayMemory(transitions, 11, tempfile.mkdtemp())),
+    }
+    try:
+        from rl.memory import SequentialMemory
+        memories["SequentialMemory"] = lambda: SequentialMemory(limit=transitions, window_length=1)
+    except ImportError:
+        pass
+    rng = np.random.default_rng(0)
+    observations = rng.random((transitions, 11))
+    actions = rng.integers(22, size=transitions)
+    terminals = rng.random(transitions) < 0.04
+    results = {}
+    for name, create in memories.items():
+        tracemalloc.start()
+        memory = create()
+        for observation, action, terminal in zip(observations, actions, terminals):
+            # Like embed_battle, every observation is a new array
+            memory.append(observation.copy(), int(action), 1.0, bool(terminal))
+        heap_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for _ in range(samples):
+            memory.sample(batch_size)
+        sample_seconds = time.perf_counter() - start
+        results[name] = {"heap_megabytes": heap_bytes / 2 ** 20, "batches_per_second": samples / sample_seconds}
+        # The learners that use ReplayMemory directly sample arrays, without building Experience tuples
+        if isinstance(memory, ReplayMemory.KerasRLMemory):
+            start = time.perf_counter()
+            for _ in range(samples):
+                memory.memory.sample(batch_size, rng)
+            results[name]["array_batches_per_second"] = samples / (time.perf_counter() - start)
+    return results
+
+# Search time per node with the leaves scored one by one and in batches (batch_leaves), and
+# whether both give every root child the same score
+def batched_leaf_scoring(depth=2, positions=20, use_alpha_beta=False):
+    snapshots = [BattleSnapshot.random_snapshot(seed) for seed in range(positions)]
+    results = {}
+    for batch_leaves in (False, True):
+        searcher = MinimaxPlayer.searcher(depth, use_alpha_beta, batch_leaves=batch_leaves)
+        BattleUtilities.damage_cache.clear()
+        nodes = 0
+        scores = []
+        start = time.perf_counter()
+        for snapshot in snapshots:
+            searcher.nodes_visited = 0
+            node = searcher.search_root(snapshot, depth)
+            nodes += searcher.nodes_visited
+            scores.append([child.score for child in node.parent_node.children] if node is not None else None)
+        elapsed = time.perf_counter() - start
+        results["batched" if batch_leaves else "scalar"] = (nodes, elapsed, scores)
+    return {
+        "positions": positions,
+        "depth": depth,
+        "nodes": results["batched"][0],
+        "scalar_us_per_node": results["scalar"][1] / results["scalar"][0] * 1e6,
+        "batched_us_per_node": results["batched"][1] / results["batched"][0] * 1e6,
+        "same_scores": results["scalar"][2] == results["batched"][2],
+    }
+
+# Local battles per minute of MinimaxPlayer vs MaxDamagePlayer with and without reuse_tree. Both
+# runs should play the same battles, since the reused trees are the same as newly generated ones
+def tree_reuse_throughput(battles=100, depth=2, use_alpha_beta=False, time_budget=None):
+    results = {}
+    for reuse_tree in (False, True):
+        # Same random choices (MaxDamagePlayer's default moves) in both runs
+        random.seed(0)
+        BattleUtilities.damage_cache.clear()
+        minimax_player = MinimaxPlayer(start_listening=False, use_alpha_beta=use_alpha_beta, reuse_tree=reuse_tree)
+        if time_budget is None:
+            minimax_player.maxDepth = depth
+        else:
+            # A budget the search never runs out of, so the results don't depend on timing
+            minimax_player.time_budget = time_budget
+            minimax_player.max_iterative_depth = depth
+        results["reuse" if reuse_tree else "fresh"] = LocalSimulator.play_battles(minimax_player, PlayerModels.MaxDamagePlayer(start_listening=False), battles)
+    return results
+
+# play_battles results with the first player's mean decision time
+def timed_battles(player, opponent, battles):
+    latencies = []
+    choose_move = player.choose_move
+
+    def timed_choose_move(battle):
+        start = time.perf_counter()
+        order = choose_move(battle)
+        latencies.append(time.perf_counter() - start)
+        return order
+
+    player.choose_move = timed_choose_move
+    try:
+        results = LocalSimulator.play_battles(player, opponent, battles)
+    finally:
+        del player.choose_move
+    results["ms_per_decision"] = 1000 * sum(latencies) / len(latencies) if latencies else 0.0
+    return results
+
+# MCTSPlayer against MinimaxPlayer at equal wall-clock time: MinimaxPlayer's mean decision time at
+# the given depth (against MaxDamagePlayer) becomes MCTSPlayer's time budget, and then both play
+# MaxDamagePlayer and each other
+def mcts_vs_minimax(battles=100, depth=2, rollout_batch=1):
+    random.seed(0)
+    BattleUtilities.damage_cache.clear()
+    minimax_player = MinimaxPlayer(start_listening=False)
+    minimax_player.maxDepth = depth
+    results = {"minimax_vs_max_damage": timed_battles(minimax_player, PlayerModels.MaxDamagePlayer(start_listening=False), battles)}
+    time_budget = results["minimax_vs_max_damage"]["ms_per_decision"] / 1000
+    mcts_player = PlayerModels.MCTSPlayer(start_listening=False, simulations=None, time_budget=time_budget, rollout_batch=rollout_batch, seed=0)
+    results["mcts_vs_max_damage"] = timed_battles(mcts_player, PlayerModels.MaxDamagePlayer(start_listening=False), battles)
+    results["mcts_vs_minimax"] = timed_battles(mcts_player, minimax_player, battles)
+    results["time_budget_ms"] = time_budget * 1000
+    results["simulations_per_second"] = mcts_player.simulations_per_second()
+    return results
+
+# MinimaxPlayer vs MaxDamagePlayer without dynamax branches, with them at full width and with them
+# limited to the given beam widths: wins, mean decision time and nodes generated per decision
+def selective_expansion(battles=100, depth=2, beam_widths=(4, 3)):
+    configs = {
+        "baseline": {},
+        "dynamax": {"dynamax_branches": True},
+        "dynamax_beam": {"dynamax_branches": True, "beam_widths": beam_widths},
+    }
+    results = {}
+    for name, kwargs in configs.items():
+        random.seed(0)
+        BattleUtilities.damage_cache.clear()
+        Instrumentation.reset()
+        Instrumentation.enable()
+        minimax_player = MinimaxPlayer(start_listening=False, **kwargs)
+        minimax_player.maxDepth = depth
+        try:
+            results[name] = timed_battles(minimax_player, PlayerModels.MaxDamagePlayer(start_listening=False), battles)
+        finally:
+            Instrumentation.disable()
+        player_metrics = Instrumentation.snapshot()["players"][minimax_player.username]
+        results[name]["nodes_per_decision"] = player_metrics["nodes_generated"] / max(player_metrics["decisions"]["count"], 1)
+    return results
+
+# MinimaxPlayer vs MaxDamagePlayer with plain search nodes, with a NodeArena and with an arena
+# capped at node_cap nodes: wins, mean decision time, the most nodes a decision had at once (mean and
+# max over the decisions, and the estimated bytes of the max; the plain nodes aren't counted) and the
+# peak traced memory of a second run of the same battles
+def node_arena_memory(battles=50, depth=3, use_alpha_beta=True, node_cap=2000):
+    configs = {
+        "plain": {},
+        "arena": {"use_node_arena": True},
+        "capped": {"node_cap": node_cap},
+    }
+    results = {}
+    for name, kwargs in configs.items():
+        for traced in (False, True):
+            random.seed(0)
+            BattleUtilities.damage_cache.clear()
+            minimax_player = MinimaxPlayer(start_listening=False, use_alpha_beta=use_alpha_beta, **kwargs)
+            minimax_player.maxDepth = depth
+            peaks = []
+            choose_node = minimax_player.choose_node
+
+            def recorded_choose_node(battle, deadline=None, choose_node=choose_node, player=minimax_player, peaks=peaks):
+                node = choose_node(battle, deadline)
+                peaks.append((player.peak_nodes, player.peak_bytes))
+                return node
+
+            minimax_player.choose_node = recorded_choose_node
+            if not traced:
+                results[name] = timed_battles(minimax_player, PlayerModels.MaxDamagePlayer(start_listening=False), battles)
+                results[name]["mean_peak_nodes"] = sum(nodes for nodes, _ in peaks) / len(peaks) if peaks else 0.0
+                results[name]["max_peak_nodes"], results[name]["max_peak_bytes"] = max(peaks) if peaks else (0, 0)
+                continue
+            tracemalloc.start()
+            LocalSimulator.play_battles(minimax_player, PlayerModels.MaxDamagePlayer(start_listening=False), battles)
+            results[name]["traced_peak_megabytes"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+    return results
+
+# Local battles per minute of MinimaxPlayer vs SmartDamagePlayer with Instrumentation disabled and
+# enabled, and the metrics recorded while enabled
+def instrumentation_overhead(battles=100, depth=1):
+    results = {}
+    for enabled in (False, True):
+        if enabled:
+            Instrumentation.reset()
+            Instrumentation.enable()
+        minimax_player = MinimaxPlayer(start_listening=False)
+        minimax_player.maxDepth = depth
+        try:
+            results["enabled" if enabled else "disabled"] = LocalSimulator.play_battles(minimax_player, PlayerModels.SmartDamagePlayer(start_listening=False), battles)
+        finally:
+            Instrumentation.disable()
+    results["metrics"] = {name: {key: value for key, value in player_metrics.items() if key != "battles"} for name, player_metrics in Instrumentation.snapshot()["players"].items()}
+    return results
+
+BENCHMARKS = {
+    "parallel_search": parallel_search_speedup,
+    "inference_paths": inference_paths,
+    "cold_start": cold_start_times,
+    "stat_cache": stat_cache_node_cost,
+    "local_battles": local_battle_throughput,
+    "vector_env": vector_env_throughput,
+    "replay_memory": replay_memory_costs,
+    "instrumentation": instrumentation_overhead,
+    "batched_leaves": batched_leaf_scoring,
+    "tree_reuse": tree_reuse_throughput,
+    "mcts": mcts_vs_minimax,
+    "selective_expansion": selective_expansion,
+    "node_arena": node_arena_memory,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--positions", type=int, default=20)
+    parser.add_argument("--alpha-beta", action="store_true")
+    parser.add_argument("--decisions", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--battles", type=int, default=200)
+    parser.add_argument("--envs", type=int, default=32)
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--transitions", type=int, default=100000)
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--node-cap", type=int, default=2000)
+    parser.add_argument("--rollout-batch", type=int, default=1)
+    parser.add_argument("--beam-widths", type=lambda widths: tuple(None if width == "none" else int(width) for width in widths.split(",")), default=(4, 3), help="Comma-separated widths per ply, none for unlimited")
+    args = parser.parse_args()
+    if args.benchmark == "parallel_search":
+        print(parallel_search_speedup(args.workers, args.depth, args.positions, args.alpha_beta))
+    elif args.benchmark == "inference_paths":
+        print(inference_paths(args.decisions))
+    elif args.benchmark == "stat_cache":
+        print(stat_cache_node_cost(args.depth, args.positions, args.alpha_beta))
+    elif args.benchmark == "local_battles":
+        for name, result in local_battle_throughput(args.battles, args.depth).items():
+            print(name, result)
+    elif args.benchmark == "vector_env":
+        for size, result in vector_env_throughput(args.envs, args.steps).items():
+            print(f"{size} battles", result)
+    elif args.benchmark == "replay_memory":
+        for name, result in replay_memory_costs(args.transitions).items():
+            print(name, result)
+    elif args.benchmark == "batched_leaves":
+        print(batched_leaf_scoring(args.depth, args.positions, args.alpha_beta))
+    elif args.benchmark == "tree_reuse":
+        for name, result in tree_reuse_throughput(args.battles, args.depth, args.alpha_beta, args.time_budget).items():
+            print(name, result)
+    elif args.benchmark == "mcts":
+        print(json.dumps(mcts_vs_minimax(args.battles, args.depth, args.rollout_batch), indent=2))
+    elif args.benchmark == "selective_expansion":
+        print(json.dumps(selective_expansion(args.battles, args.depth, args.beam_widths), indent=2))
+    elif args.benchmark == "node_arena":
+        print(json.dumps(node_arena_memory(args.battles, args.depth, args.alpha_beta, args.node_cap), indent=2))
+    elif args.benchmark == "instrumentation":
+        print(json.dumps(instrumentation_overhead(args.battles, args.depth), indent=2))
+    elif args.benchmark == "cold_start":
+        for name, result in cold_start_times(args.repeats).items():
+            print(name, result)
@@ -0,0 +1,160 @@
+# Evaluation of an agent against the opponent pool on the local simulator, in parallel.
+# Players are (name, kwargs) pairs for PlayerModels.create_player (or just a name), so worker
+# processes can build their own. Every pairing is split into chunks of battles that run on a
+# process pool at the same time, and the chunks of a pairing are merged into:
+# * wins, losses, ties and the win rate with a 95% Wilson score interval
+# * mean battle length in turns
+# * the agent's per-decision latency (mean, median, 95th and 99th percentile, max; in ms)
+# evaluate plays an agent against a list of opponents, round_robin plays every pair of a list of
+# players. write_results saves either as JSON.
+# Run an evaluation from the command line with:
+# python Evaluation.py TrainedRLPlayer --agent-kwargs '{"model": "model_10000.npz"}' --output results.json
+
+import argparse
+import json
+import math
+import multiprocessing
+import time
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from LocalSimulator import play_battle
+from PlayerModels import OPPONENT_POOL, PLAYER_CLASSES, create_player
+
+# Every player class except TrainedRLPlayer, which needs a model
+OPPONENTS = OPPONENT_POOL
+CHUNK_SIZE = 25
+
+def player_spec(player):
+    return (player, {}) if isinstance(player, str) else (player[0], dict(player[1]))
+
+def player_label(player):
+    name, kwargs = player_spec(player)
+    return name if not kwargs else f"{name}({', '.join(f'{key}={value}' for key, value in sorted(kwargs.items()))})"
+
+# 95% Wilson score interval of a win rate
+def wilson_interval(wins, battles, z=1.96):
+    if battles == 0:
+        return 0.0, 1.0
+    rate = wins / battles
+    denominator = 1 + z * z / battles
+    center = (rate + z * z / (2 * battles)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / battles + z * z / (4 * battles * battles)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+# Plays the battles with the given seeds in this process and returns the raw results
+def play_chunk(agent, opponent, seeds):
+    agent_name, agent_kwargs = player_spec(agent)
+    opponent_name, opponent_kwargs = player_spec(opponent)
+    agent_player = create_player(agent_name, **agent_kwargs)
+    opponent_player = create_player(opponent_name, **opponent_kwargs)
+    latencies = []
+    choose_move = agent_player.choose_move
+
+    def timed_choose_move(battle):
+        start = time.perf_counter()
+        order = choose_move(battle)
+        latencies.append(time.perf_counter() - start)
+        return order
+
+    # LocalBattle calls the player's choose_move, so an instance attribute times every decision
+    agent_player.choose_move = timed_choose_move
+    wins = losses = ties = turns = 0
+    for seed in seeds:
+        battle = play_battle(agent_player, opponent_player, seed)
+        turns += battle.turn
+        if battle.winner == 0:
+            wins += 1
+        elif battle.winner == 1:
+            losses += 1
+        else:
+            ties += 1
+    return {"wins": wins, "losses": losses, "ties": ties, "turns": turns, "latencies": latencies}
+
+def summarize(agent, opponent, chunks):
+    wins = sum(chunk["wins"] for chunk in chunks)
+    losses = sum(chunk["losses"] for chunk in chunks)
+    ties = sum(chunk["ties"] for chunk in chunks)
+    battles = wins + losses + ties
+    latencies = np.concatenate([chunk["latencies"] for chunk in chunks]) * 1000 if chunks else np.zeros(0)
+    low, high = wilson_interval(wins, battles)
+    return {
+        "agent": player_label(agent),
+        "opponent": player_label(opponent),
+        "battles": battles,
+        "wins": wins,
+        "losses": losses,
+        "ties": ties,
+        "win_rate": wins / battles if battles else 0.0,
+        "win_rate_low": low,
+        "win_rate_high": high,
+        "mean_turns": sum(chunk["turns"] for chunk in chunks) / battles if battles else 0.0,
+        "decisions": len(latencies),
+        "latency_mean_ms": float(latencies.mean()) if len(latencies) else 0.0,
+        "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "latency_p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        "latency_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        "latency_max_ms": float(latencies.max()) if len(latencies) else 0.0,
+    }
+
+# Plays n_battles of every (agent, opponent) pairing, seeds seed to seed + n_battles - 1 for each,
+# in chunks of chunk_size battles on workers processes (1 plays everything in this process)
+def run_pairings(pairings, n_battles, workers, seed=0, chunk_size=CHUNK_SIZE):
+    tasks = [(index, agent, opponent, range(start, min(start + chunk_size, seed + n_battles))) for index, (agent, opponent) in enumerate(pairings) for start in range(seed, seed + n_battles, chunk_size)]
+    start = time.perf_counter()
+    if workers == 1:
+        chunks = [play_chunk(*task[1:]) for task in tasks]
+    else:
+        # Spawned, so workers don't inherit the caller's TensorFlow state
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            chunks = list(executor.map(play_chunk, *list(zip(*tasks))[1:]))
+    seconds = time.perf_counter() - start
+    results = []
+    for index, (agent, opponent) in enumerate(pairings):
+        pairing_chunks = [chunk for task, chunk in zip(tasks, chunks) if task[0] == index]
+        results.append(summarize(agent, opponent, pairing_chunks))
+    return {"battles_per_pairing": n_battles, "workers": workers, "seconds": seconds, "pairings": results}
+
+def evaluate(agent, opponents=OPPONENTS, n_battles=100, workers=None, seed=0, chunk_size=CHUNK_SIZE):
+    workers = workers or multiprocessing.cpu_count()
+    return run_pairings([(agent, opponent) for opponent in opponents], n_battles, workers, seed, chunk_size)
+
+# Every player against every other player (each pair once, from the first player's side)
+def round_robin(players, n_battles=100, workers=None, seed=0, chunk_size=CHUNK_SIZE):
+    workers = workers or multiprocessing.cpu_count()
+    pairings = [(players[first], players[second]) for first in range(len(players)) for second in range(first + 1, len(players))]
+    return run_pairings(pairings, n_battles, workers, seed, chunk_size)
+
+def write_results(results, path):
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+def print_results(results):
+    for pairing in results["pairings"]:
+        print(
+            "%s vs %s: %d victories out of %d battles (%.1f%%, 95%% CI %.1f-%.1f%%), %.1f turns, %.2f ms per decision (p95 %.2f ms)"
+            % (pairing["agent"], pairing["opponent"], pairing["wins"], pairing["battles"], 100 * pairing["win_rate"], 100 * pairing["win_rate_low"], 100 * pairing["win_rate_high"], pairing["mean_turns"], pairing["latency_mean_ms"], pairing["latency_p95_ms"])
+        )
+    print("%.1f seconds on %d workers" % (results["seconds"], results["workers"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("agent", choices=sorted(PLAYER_CLASSES))
+    parser.add_argument("--agent-kwargs", type=json.loads, default={})
+    parser.add_argument("--opponents", nargs="+", default=list(OPPONENTS), choices=sorted(PLAYER_CLASSES))
+    parser.add_argument("--round-robin", action="store_true", help="Also play every pair of opponents")
+    parser.add_argument("--battles", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    agent = (args.agent, args.agent_kwargs)
+    if args.round_robin:
+        results = round_robin([agent] + args.opponents, args.battles, args.workers, args.seed)
+    else:
+        results = evaluate(agent, args.opponents, args.battles, args.workers, args.seed)
+    print_results(results)
+    if args.output is not None:
+        write_results(results, args.output)
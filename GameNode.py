@@ -1,41 +1,131 @@
 # This class will hold a single game-state, consisting of:
-# * Battle object that holds global game state
+# * The search context (battle object that holds global game state, slot tables, previous action
+#   and node arena), shared by every node of the tree
 # * Current Pokemon
-# * Current HP
+# * Current HP (a tuple indexed by team slot, shared with the parent unless it changed)
 # * Opponent Pokemon
-# * Opponent Current HP
+# * Opponent Current HP (same layout as Current HP)
 # * An Action parameter that holds either an attack or Pokemon
 #   and represents the action taken to get to this state
 # * References to its child nodes 
 # * A numerical score (higher is better) 
+# * A state hash, updated incrementally from the parent, for the transposition table
 
 import BattleUtilities
 
-from poke_env.environment.move import Move
-from poke_env.environment.pokemon import Pokemon
+from collections.abc import Mapping
+from BattleSnapshot import MOVE_CLASSES, POKEMON_CLASSES
 
-class GameNode: 
-    battle = None
-    current_pokemon = None
-    current_HP = {}
-    opponent_pokemon = None
-    opponent_HP = {}
-    action = None
-    has_dynamaxed = False
-    currently_dynamaxed = False
-    opponent_has_dynamaxed = False
-    opponent_currently_dynamaxed = False
-    children = []
-    score = float('-inf')
-    parent_node = None
-    previous_action = None
-
-    def __init__(self, battle, current_pokemon, current_HP, opponent_pokemon, opponent_HP, action, has_dynamaxed, currently_dynamaxed, opponent_has_dynamaxed, opponent_currently_dynamaxed, score, parent_node, previous_action):
+# Read-only Pokemon -> HP mapping over a node's HP tuple. Every node in a
+# search tree shares the same slot dictionary (Pokemon -> index), so this lets
+# callers keep reading node.current_HP[pokemon] without a dict copy per node
+class HPView(Mapping):
+    __slots__ = ('slots', 'values')
+
+    def __init__(self, slots, values):
+        self.slots = slots
+        self.values = values
+
+    def __getitem__(self, pokemon):
+        return self.values[self.slots[pokemon]]
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.values)
+
+# Returns a copy of values with a single entry replaced. Children that don't
+# change an HP value share their parent's tuple instead (copy-on-write)
+def replace_HP(values, index, HP):
+    return values[:index] + (HP,) + values[index + 1:]
+
+# A node's state hash is the XOR of one hash per piece of state (each HP entry, both
+# active slots and the dynamax flags), so a child's hash is its parent's hash with
+# only the changed pieces swapped out
+def rehash_HP(state_hash, side, old_values, new_values):
+    for i, (old, new) in enumerate(zip(old_values, new_values)):
+        if old != new:
+            state_hash ^= hash((side, i, old)) ^ hash((side, i, new))
+    return state_hash
+
+def full_state_hash(current_slot, current_HP_values, opponent_slot, opponent_HP_values, flags):
+    state_hash = hash(('active', current_slot)) ^ hash(('opponent_active', opponent_slot)) ^ hash(('flags', flags))
+    for i, HP in enumerate(current_HP_values):
+        state_hash ^= hash((0, i, HP))
+    for i, HP in enumerate(opponent_HP_values):
+        state_hash ^= hash((1, i, HP))
+    return state_hash
+
+# Everything the child generators read from the battle instead of from the nodes. A tree generated
+# for the battle at one point is the same as a newly generated one later if this hasn't changed
+def tree_signature(battle):
+    return (
+        battle.active_pokemon,
+        battle.trapped,
+        battle.can_dynamax,
+        battle.opponent_can_dynamax,
+        tuple((move, move.current_pp > 0) for move in battle.available_moves),
+        tuple((pokemon, pokemon.current_hp > 0, tuple((move, move.current_pp > 0) for move in pokemon.moves.values())) for pokemon in battle.team.values()),
+        tuple((pokemon, bool(pokemon.current_hp), tuple(pokemon.moves.values())) for pokemon in battle.opponent_team.values() if pokemon is not None),
+    )
+
+# Distance between the HP estimates of two nodes, over the values both know
+def HP_distance(node, other):
+    distance = 0
+    for values, other_values in ((node.current_HP_values, other.current_HP_values), (node.opponent_HP_values, other.opponent_HP_values)):
+        for HP, other_HP in zip(values, other_values):
+            if HP is not None and other_HP is not None:
+                distance += abs(HP - other_HP)
+    return distance
+
+# What every node of a search tree has in common, stored once for the tree: the battle, the slot
+# tables (Pokemon -> index in the HP tuples), the action taken before the search and the NodeArena
+# the nodes come from (None creates them as usual)
+class SearchContext:
+    __slots__ = ('battle', 'team_slots', 'opponent_slots', 'previous_action', 'arena')
+
+    def __init__(self, battle, team_slots, opponent_slots, previous_action, arena=None):
         self.battle = battle
+        self.team_slots = team_slots
+        self.opponent_slots = opponent_slots
+        self.previous_action = previous_action
+        self.arena = arena
+
+class GameNode: 
+    __slots__ = (
+        'context',
+        'current_pokemon',
+        'current_slot',
+        'current_HP_values',
+        'opponent_pokemon',
+        'opponent_slot',
+        'opponent_HP_values',
+        'action',
+        'has_dynamaxed',
+        'currently_dynamaxed',
+        'opponent_has_dynamaxed',
+        'opponent_currently_dynamaxed',
+        'children',
+        'score',
+        'parent_node',
+        'state_hash',
+    )
+
+    # current_HP and opponent_HP are dictionaries that map Pokemon to HP. They are only
+    # read once here, for the root node; the team order becomes the slot order for the whole tree
+    # hash_state can be turned off when nothing reads state_hash (it is then None for the whole tree).
+    # The root itself isn't allocated from arena, only the nodes below it
+    def __init__(self, battle, current_pokemon, current_HP, opponent_pokemon, opponent_HP, action, has_dynamaxed, currently_dynamaxed, opponent_has_dynamaxed, opponent_currently_dynamaxed, score, parent_node, previous_action, hash_state=True, arena=None):
+        team_slots = {pokemon : i for i, pokemon in enumerate(current_HP.keys())}
+        opponent_slots = {pokemon : i for i, pokemon in enumerate(opponent_HP.keys())}
+        self.context = SearchContext(battle, team_slots, opponent_slots, previous_action, arena)
         self.current_pokemon = current_pokemon
-        self.current_HP = current_HP
+        self.current_slot = team_slots[current_pokemon]
+        self.current_HP_values = tuple(current_HP.values())
         self.opponent_pokemon = opponent_pokemon
-        self.opponent_HP = opponent_HP
+        self.opponent_slot = opponent_slots[opponent_pokemon]
+        self.opponent_HP_values = tuple(opponent_HP.values())
         self.action = action
         self.has_dynamaxed = has_dynamaxed
         self.currently_dynamaxed = currently_dynamaxed
@@ -44,57 +134,232 @@ class GameNode:
         self.score = score
         self.parent_node = parent_node
         self.children = []
-        self.previous_action = previous_action
+        self.state_hash = None
+        if not hash_state:
+            return
+        # The root hash also covers what the scores and child generators depend on outside of the
+        # node: the real HP values that score() compares against, whether switching is allowed, and
+        # the rest of tree_signature (dynamax options and the opponent's revealed Pokemon and moves).
+        # Species and move ids stand in for the objects, so snapshots of the same battle hash the same
+        turn_state = (
+            self.current_HP_values,
+            self.opponent_HP_values,
+            isinstance(previous_action, POKEMON_CLASSES),
+            battle.trapped,
+            battle.can_dynamax,
+            battle.opponent_can_dynamax,
+            tuple((move.id, move.current_pp) for move in battle.available_moves),
+            tuple((pokemon.species, bool(pokemon.current_hp), tuple(pokemon.moves)) for pokemon in battle.opponent_team.values() if pokemon is not None),
+        )
+        self.state_hash = hash(turn_state) ^ full_state_hash(self.current_slot, self.current_HP_values, self.opponent_slot, self.opponent_HP_values, (has_dynamaxed, currently_dynamaxed, opponent_has_dynamaxed, opponent_currently_dynamaxed))
+
+    @property
+    def battle(self):
+        return self.context.battle
+
+    @property
+    def team_slots(self):
+        return self.context.team_slots
+
+    @property
+    def opponent_slots(self):
+        return self.context.opponent_slots
+
+    @property
+    def previous_action(self):
+        return self.context.previous_action
+
+    @property
+    def current_HP(self):
+        return HPView(self.team_slots, self.current_HP_values)
+
+    @property
+    def opponent_HP(self):
+        return HPView(self.opponent_slots, self.opponent_HP_values)
+
+    # Creates a child node that shares this node's context and (unless replaced) HP tuples
+    def add_child(self, current_pokemon, current_HP_values, opponent_pokemon, opponent_HP_values, action, has_dynamaxed, currently_dynamaxed, opponent_has_dynamaxed, opponent_currently_dynamaxed):
+        context = self.context
+        if context.arena is None:
+            child = GameNode.__new__(GameNode)
+            child.children = []
+        else:
+            child = context.arena.allocate()
+        child.context = context
+        child.current_pokemon = current_pokemon
+        child.current_slot = self.current_slot if current_pokemon is self.current_pokemon else context.team_slots[current_pokemon]
+        child.current_HP_values = current_HP_values
+        child.opponent_pokemon = opponent_pokemon
+        child.opponent_slot = self.opponent_slot if opponent_pokemon is self.opponent_pokemon else context.opponent_slots[opponent_pokemon]
+        child.opponent_HP_values = opponent_HP_values
+        child.action = action
+        child.has_dynamaxed = has_dynamaxed
+        child.currently_dynamaxed = currently_dynamaxed
+        child.opponent_has_dynamaxed = opponent_has_dynamaxed
+        child.opponent_currently_dynamaxed = opponent_currently_dynamaxed
+        child.score = self.score
+        child.parent_node = self
+        child.state_hash = None if self.state_hash is None else self.child_state_hash(child)
+        self.children.append(child)
+        return child
+
+    # This node's state hash with the pieces that differ in child swapped out
+    def child_state_hash(self, child):
+        state_hash = self.state_hash
+        current_HP_values = child.current_HP_values
+        opponent_HP_values = child.opponent_HP_values
+        if current_HP_values is not self.current_HP_values:
+            state_hash = rehash_HP(state_hash, 0, self.current_HP_values, current_HP_values)
+        if opponent_HP_values is not self.opponent_HP_values:
+            state_hash = rehash_HP(state_hash, 1, self.opponent_HP_values, opponent_HP_values)
+        if child.current_slot != self.current_slot:
+            state_hash ^= hash(('active', self.current_slot)) ^ hash(('active', child.current_slot))
+        if child.opponent_slot != self.opponent_slot:
+            state_hash ^= hash(('opponent_active', self.opponent_slot)) ^ hash(('opponent_active', child.opponent_slot))
+        flags = (child.has_dynamaxed, child.currently_dynamaxed, child.opponent_has_dynamaxed, child.opponent_currently_dynamaxed)
+        parent_flags = (self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed)
+        if flags != parent_flags:
+            state_hash ^= hash(('flags', parent_flags)) ^ hash(('flags', flags))
+        return state_hash
+
+    # Children from an earlier search of a kept tree (see reroot), or newly generated ones.
+    # Children are always generated all at once, so a node with children has all of them.
+    # Selective expansion: with a beam_width, only that many of the children are kept (see prune_children)
+    def expand_bot_moves(self, beam_width=None, dynamax=False):
+        if not self.children:
+            self.generate_bot_moves(dynamax)
+            self.prune_children(beam_width, self.bot_action_value)
+        return self.children
+
+    def expand_opponent_moves(self, beam_width=None, dynamax=False):
+        if not self.children:
+            self.generate_opponent_moves(dynamax)
+            self.prune_children(beam_width, self.opponent_action_value)
+        return self.children
+
+    # Keeps the beam_width children with the highest value, in the order they were generated
+    def prune_children(self, beam_width, value):
+        if beam_width is None or len(self.children) <= beam_width:
+            return
+        values = [value(child) for child in self.children]
+        best = sorted(range(len(values)), key=lambda i: values[i], reverse=True)[:beam_width]
+        self.children = [self.children[i] for i in sorted(best)]
+
+    # Cheap estimates that rank the children for selective expansion, in percent of the target's
+    # total HP. They only use the damage estimates, not the HP values of the node.
+    # My actions: the damage of a move, or for a switch, how much less the opponent's strongest
+    # known move would do to the Pokemon coming in
+    def bot_action_value(self, child):
+        if isinstance(child.action, MOVE_CLASSES):
+            damage = BattleUtilities.damage_cache.calculate_damage(child.action, self.current_pokemon, self.opponent_pokemon, True, True)
+            return damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, self.opponent_currently_dynamaxed) * 100
+        moves = list(self.opponent_pokemon.moves.values())
+        if not moves:
+            return 0
+        damage = BattleUtilities.damage_cache.calculate_damage_matrix(moves, self.opponent_pokemon, (self.current_pokemon, child.action), False, False).max(axis=0)
+        return damage[0] / BattleUtilities.calculate_total_HP(self.current_pokemon, self.currently_dynamaxed) * 100 - damage[1] / BattleUtilities.calculate_total_HP(child.action, False) * 100
+
+    # The opponent's actions, most dangerous to me first: the damage of a move to my Pokemon, or for
+    # a switch, how much less my move would do to the Pokemon coming in
+    def opponent_action_value(self, child):
+        if isinstance(child.action, MOVE_CLASSES):
+            damage = BattleUtilities.damage_cache.calculate_damage(child.action, self.opponent_pokemon, self.current_pokemon, False, False)
+            return damage / BattleUtilities.calculate_total_HP(self.current_pokemon, self.currently_dynamaxed) * 100
+        if child.action is None or not isinstance(self.action, MOVE_CLASSES):
+            return 0
+        damage = BattleUtilities.damage_cache.calculate_damage_matrix((self.action,), self.current_pokemon, (self.opponent_pokemon, child.action), True, True)[0]
+        return damage[0] / BattleUtilities.calculate_total_HP(self.opponent_pokemon, self.opponent_currently_dynamaxed) * 100 - damage[1] / BattleUtilities.calculate_total_HP(child.action, False) * 100
+
+    # Turns this node of a tree kept from an earlier search into root, a new root built from the
+    # battle with the same Pokemon, dynamax flags and slot tables, and keeps its children (which
+    # get root's context).
+    # The HP values, state hashes and scores below it are recomputed from root's values with the
+    # same transitions that generated them, so the tree is the same as a newly generated one.
+    # switching_changed: whether generate_bot_moves now adds switches where it didn't (or the other
+    # way around), because root's previous action is a switch and the kept tree's wasn't (or wasn't and was)
+    def reroot(self, root, switching_changed=False):
+        for attribute in GameNode.__slots__:
+            if attribute != 'children':
+                setattr(self, attribute, getattr(root, attribute))
+        self.refresh_children(True, switching_changed)
+        return self
+
+    def refresh_children(self, is_bot_turn, switching_changed=False):
+        if not self.children:
+            return
+        if is_bot_turn and switching_changed:
+            # Switches come after the moves, as in generate_bot_moves
+            if self.switching_allowed():
+                self.add_bot_switches()
+            else:
+                self.children = [child for child in self.children if not isinstance(child.action, POKEMON_CLASSES)]
+        if not is_bot_turn:
+            # By action, since selective expansion can leave out some of the moves
+            moves = list(self.opponent_pokemon.moves.values())
+            move_outcomes = dict(zip(moves, self.opponent_move_outcomes(moves)))
+            if any(child.opponent_has_dynamaxed and not self.opponent_has_dynamaxed for child in self.children):
+                dynamax_moves = [move.dynamaxed for move in moves]
+                move_outcomes.update(zip(dynamax_moves, self.opponent_move_outcomes(dynamax_moves, True)))
+        for child in self.children:
+            child.context = self.context
+            child.score = self.score
+            # My actions and the opponent's switches don't change HP
+            if is_bot_turn or isinstance(child.action, POKEMON_CLASSES):
+                child.current_HP_values, child.opponent_HP_values = self.current_HP_values, self.opponent_HP_values
+            elif child.action is None:
+                child.current_HP_values, child.opponent_HP_values = self.default_outcome()
+            else:
+                child.current_HP_values, child.opponent_HP_values = move_outcomes[child.action]
+            child.state_hash = None if self.state_hash is None else self.child_state_hash(child)
+            child.refresh_children(not is_bot_turn, switching_changed)
 
 
     # This function should add child nodes for every legal move and switch you can perform
-    def generate_bot_moves(self):
+    # dynamax also adds the Max Move of every move, for dynamaxing this turn
+    def generate_bot_moves(self, dynamax=False):
         self.add_bot_moves()
-        #self.add_bot_dynamax_moves()
-        if not self.battle.trapped and (not isinstance(self.previous_action, Pokemon) or self.battle.active_pokemon.current_hp <= 0):
+        if dynamax:
+            self.add_bot_dynamax_moves()
+        if self.switching_allowed():
             self.add_bot_switches()
         return self.children
+
+    def switching_allowed(self):
+        return not self.battle.trapped and (not isinstance(self.previous_action, POKEMON_CLASSES) or self.battle.active_pokemon.current_hp <= 0)
 		
     def add_bot_moves(self):
 		# Add children for every legal move
-        i = 0
+        for move in self.usable_moves():
+            # Generate a child node with the move as the action. Bot moves don't change HP yet, so the HP tuples are shared
+            self.add_child(self.current_pokemon, self.current_HP_values, self.opponent_pokemon, self.opponent_HP_values, move, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed)
+
+    def usable_moves(self):
         if self.battle.active_pokemon is self.current_pokemon: 
-            for move in self.battle.available_moves:
-                if move.current_pp > 0:
-                    # Generate a child node with the move as the action
-                    i = i + 1
-                    self.children.append(GameNode(self.battle, self.current_pokemon, self.current_HP.copy(), self.opponent_pokemon, self.opponent_HP.copy(), move, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed, self.score, self, self.previous_action))
+            moves = self.battle.available_moves
         else: 
-            for move in self.current_pokemon.moves.values():
-                if move.current_pp > 0: 
-                    # Generate a child node with the move as the action
-                    i = i + 1
-                    self.children.append(GameNode(self.battle, self.current_pokemon, self.current_HP.copy(), self.opponent_pokemon, self.opponent_HP.copy(), move, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed, self.score, self, self.previous_action)) 
-		
+            moves = self.current_pokemon.moves.values()
+        return [move for move in moves if move.current_pp > 0]
 		
     def add_bot_dynamax_moves(self):
-        i = 0
 		# Add every move with a Dynamax option
         if self.battle.can_dynamax and not self.has_dynamaxed:
-            for move in self.battle.available_moves:
-                if move.current_pp > 0:
-                    self.children.append(GameNode(self.battle, self.current_pokemon, self.current_HP.copy(), self.opponent_pokemon, self.opponent_HP.copy(), move.dynamaxed, True, True, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed, self.score, self, self.previous_action))
+            for move in self.usable_moves():
+                self.add_child(self.current_pokemon, self.current_HP_values, self.opponent_pokemon, self.opponent_HP_values, move.dynamaxed, True, True, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed)
 		
 
     def add_bot_switches(self): 
         # Add children for every legal switch
-        i = 0
         for switch in self.battle.team.values():
             if switch.current_hp > 0 and switch is not self.current_pokemon:
-                i = i + 1
-                self.children.append(GameNode(self.battle, switch, self.current_HP.copy(), self.opponent_pokemon, self.opponent_HP.copy(), switch, self.has_dynamaxed, False, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed, self.score, self, self.previous_action))
+                self.add_child(switch, self.current_HP_values, self.opponent_pokemon, self.opponent_HP_values, switch, self.has_dynamaxed, False, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed)
         return self.children
 
     # This function should add child nodes based on every move and switch the opponent can perform (that we can know about)
     # This function should take into account the actions that the player made, and calculate new estimated HP values
-    def generate_opponent_moves(self): 
+    def generate_opponent_moves(self, dynamax=False): 
         self.add_opponent_moves()
-        #self.add_opponent_dynamax_moves()
+        if dynamax:
+            self.add_opponent_dynamax_moves()
         self.add_opponent_switches()
          # If there are no moves for the opponent, add a "None" action and estimate damage from the bot's attack
         if len(self.children) == 0:
@@ -103,76 +368,71 @@ class GameNode:
 		
     def add_opponent_moves(self):
 		# Add children for every move the opponent has that we know about
-        for move in self.opponent_pokemon.moves.values():
-            updated_current_HP = self.current_HP.copy()
-            updated_opponent_HP = self.opponent_HP.copy()
+        moves = list(self.opponent_pokemon.moves.values())
+        for move, (updated_current_HP, updated_opponent_HP) in zip(moves, self.opponent_move_outcomes(moves)):
+            self.add_child(self.current_pokemon, updated_current_HP, self.opponent_pokemon, updated_opponent_HP, move, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed)
+
+    # (my HP values, opponent HP values) after each of the opponent's moves, in the order of moves
+    # opponent_dynamaxing: the moves are Max Moves that the opponent dynamaxes for
+    def opponent_move_outcomes(self, moves, opponent_dynamaxing=False):
+        current_slot = self.current_slot
+        opponent_slot = self.opponent_slot
+        # Damage from every opponent move against my Pokemon, calculated as one matrix
+        opponent_damage = BattleUtilities.damage_cache.calculate_damage_matrix(moves, self.opponent_pokemon, (self.current_pokemon,), False, False)[:, 0].tolist()
+        # Turn order, total HP and the damage of my move are the same for every opponent move
+        opponent_moves_first = BattleUtilities.opponent_can_outspeed(self.current_pokemon, self.opponent_pokemon) or isinstance(self.action, POKEMON_CLASSES)
+        current_total_HP = BattleUtilities.calculate_total_HP(self.current_pokemon, self.currently_dynamaxed)
+        opponent_total_HP = BattleUtilities.calculate_total_HP(self.opponent_pokemon, self.opponent_currently_dynamaxed or opponent_dynamaxing)
+        if moves and (isinstance(self.action, MOVE_CLASSES) or not opponent_moves_first):
+            my_damage = BattleUtilities.damage_cache.calculate_damage(self.action, self.current_pokemon, self.opponent_pokemon, True, True)
+        outcomes = []
+        for i in range(len(moves)):
+            updated_current_HP = self.current_HP_values
+            updated_opponent_HP = self.opponent_HP_values
             # If opponent outspeeds (or I switched this turn), start by calculating how much damage opponent does
-            if BattleUtilities.opponent_can_outspeed(self.current_pokemon, self.opponent_pokemon) or isinstance(self.action, Pokemon):
-                damage = BattleUtilities.calculate_damage(move, self.opponent_pokemon, self.current_pokemon, False, False)
-                damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.current_pokemon, self.currently_dynamaxed)) * 100
-                updated_current_HP.update({self.current_pokemon : self.current_HP[self.current_pokemon] - damage })
+            if opponent_moves_first:
+                damage = opponent_damage[i]
+                damage_percentage = (damage / current_total_HP) * 100
+                updated_current_HP = replace_HP(updated_current_HP, current_slot, self.current_HP_values[current_slot] - damage)
                 # If my pokemon survives (and attacked this turn), calculcate damage
-                if isinstance(self.action, Move) and updated_current_HP[self.current_pokemon] > 0:
-                    damage = BattleUtilities.calculate_damage(self.action, self.current_pokemon, self.opponent_pokemon, True, True)
-                    damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, self.opponent_currently_dynamaxed)) * 100
-                    updated_opponent_HP.update({self.opponent_pokemon : self.opponent_HP[self.opponent_pokemon] - damage_percentage })
+                if isinstance(self.action, MOVE_CLASSES) and updated_current_HP[current_slot] > 0:
+                    damage = my_damage
+                    damage_percentage = (damage / opponent_total_HP) * 100
+                    updated_opponent_HP = replace_HP(updated_opponent_HP, opponent_slot, self.opponent_HP_values[opponent_slot] - damage_percentage)
             else: 
                 # I attack first, calculate damage
-                damage = BattleUtilities.calculate_damage(self.action, self.current_pokemon, self.opponent_pokemon, True, True)
-                damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, self.opponent_currently_dynamaxed)) * 100
-                updated_opponent_HP.update({self.opponent_pokemon : self.opponent_HP[self.opponent_pokemon] - damage_percentage})
+                damage = my_damage
+                damage_percentage = (damage / opponent_total_HP) * 100
+                updated_opponent_HP = replace_HP(updated_opponent_HP, opponent_slot, self.opponent_HP_values[opponent_slot] - damage_percentage)
                 # If opponent survices, calculate their damage as well
-                if updated_opponent_HP[self.opponent_pokemon] > 0: 
-                    damage = BattleUtilities.calculate_damage(move, self.opponent_pokemon, self.current_pokemon, False, False)
-                    damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.current_pokemon, self.currently_dynamaxed)) * 100
-                    updated_current_HP.update({self.current_pokemon : self.current_HP[self.current_pokemon] - damage_percentage})
-            self.children.append(GameNode(self.battle, self.current_pokemon, updated_current_HP, self.opponent_pokemon, updated_opponent_HP, move, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed, self.score, self, self.previous_action))
+                if updated_opponent_HP[opponent_slot] > 0: 
+                    damage = opponent_damage[i]
+                    damage_percentage = (damage / current_total_HP) * 100
+                    updated_current_HP = replace_HP(updated_current_HP, current_slot, self.current_HP_values[current_slot] - damage_percentage)
+            outcomes.append((updated_current_HP, updated_opponent_HP))
+        return outcomes
 
     def add_opponent_dynamax_moves(self):
-        i = 0
 		# Add every move with a dynamax option
-        #if self.battle.opponent_can_dynamax and not self.opponent_has_dynamaxed:
-        #    for move in self.opponent_pokemon.moves.values():
-        #        updated_current_HP = self.current_HP
-        #        updated_opponent_HP = self.opponent_HP
-        #        # If opponent outspeeds (or I switched this turn), start by calculating how much damage opponent does
-        #        if BattleUtilities.opponent_can_outspeed(self.current_pokemon, self.opponent_pokemon) or isinstance(self.action, Pokemon):
-        #            damage = BattleUtilities.calculate_damage(move.dynamaxed, self.opponent_pokemon, self.current_pokemon, False, False)
-        #            damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.current_pokemon, self.currently_dynamaxed)) * 100
-        #            updated_current_HP = self.current_HP - damage
-        #            # If my pokemon survives (and attacked this turn), calculate damage
-        #            if isinstance(self.action, Move) and updated_current_HP > 0:
-        #                damage = BattleUtilities.calculate_damage(self.action, self.current_pokemon, self.opponent_pokemon, True, True)
-        #                damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, True)) * 100
-        #                updated_opponent_HP = self.opponent_HP - damage_percentage
-        #        else:
-        #            # I attack first, calculate damage
-        #            damage = BattleUtilities.calculate_damage(move, self.current_pokemon, self.opponent_pokemon, True, True)
-        #            damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, self.opponent_currently_dynamaxed)) * 100
-        #            updated_opponent_HP = self.opponent_HP - damage_percentage
-        #            # If opponent survices, calculate their damage as well
-        #            if updated_opponent_HP > 0:
-        #                damage = BattleUtilities.calculate_damage(move, self.opponent_pokemon, self.current_pokemon, False, False)
-        #                damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.current_pokemon, self.opponent_currently_dynamaxed)) * 100
-        #                updated_current_HP = self.current_HP - damage_percentage
-        #        self.children.append(GameNode(self.battle, self.current_pokemon, updated_current_HP, self.opponent_pokemon, updated_opponent_HP, move, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed, self.score, self))
+        if self.battle.opponent_can_dynamax and not self.opponent_has_dynamaxed:
+            moves = [move.dynamaxed for move in self.opponent_pokemon.moves.values()]
+            for move, (updated_current_HP, updated_opponent_HP) in zip(moves, self.opponent_move_outcomes(moves, True)):
+                self.add_child(self.current_pokemon, updated_current_HP, self.opponent_pokemon, updated_opponent_HP, move, self.has_dynamaxed, self.currently_dynamaxed, True, True)
 	
     def add_opponent_switches(self):
 		# Calculate all switches opponent can make
-        for switch in self.battle.opponent_team.values():
-            if switch is not None and switch is not self.opponent_pokemon and switch.current_hp:
-                if isinstance(self.action, Move):
-                    damage = BattleUtilities.calculate_damage(self.action, self.current_pokemon, switch, True, True)
-                    damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, False)) * 100
-                    updated_opponent_HP = switch.current_hp - damage_percentage
-                self.children.append(GameNode(self.battle, self.current_pokemon, self.current_HP.copy(), switch, self.opponent_HP.copy(), switch, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, False, self.score, self, self.previous_action))
+        switches = [switch for switch in self.battle.opponent_team.values() if switch is not None and switch is not self.opponent_pokemon and switch.current_hp]
+        # The switch-in keeps its HP: the damage of my move isn't applied to it
+        for switch in switches:
+            self.add_child(self.current_pokemon, self.current_HP_values, switch, self.opponent_HP_values, switch, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, False)
     
     # If there are no moves for the opponent, add a "None" action and estimate damage from the bot's attack
     def add_opponent_default(self):        
-        updated_opponent_HP = self.opponent_HP.copy()
-        if isinstance(self.action, Move):
-            damage = BattleUtilities.calculate_damage(self.action, self.current_pokemon, self.opponent_pokemon, True, True)
-            damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, True)) * 100
-            updated_opponent_HP.update({self.opponent_pokemon : self.opponent_HP[self.opponent_pokemon] - damage_percentage})
-            self.children.append(GameNode(self.battle, self.current_pokemon, self.current_HP.copy(), self.opponent_pokemon, updated_opponent_HP, None, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed, self.score, self, self.previous_action))
+        if isinstance(self.action, MOVE_CLASSES):
+            updated_current_HP, updated_opponent_HP = self.default_outcome()
+            self.add_child(self.current_pokemon, updated_current_HP, self.opponent_pokemon, updated_opponent_HP, None, self.has_dynamaxed, self.currently_dynamaxed, self.opponent_has_dynamaxed, self.opponent_currently_dynamaxed)
 
+    def default_outcome(self):
+        damage = BattleUtilities.damage_cache.calculate_damage(self.action, self.current_pokemon, self.opponent_pokemon, True, True)
+        damage_percentage = (damage / BattleUtilities.calculate_total_HP(self.opponent_pokemon, True)) * 100
+        return self.current_HP_values, replace_HP(self.opponent_HP_values, self.opponent_slot, self.opponent_HP_values[self.opponent_slot] - damage_percentage)
@@ -0,0 +1,279 @@
+# Decision-latency and search instrumentation for the players in PlayerModels.
+# Nothing is measured until enable() is called, which wraps (and disable() restores):
+# * choose_move of every player class, and choose_move_async of the offloading players, to time
+#   each decision (nested calls for the same battle count once)
+# * GameNode.add_child (nodes generated), MinimaxPlayer.score and LeafEvaluator.evaluate (nodes scored)
+# * BattleUtilities.calculate_damage and calculate_damage_matrix (damage values calculated)
+# * TrainedRLPlayer.predict and BatchedInference.run_batch (model inference time)
+# So players that aren't being measured run their original code.
+# Each decision is recorded in the PlayerMetrics of its player (by username): latency histograms
+# for the player and for each of its recent battles, plus the counters that changed during the
+# decision. The counters are global, so decisions that overlap (several battles on the event
+# loop with thread offloading) share their counts, and work done in other processes (search
+# pools, process offloading) isn't counted.
+# MetricsExporter writes every player's metrics to a JSON file or a Prometheus text file, on demand
+# (export) or every interval seconds from a background thread (start). Per-battle histograms are
+# only in the JSON export.
+
+import functools
+import json
+import os
+import threading
+import time
+
+from bisect import bisect_left
+from collections import OrderedDict
+
+import BattleUtilities
+import GameNode
+import PlayerModels
+
+from BatchedInference import BatchedInference
+from LeafEvaluation import LeafEvaluator
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Number of recent battles per player that keep their own histogram
+MAX_BATTLES = 100
+COUNTERS = ("nodes_generated", "nodes_scored", "damage_calculations", "inference_calls", "inference_seconds")
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket, and a last one for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    # Upper bound of the bucket that contains the given quantile
+    def quantile(self, quantile):
+        if self.count == 0:
+            return 0.0
+        rank = quantile * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+            "overflow": self.counts[-1],
+        }
+
+class PlayerMetrics:
+
+    def __init__(self, name):
+        self.name = name
+        self.decisions = Histogram()
+        self.battles = OrderedDict()
+        self.totals = dict.fromkeys(COUNTERS, 0)
+
+    def record(self, battle_tag, seconds, before, after):
+        self.decisions.observe(seconds)
+        battle = self.battles.get(battle_tag)
+        if battle is None:
+            battle = self.battles[battle_tag] = Histogram()
+            if len(self.battles) > MAX_BATTLES:
+                self.battles.popitem(last=False)
+        battle.observe(seconds)
+        for name in COUNTERS:
+            self.totals[name] += after[name] - before[name]
+
+    def to_dict(self):
+        return {
+            "decisions": self.decisions.to_dict(),
+            "battles": {battle_tag: histogram.to_dict() for battle_tag, histogram in self.battles.items()},
+            **self.totals,
+        }
+
+# Totals since enable(), updated by the wrapped functions
+counters = dict.fromkeys(COUNTERS, 0)
+# PlayerMetrics by player username
+metrics = {}
+metrics_lock = threading.Lock()
+# (owner, attribute, original) of every wrapped function, for disable()
+originals = []
+# (id(player), battle tag) of the decisions being timed, so nested calls don't count twice
+measuring = set()
+
+def enabled():
+    return bool(originals)
+
+def get_metrics(player):
+    with metrics_lock:
+        if player.username not in metrics:
+            metrics[player.username] = PlayerMetrics(player.username)
+        return metrics[player.username]
+
+def reset():
+    with metrics_lock:
+        metrics.clear()
+        for name in COUNTERS:
+            counters[name] = 0
+
+def snapshot():
+    with metrics_lock:
+        return {"counters": dict(counters), "players": {name: player_metrics.to_dict() for name, player_metrics in metrics.items()}}
+
+def wrap(owner, attribute, wrapper):
+    original = owner.__dict__[attribute]
+    originals.append((owner, attribute, original))
+    setattr(owner, attribute, functools.wraps(original)(wrapper(original)))
+
+def timed_decision(original):
+    def choose_move(player, battle):
+        key = (id(player), battle.battle_tag)
+        if key in measuring:
+            return original(player, battle)
+        measuring.add(key)
+        before = dict(counters)
+        start = time.perf_counter()
+        try:
+            return original(player, battle)
+        finally:
+            seconds = time.perf_counter() - start
+            measuring.discard(key)
+            player_metrics = get_metrics(player)
+            with metrics_lock:
+                player_metrics.record(battle.battle_tag, seconds, before, counters)
+    return choose_move
+
+def timed_async_decision(original):
+    async def choose_move_async(player, battle):
+        key = (id(player), battle.battle_tag)
+        if key in measuring:
+            return await original(player, battle)
+        measuring.add(key)
+        before = dict(counters)
+        start = time.perf_counter()
+        try:
+            return await original(player, battle)
+        finally:
+            seconds = time.perf_counter() - start
+            measuring.discard(key)
+            player_metrics = get_metrics(player)
+            with metrics_lock:
+                player_metrics.record(battle.battle_tag, seconds, before, counters)
+    return choose_move_async
+
+def counted(name, amount=lambda args, result: 1):
+    def wrapper(original):
+        def counted_call(*args):
+            result = original(*args)
+            counters[name] += amount(args, result)
+            return result
+        return counted_call
+    return wrapper
+
+def timed_inference(original):
+    def inference(*args):
+        start = time.perf_counter()
+        try:
+            return original(*args)
+        finally:
+            counters["inference_calls"] += 1
+            counters["inference_seconds"] += time.perf_counter() - start
+    return inference
+
+def enable():
+    if enabled():
+        return
+    # Players that inherit choose_move (SelfBattler2 from RandomPlayer) are covered by their base class
+    for player_class in PlayerModels.PLAYER_CLASSES.values():
+        if "choose_move" in player_class.__dict__:
+            wrap(player_class, "choose_move", timed_decision)
+    wrap(PlayerModels.OffloadedDecisions, "choose_move_async", timed_async_decision)
+    wrap(PlayerModels.TrainedRLPlayer, "choose_move_async", timed_async_decision)
+    wrap(GameNode.GameNode, "add_child", counted("nodes_generated"))
+    wrap(PlayerModels.MinimaxPlayer, "score", counted("nodes_scored"))
+    wrap(LeafEvaluator, "evaluate", counted("nodes_scored", lambda args, result: len(args[1])))
+    wrap(BattleUtilities, "calculate_damage", counted("damage_calculations"))
+    wrap(BattleUtilities, "calculate_damage_matrix", counted("damage_calculations", lambda args, result: result.size))
+    wrap(PlayerModels.TrainedRLPlayer, "predict", timed_inference)
+    wrap(BatchedInference, "run_batch", timed_inference)
+
+def disable():
+    while originals:
+        owner, attribute, original = originals.pop()
+        setattr(owner, attribute, original)
+    measuring.clear()
+
+def prometheus_text(data):
+    lines = [
+        "# HELP showdown_decision_seconds Wall time of each decision",
+        "# TYPE showdown_decision_seconds histogram",
+    ]
+    for player, player_data in data["players"].items():
+        histogram = player_data["decisions"]
+        cumulative = 0
+        for bound, count in histogram["buckets"].items():
+            cumulative += count
+            lines.append(f'showdown_decision_seconds_bucket{{player="{player}",le="{bound}"}} {cumulative}')
+        lines.append(f'showdown_decision_seconds_bucket{{player="{player}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'showdown_decision_seconds_sum{{player="{player}"}} {histogram["sum"]}')
+        lines.append(f'showdown_decision_seconds_count{{player="{player}"}} {histogram["count"]}')
+    for name in COUNTERS:
+        metric = f"showdown_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for player, player_data in data["players"].items():
+            lines.append(f'{metric}{{player="{player}"}} {player_data[name]}')
+    return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+
+    # format is "json" or "prometheus"
+    def __init__(self, path, format="json", interval=60.0):
+        if format not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics format {format!r}")
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # Writes the current metrics, replacing the file at once so readers never see a partial export
+    def export(self):
+        data = snapshot()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as metrics_file:
+            if self.format == "json":
+                json.dump(data, metrics_file, indent=2)
+            else:
+                metrics_file.write(prometheus_text(data))
+        os.replace(temporary_path, self.path)
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    # Stops the background exports and writes a last one
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.export()
@@ -0,0 +1,40 @@
+# Vectorized leaf evaluation for MinimaxPlayer (batch_leaves).
+# MinimaxPlayer.score and is_terminal loop over every HP value of a node and read the current_hp
+# and max_hp properties of every Pokemon, one leaf at a time. Those properties don't change during
+# a search, so LeafEvaluator reads them once, in the slot order of the search tree, and evaluate
+# stacks the HP tuples of many nodes into two arrays and computes all their terminal flags and
+# scores in one pass. The scores are the same values as score(): the terms are summed left to right
+# (cumsum) in the order score() adds them, so even float rounding matches.
+
+import numpy as np
+
+class LeafEvaluator:
+
+    # root is the root GameNode of the search; every node of its tree shares its slot tables
+    def __init__(self, root):
+        opponents = list(root.opponent_slots)
+        team = list(root.team_slots)
+        # Opponent Pokemon whose HP isn't known don't count towards the score
+        self.opponent_known = np.array([pokemon.current_hp is not None for pokemon in opponents], dtype=bool)
+        self.opponent_current = np.array([pokemon.current_hp if pokemon.current_hp is not None else 0 for pokemon in opponents], dtype=float)
+        self.opponent_alive = self.opponent_known & (self.opponent_current > 0)
+        self.team_current = np.array([pokemon.current_hp for pokemon in team], dtype=float)
+        self.team_max = np.array([pokemon.max_hp for pokemon in team], dtype=float)
+        self.team_alive = self.team_current > 0
+        self.team_fraction = self.team_current / self.team_max
+
+    # Returns the (terminal flags, scores) of nodes as lists
+    def evaluate(self, nodes):
+        team_HP = np.array([node.current_HP_values for node in nodes], dtype=float).reshape(len(nodes), len(self.team_current))
+        # Unknown HP values (None) become NaN
+        opponent_HP = np.array([node.opponent_HP_values for node in nodes], dtype=float).reshape(len(nodes), len(self.opponent_current))
+        # Same conditions as is_terminal: all of my HP values <= 0, or all of the opponent's 0 or None
+        terminal = (team_HP <= 0).all(axis=1) | ((opponent_HP == 0) | np.isnan(opponent_HP)).all(axis=1)
+        # 300 per knocked out opponent, 3 per point of damage dealt, -100 per own faint and
+        # minus the fraction of HP lost
+        opponent_terms = np.where(self.opponent_alive & (opponent_HP <= 0), 300.0, 3 * (self.opponent_current - opponent_HP))
+        opponent_terms[:, ~self.opponent_known] = 0
+        team_terms = np.where(self.team_alive & (team_HP <= 0), -100.0, -(self.team_fraction - team_HP / self.team_max))
+        terms = np.concatenate((opponent_terms, team_terms), axis=1)
+        scores = np.cumsum(terms, axis=1)[:, -1] if terms.shape[1] else np.zeros(len(nodes))
+        return terminal.tolist(), scores.tolist()
@@ -0,0 +1,302 @@
+# Headless gen 8 singles battles for self-play and evaluation without a Showdown server.
+# The mechanics are the ones the search already models (BattleUtilities / GameNode), played out
+# with the real stats of both sides:
+# * Teams are random: six BattleSnapshot.random_pokemon with four damaging moves each, at full HP
+# * Both players choose each turn. Switches happen first, then moves by priority and speed
+#   (speed ties are random). Damage is the calculate_damage formula with both Pokemon's real
+#   stats and a random roll between 0.85 and 1; moves can miss (accuracy from the move data)
+# * Each side can dynamax once: HP is doubled for three turns and moves use their max move power
+# * Fainted Pokemon are replaced at the end of the turn. The battle ends when one side has no
+#   Pokemon left, and is a tie after max_turns
+# Not simulated: status moves and conditions, boosts, abilities, items, weather, hazards, crits.
+# Each player sees the battle through a poke_env Gen8Battle. Its own team is the simulator's
+# Pokemon, the opponent's team is a public copy (HP in percent, unknown stats, only the Pokemon
+# and moves that have been revealed), the same information as on Showdown. So the players'
+# choose_move, embed_battle and reward helpers run unchanged.
+# Players should be created with start_listening=False.
+# A side can also be external (external_sides): instead of calling its player's choose_move, the
+# decisions() generator yields the side's index and waits for its BattleOrder to be sent back.
+# This is how VectorEnv steps RL agents.
+
+import itertools
+import random
+import time
+
+from poke_env.data import GEN8_MOVES
+from poke_env.environment.battle import Gen8Battle
+from poke_env.environment.move_category import MoveCategory
+
+import TypeChart
+
+from BattleSnapshot import MoveSnapshot, PokemonSnapshot, random_pokemon
+
+MAX_TURNS = 1000
+DYNAMAX_TURNS = 3
+
+# Used when the active Pokemon has no PP left and no switch is possible
+STRUGGLE = MoveSnapshot("struggle", 50, MoveCategory.PHYSICAL, None, 1)
+
+battle_numbers = itertools.count(1)
+
+def random_team(rng, team_size=6, level_range=(72, 88)):
+    team = {}
+    while len(team) < team_size:
+        pokemon = random_pokemon(rng, level_range, True)
+        pokemon.current_hp = pokemon.max_hp
+        team.setdefault(pokemon.species, pokemon)
+    return team
+
+# HP percentage as Showdown reports it to the opponent
+def hp_percent(pokemon):
+    if pokemon.current_hp <= 0:
+        return 0
+    percent = round(pokemon.current_hp / pokemon.max_hp * 100)
+    return min(max(percent, 1), 99 if pokemon.current_hp < pokemon.max_hp else 100)
+
+# calculate_damage with the real stats of both Pokemon and a random roll
+def calculate_damage(move, attacker, defender, roll):
+    if move.category == MoveCategory.STATUS:
+        return 0
+    if move.category == MoveCategory.PHYSICAL:
+        ratio = attacker.stats["atk"] / defender.stats["def"]
+    else:
+        ratio = attacker.stats["spa"] / defender.stats["spd"]
+    damage = move.base_power * ratio * (((2 * attacker.level) / 5) + 2)
+    damage = ((damage / 50) + 2) * roll
+    if move.type is not None and (move.type == attacker.type_1 or move.type == attacker.type_2):
+        damage = damage * 1.5
+    type_multiplier = TypeChart.move_multiplier(move, defender)
+    if type_multiplier == 0:
+        return 0
+    return max(1, int(damage * type_multiplier))
+
+class Side:
+
+    def __init__(self, index, player, team, battle):
+        self.index = index
+        self.player = player
+        self.team = team
+        self.battle = battle
+        self.active = None
+        # Public copies of this side's revealed Pokemon, as the opponent sees them
+        self.public = {}
+        self.has_dynamaxed = False
+        self.dynamax_turns = 0
+
+    def alive(self):
+        return [pokemon for pokemon in self.team.values() if not pokemon.fainted]
+
+class LocalBattle:
+
+    def __init__(self, player_1, player_2, team_1, team_2, rng, max_turns=MAX_TURNS, external_sides=()):
+        self.battle_tag = f"local-battle-{next(battle_numbers)}"
+        self.rng = rng
+        self.max_turns = max_turns
+        self.external_sides = external_sides
+        self.turn = 0
+        self.finished = False
+        # Index of the winning side, None for a tie (or while the battle isn't over)
+        self.winner = None
+        self.sides = (Side(0, player_1, team_1, self.new_view(player_1)), Side(1, player_2, team_2, self.new_view(player_2)))
+        for side in self.sides:
+            side.battle._team = side.team
+            self.switch_in(side, next(iter(side.team.values())))
+
+    def new_view(self, player):
+        battle = Gen8Battle(self.battle_tag, player.username, player.logger)
+        player._battles[self.battle_tag] = battle
+        return battle
+
+    # Plays the whole battle. External sides get the default move
+    def play(self):
+        for _ in self.decisions():
+            pass
+        return self
+
+    # Plays the battle as a generator that yields the index of an external side whenever it has to
+    # choose, and expects its BattleOrder to be sent back
+    def decisions(self):
+        while not self.finished:
+            yield from self.play_turn()
+
+    def play_turn(self):
+        self.turn += 1
+        orders = []
+        for side in self.sides:
+            order = yield from self.request_order(side, False)
+            orders.append(order)
+        for side, (kind, target, dynamax) in zip(self.sides, orders):
+            if kind == "switch":
+                self.switch_in(side, target)
+        for side, (kind, target, dynamax) in zip(self.sides, orders):
+            if kind == "move" and dynamax and not side.has_dynamaxed:
+                self.start_dynamax(side)
+        # Moves by priority, then speed, with speed ties broken at random
+        moves = [(side, opponent, target) for (side, opponent), (kind, target, _) in zip(zip(self.sides, self.sides[::-1]), orders) if kind == "move"]
+        moves.sort(key=lambda entry: (GEN8_MOVES.get(entry[2].id, {}).get("priority", 0), entry[0].active.stats["spe"], self.rng.random()), reverse=True)
+        for side, opponent, move in moves:
+            if not side.active.fainted and not opponent.active.fainted:
+                self.use_move(side, opponent, move)
+        for side in self.sides:
+            if side.dynamax_turns:
+                side.dynamax_turns -= 1
+                if side.dynamax_turns == 0:
+                    self.end_dynamax(side)
+        if self.check_finished():
+            return
+        for side in self.sides:
+            if side.active.fainted:
+                kind, target, _ = yield from self.request_order(side, True)
+                self.switch_in(side, target)
+        self.update_views()
+
+    # Asks a side's player for its order and returns ("switch", pokemon, False) or ("move", move, dynamax).
+    # Orders that aren't possible are replaced by the first available move, or the first switch
+    def request_order(self, side, force_switch):
+        self.update_views(force_switch_side=side if force_switch else None)
+        battle = side.battle
+        if side.index in self.external_sides:
+            order = yield side.index
+        else:
+            order = side.player.choose_move(battle)
+        target = getattr(order, "order", None)
+        if target is not None and target in battle.available_switches:
+            return "switch", target, False
+        for move in battle.available_moves:
+            if target is move or target is move.dynamaxed:
+                return "move", move, battle.can_dynamax and (order.dynamax or target is move.dynamaxed)
+        if battle.available_moves:
+            return "move", battle.available_moves[0], False
+        if battle.available_switches:
+            return "switch", battle.available_switches[0], False
+        return "move", STRUGGLE, False
+
+    def switch_in(self, side, pokemon):
+        if side.active is not None:
+            if side.active.is_dynamaxed:
+                self.end_dynamax(side)
+            side.active.active = False
+            side.public[side.active].active = False
+        side.active = pokemon
+        pokemon.active = True
+        if pokemon not in side.public:
+            side.public[pokemon] = PokemonSnapshot(
+                pokemon.species,
+                pokemon.level,
+                pokemon.base_stats,
+                {"atk": None, "def": None, "spa": None, "spd": None, "spe": None},
+                pokemon.type_1,
+                pokemon.type_2,
+                hp_percent(pokemon),
+                100,
+                {},
+                pokemon.boosts,
+                False,
+                False,
+            )
+        side.public[pokemon].active = True
+
+    def start_dynamax(self, side):
+        pokemon = side.active
+        side.has_dynamaxed = True
+        side.dynamax_turns = DYNAMAX_TURNS
+        pokemon.is_dynamaxed = True
+        side.public[pokemon].is_dynamaxed = True
+        pokemon.current_hp *= 2
+        pokemon.max_hp *= 2
+
+    def end_dynamax(self, side):
+        pokemon = side.active
+        side.dynamax_turns = 0
+        pokemon.is_dynamaxed = False
+        side.public[pokemon].is_dynamaxed = False
+        pokemon.max_hp //= 2
+        if pokemon.current_hp > 0:
+            pokemon.current_hp = max(1, round(pokemon.current_hp / 2))
+
+    def use_move(self, side, opponent, move):
+        attacker = side.active
+        defender = opponent.active
+        if move is not STRUGGLE:
+            move.current_pp -= 1
+            side.public[attacker].moves[move.id] = move
+        used = move
+        accuracy = GEN8_MOVES.get(move.id, {}).get("accuracy", True)
+        # Max moves don't miss
+        if attacker.is_dynamaxed and move.dynamaxed is not None:
+            used = move.dynamaxed
+        elif accuracy is not True and self.rng.random() * 100 >= accuracy:
+            return
+        damage = calculate_damage(used, attacker, defender, self.rng.uniform(0.85, 1))
+        defender.current_hp = max(0, defender.current_hp - damage)
+        opponent.public[defender].current_hp = hp_percent(defender)
+
+    def check_finished(self):
+        alive = [bool(side.alive()) for side in self.sides]
+        if all(alive) and self.turn < self.max_turns:
+            return False
+        self.finished = True
+        if alive[0] != alive[1]:
+            self.winner = 0 if alive[0] else 1
+        self.update_views()
+        self.close()
+        return True
+
+    # Drops the finished battle's views from both players, so they don't collect every battle played
+    def close(self):
+        for side in self.sides:
+            side.player._battles.pop(self.battle_tag, None)
+
+    # Refreshes what each player's Gen8Battle shows. force_switch_side is a side that has to replace
+    # a fainted Pokemon, so it can only switch
+    def update_views(self, force_switch_side=None):
+        for index, (side, opponent) in enumerate(zip(self.sides, self.sides[::-1])):
+            battle = side.battle
+            force_switch = side is force_switch_side
+            active = side.active
+            battle._opponent_team = {pokemon.species : public for pokemon, public in opponent.public.items()}
+            if force_switch or active.fainted or self.finished:
+                battle._available_moves = []
+            else:
+                battle._available_moves = [move for move in active.moves.values() if move.current_pp > 0]
+            battle._available_switches = [] if self.finished else [pokemon for pokemon in side.team.values() if pokemon is not active and not pokemon.fainted]
+            battle._can_dynamax = not side.has_dynamaxed and not force_switch and not self.finished
+            battle._opponent_can_dynamax = not opponent.has_dynamaxed
+            battle._force_switch = force_switch
+            battle._turn = self.turn
+            if self.finished:
+                battle._finished = True
+                battle._won = None if self.winner is None else self.winner == index
+
+def new_battle(player_1, player_2, seed=None, team_size=6, level_range=(72, 88), max_turns=MAX_TURNS, external_sides=()):
+    rng = random.Random(seed)
+    team_1 = random_team(rng, team_size, level_range)
+    team_2 = random_team(rng, team_size, level_range)
+    return LocalBattle(player_1, player_2, team_1, team_2, rng, max_turns, external_sides)
+
+def play_battle(player_1, player_2, seed=None, team_size=6, level_range=(72, 88), max_turns=MAX_TURNS):
+    return new_battle(player_1, player_2, seed, team_size, level_range, max_turns).play()
+
+# Plays n_battles between two players (seeds seed, seed + 1, ...) and returns the results from player_1's side
+def play_battles(player_1, player_2, n_battles, seed=0, team_size=6, level_range=(72, 88), max_turns=MAX_TURNS):
+    wins = losses = ties = turns = 0
+    start = time.perf_counter()
+    for battle_seed in range(seed, seed + n_battles):
+        battle = play_battle(player_1, player_2, battle_seed, team_size, level_range, max_turns)
+        turns += battle.turn
+        if battle.winner == 0:
+            wins += 1
+        elif battle.winner == 1:
+            losses += 1
+        else:
+            ties += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "battles": n_battles,
+        "wins": wins,
+        "losses": losses,
+        "ties": ties,
+        "mean_turns": turns / n_battles if n_battles else 0.0,
+        "seconds": elapsed,
+        "battles_per_minute": n_battles / elapsed * 60 if elapsed else 0.0,
+    }
@@ -0,0 +1,75 @@
+# Pool of GameNodes for the searches of one battle (MinimaxPlayer.use_node_arena).
+# Without it every decision builds a new tree of objects with parent <-> children cycles, which
+# stay in memory until the garbage collector finds them. With it, nodes come from the pool (or are
+# created when it is empty) and every node of a decision goes back to the pool when the battle's
+# next decision starts, except the subtree kept for reuse_tree. So a battle holds about one
+# decision's worth of nodes, and a decision's nodes stay valid until the next one starts.
+# node_cap is the most nodes a decision may have at once (see full).
+
+import sys
+
+from GameNode import GameNode
+
+# Estimated size of a node in bytes: the object, its child list and its entry in the parent's
+# child list. HP tuples are shared copy-on-write between nodes, so they aren't counted
+NODE_BYTES = sys.getsizeof(GameNode.__new__(GameNode)) + sys.getsizeof([]) + 8
+
+class NodeArena:
+
+    def __init__(self, node_cap=None):
+        self.node_cap = node_cap
+        # Nodes handed out since the last reset, in the order they were allocated
+        self.nodes = []
+        # Nodes given back, reused before new ones are created
+        self.free = []
+        # Most nodes in use at once before the last rewind
+        self.peak = 0
+
+    # A node with an empty child list; every other slot is set by the caller
+    def allocate(self):
+        if self.free:
+            node = self.free.pop()
+        else:
+            node = GameNode.__new__(GameNode)
+            node.children = []
+        self.nodes.append(node)
+        return node
+
+    def full(self):
+        return self.node_cap is not None and len(self.nodes) >= self.node_cap
+
+    # Position to rewind to, for nodes that are only needed for a moment (MCTS rollouts)
+    def mark(self):
+        return len(self.nodes)
+
+    # Gives back every node allocated since mark
+    def rewind(self, mark):
+        self.peak = max(self.peak, len(self.nodes))
+        self.release(self.nodes[mark:])
+        del self.nodes[mark:]
+
+    def release(self, nodes):
+        for node in nodes:
+            node.children.clear()
+        self.free.extend(nodes)
+
+    # Starts a new decision: gives back every node except keep and the nodes below it
+    def reset(self, keep=None):
+        kept = []
+        if keep is not None:
+            stack = [keep]
+            while stack:
+                node = stack.pop()
+                kept.append(node)
+                stack.extend(node.children)
+        kept_ids = set(map(id, kept))
+        self.release([node for node in self.nodes if id(node) not in kept_ids])
+        self.nodes = kept
+        self.peak = 0
+
+    # Most nodes in use at once since the last reset, and their estimated size
+    def peak_nodes(self):
+        return max(self.peak, len(self.nodes))
+
+    def peak_bytes(self):
+        return self.peak_nodes() * NODE_BYTES
@@ -0,0 +1,105 @@
+# NumPy version of the trained DQN models, so TrainedRLPlayer can run without TensorFlow.
+# export_model (run once, wherever TensorFlow is installed) copies the weights and activations of
+# the Dense layers of a saved Keras model into a .npz file, and NumpyModel runs the same forward
+# pass from that file. Dropout does nothing at inference time, so a model is its Dense layers
+# applied in order, with the window axis flattened at the position of the Flatten layer.
+# NumpyModel has the predict, predict_on_batch and summary methods that the players use, and
+# get_weights / set_weights in the order of Keras' get_weights, so the weights of a Keras model
+# in training can be copied into it (NumpyModel.from_weights, as the actor-learner actors do).
+# Export from the command line with: python NumpyModel.py model_10000 model_10000.npz
+
+import sys
+
+import numpy as np
+
+ACTIVATIONS = {
+    "linear": None,
+    "relu": lambda values: np.maximum(values, 0, out=values),
+}
+
+class NumpyModel:
+
+    def __init__(self, path):
+        arrays = np.load(path)
+        self.activations = [str(activation) for activation in arrays["activations"]]
+        for activation in self.activations:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation {activation!r} in {path}")
+        self.kernels = [arrays[f"kernel_{layer}"].astype(np.float32) for layer in range(len(self.activations))]
+        self.biases = [arrays[f"bias_{layer}"].astype(np.float32) for layer in range(len(self.activations))]
+        # Number of Dense layers before the Flatten layer (all of them if there is none)
+        self.flatten_after = int(arrays["flatten_after"])
+
+    # A model with the given Dense layer weights ([kernel, bias, kernel, bias, ...]), activations
+    # and Flatten position
+    @classmethod
+    def from_weights(cls, weights, activations, flatten_after):
+        model = cls.__new__(cls)
+        model.activations = list(activations)
+        model.flatten_after = flatten_after
+        model.set_weights(weights)
+        return model
+
+    def get_weights(self):
+        return [array for kernel, bias in zip(self.kernels, self.biases) for array in (kernel, bias)]
+
+    def set_weights(self, weights):
+        self.kernels = [np.asarray(kernel, dtype=np.float32) for kernel in weights[0::2]]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in weights[1::2]]
+
+    # inputs has shape (batch, window, embedding size), like the Keras models take
+    def predict(self, inputs):
+        values = np.asarray(inputs, dtype=np.float32)
+        for layer, (kernel, bias, activation) in enumerate(zip(self.kernels, self.biases, self.activations)):
+            if layer == self.flatten_after:
+                values = values.reshape(len(values), -1)
+            values = values @ kernel + bias
+            if ACTIVATIONS[activation] is not None:
+                ACTIVATIONS[activation](values)
+        return values
+
+    predict_on_batch = predict
+
+    def summary(self):
+        print("NumpyModel")
+        for layer, (kernel, activation) in enumerate(zip(self.kernels, self.activations)):
+            if layer == self.flatten_after:
+                print("  flatten")
+            print(f"  dense {kernel.shape[0]} -> {kernel.shape[1]} ({activation})")
+        print(f"  parameters: {sum(kernel.size + bias.size for kernel, bias in zip(self.kernels, self.biases))}")
+
+# Activations of the Dense layers of a Keras model (or NumpyModel), and the number of them before
+# the Flatten layer
+def model_architecture(model):
+    if isinstance(model, NumpyModel):
+        return list(model.activations), model.flatten_after
+    activations = []
+    flatten_after = None
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == "Dense":
+            activations.append(layer.get_config()["activation"])
+        elif kind == "Flatten":
+            flatten_after = len(activations)
+        elif kind != "Dropout":
+            raise ValueError(f"Can't export {kind} layer {layer.name}")
+    if flatten_after is None:
+        flatten_after = len(activations)
+    return activations, flatten_after
+
+# Writes the Dense layer weights of a saved Keras model to a .npz file that NumpyModel can load
+def export_model(model_path, output_path):
+    # Only the export needs TensorFlow
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    activations, flatten_after = model_architecture(model)
+    arrays = {}
+    for index, layer in enumerate(layer for layer in model.layers if type(layer).__name__ == "Dense"):
+        weights = layer.get_weights()
+        arrays[f"kernel_{index}"] = weights[0]
+        arrays[f"bias_{index}"] = weights[1] if len(weights) > 1 else np.zeros(weights[0].shape[1], dtype=np.float32)
+    np.savez(output_path, activations=np.array(activations), flatten_after=flatten_after, **arrays)
+
+if __name__ == "__main__":
+    export_model(sys.argv[1], sys.argv[2])
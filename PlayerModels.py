@@ -1,12 +1,27 @@
+import asyncio
+import math
 import numpy as np
+import os
+import random
+import threading
+import time
 import BattleUtilities
 import GameNode
+import SpeciesMatchups
+import TypeChart
 
 from poke_env.player.env_player import Gen8EnvSinglePlayer
 from poke_env.player.random_player import RandomPlayer
 from poke_env.player.player import Player
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
-from GameNode import GameNode
+from BattleSnapshot import BattleSnapshot, MOVE_CLASSES, POKEMON_CLASSES
+from GameNode import GameNode, HP_distance, tree_signature
+from LeafEvaluation import LeafEvaluator
+from NodeArena import NodeArena
+from BatchedInference import get_batched_inference
+from NumpyModel import NumpyModel
+from TranspositionTable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
 
 class SelfBattler2(RandomPlayer):
     def embed_battle(self, battle):
@@ -19,10 +34,7 @@ class SelfBattler2(RandomPlayer):
                 move.base_power / 100
             )  # Simple rescaling to facilitate learning
             if move.type:
-                moves_dmg_multiplier[i] = move.type.damage_multiplier(
-                    battle.opponent_active_pokemon.type_1,
-                    battle.opponent_active_pokemon.type_2,
-                )
+                moves_dmg_multiplier[i] = TypeChart.move_multiplier(move, battle.opponent_active_pokemon)
 
         # We count how many pokemons have not fainted in each team
         remaining_mon_team = (
@@ -58,12 +70,335 @@ class MaxDamagePlayer(RandomPlayer):
         else:
             return self.choose_random_move(battle)
 
-class MinimaxPlayer(Player): 
+# Raised inside the search when MinimaxPlayer runs past its per-decision deadline
+class SearchTimeout(Exception):
+    pass
+
+# Fraction of an offloaded decision's deadline that a search may use; the rest is left
+# for handing the result back to the event loop and sending the order
+DEADLINE_SAFETY_MARGIN = 0.8
+
+# Mixin for players with a slow choose_move. poke_env calls choose_move on its asyncio event loop,
+# so a long search there stalls the websockets of every other battle. With an executor configured,
+# the decision runs in a thread or worker process instead, and if it isn't back within
+# decision_timeout seconds a cheap heuristic move is sent so the turn timer never runs out.
+# * "thread": decisions run on one shared background thread (the search is pure Python, so more
+#   threads wouldn't help under the GIL, and players never search at the same time)
+# * "process": decisions run in a process pool. The player has to implement decision_task and
+#   decision_result, since the live battle and player can't be sent to another process
+# * an Executor instance is used as it is. Players that keep the state of the current search on
+#   themselves (concurrent_decisions = False) only accept one with a single worker, since two
+#   decisions running at once would overwrite each other's state
+# A decision that misses its deadline keeps running in the background. Every offloaded decision gets
+# a token, and the fallback invalidates it, so the late result can't change the player's state
+# (decision_is_current, under decision_lock) after the fallback order has been recorded (record_order).
+class OffloadedDecisions:
+
+    decision_executor = None
+    decision_timeout = None
+    supports_process_decisions = False
+    concurrent_decisions = True
+    # Decision counters, for checking how often the fallback is needed
+    offloaded_decisions = 0
+    decision_timeouts = 0
+
+    def setup_offloading(self, executor=None, decision_timeout=None, decision_workers=None):
+        self.decision_timeout = decision_timeout
+        # Maps battle tag -> token of the battle's latest offloaded decision
+        self.decision_tokens = {}
+        self.decision_lock = threading.Lock()
+        self.decision_in_process = executor == "process"
+        if executor is None:
+            self.decision_executor = None
+        elif executor == "thread":
+            self.decision_executor = get_decision_thread()
+        elif executor == "process":
+            if not self.supports_process_decisions:
+                raise ValueError(f"{type(self).__name__} can't make decisions in another process")
+            self.decision_executor = get_search_pool(decision_workers or os.cpu_count())
+        elif isinstance(executor, Executor):
+            # ThreadPoolExecutor and ProcessPoolExecutor; other executors can't be checked
+            if not self.concurrent_decisions and getattr(executor, "_max_workers", None) != 1:
+                raise ValueError(f"{type(self).__name__} keeps its search state on the player, so it needs an executor with a single worker")
+            self.decision_executor = executor
+        else:
+            raise ValueError(f"Unknown executor {executor!r}, expected 'thread', 'process' or an Executor")
+
+    # Same as Player._handle_battle_request, except that choose_move runs in the executor
+    async def _handle_battle_request(self, battle, from_teampreview_request=False, maybe_default_order=False):
+        if maybe_default_order and random.random() < self.DEFAULT_CHOICE_CHANCE:
+            message = self.choose_default_move(battle).message
+        elif battle.teampreview:
+            if not from_teampreview_request:
+                return
+            message = self.teampreview(battle)
+        else:
+            message = (await self.choose_move_async(battle)).message
+        await self._send_message(message, battle.battle_tag)
+
+    async def choose_move_async(self, battle):
+        if self.decision_executor is None:
+            return self.choose_move(battle)
+        return await self.choose_move_offloaded(battle)
+
+    async def choose_move_offloaded(self, battle):
+        self.offloaded_decisions += 1
+        token = self.decision_tokens.get(battle.battle_tag, 0) + 1
+        self.decision_tokens[battle.battle_tag] = token
+        loop = asyncio.get_event_loop()
+        deadline = None
+        if self.decision_timeout is not None:
+            deadline = time.time() + self.decision_timeout
+        if self.decision_in_process:
+            task, args = self.decision_task(battle, deadline)
+            future = loop.run_in_executor(self.decision_executor, task, *args)
+        else:
+            future = loop.run_in_executor(self.decision_executor, self.choose_move_before, battle, deadline, token)
+        try:
+            result = await asyncio.wait_for(future, self.decision_timeout)
+        except asyncio.TimeoutError:
+            self.decision_timeouts += 1
+            with self.decision_lock:
+                self.decision_tokens[battle.battle_tag] = token + 1
+                order = self.choose_fallback_move(battle)
+                self.record_order(battle, order)
+            return order
+        if self.decision_in_process:
+            return self.decision_result(battle, result)
+        return result
+
+    # Makes the decision for a battle. deadline is the time.time() by which the order is needed,
+    # or None. Players that can bound their own work override this to use it. token identifies an
+    # offloaded decision (None when it isn't offloaded)
+    def choose_move_before(self, battle, deadline, token=None):
+        return self.choose_move(battle)
+
+    # Whether the decision with this token is still the battle's latest one, so its result will be
+    # sent. Players check it (holding decision_lock) before they store anything about their decision
+    def decision_is_current(self, battle, token):
+        return token is None or self.decision_tokens.get(battle.battle_tag) == token
+
+    # Called with the fallback order that replaced a late decision. Players that remember their
+    # last action override this
+    def record_order(self, battle, order):
+        pass
+
+    # Cheap decision used when the real one misses its deadline: the SmartDamagePlayer heuristic
+    # (the move with the best estimated damage, otherwise the switch with the best matchup).
+    # It doesn't use the damage cache, which the decision thread may be using at the same time
+    def choose_fallback_move(self, battle):
+        if battle.available_moves:
+            best_move = max(battle.available_moves, key=lambda move: BattleUtilities.calculate_damage(move, battle.active_pokemon, battle.opponent_active_pokemon, True, True))
+            return self.create_order(best_move)
+        if battle.available_switches:
+            best_switch = min(battle.available_switches, key=lambda switch: BattleUtilities.get_matchup_score(switch, battle.opponent_active_pokemon))
+            return self.create_order(best_switch)
+        return self.choose_default_move(battle)
+
+class MinimaxPlayer(OffloadedDecisions, Player): 
 
     previous_action = None
     maxDepth = 1 
+    # Search with alpha-beta pruning and move ordering instead of plain minimax
+    use_alpha_beta = False
+    # Per-decision wall-clock budget in seconds. When set, choose_move deepens one ply at a
+    # time (up to max_iterative_depth) and uses the deepest search that finished in time
+    time_budget = None
+    max_iterative_depth = 5
+    # Depth the current search stops at, and the deadline it has to finish by (if any)
+    depth_limit = 1
+    deadline = None
+    # Best action of the previous iteration, searched first by alpha_beta
+    iteration_best = None
+    # Keep a transposition table per battle (across its turns) so states reached through
+    # different move orders are only searched once
+    use_transposition_table = False
+    # Table of the battle currently being searched
+    transposition_table = None
+    # Number of processes that search the root's children in parallel (1 searches in this process)
+    workers = 1
+    # Score the leaves below each bot node of the last ply together (LeafEvaluator) instead of one by one
+    batch_leaves = False
+    # Evaluator for the root currently being searched, if batch_leaves
+    leaf_evaluator = None
+    # Keep the subtree of the chosen action after each decision, and on the next turn search on from
+    # the opponent reply the battle reached instead of generating the whole tree again
+    reuse_tree = False
+    # Root of the current decision, shared by the searches of iterative deepening when reuse_tree
+    search_tree = None
+    # Also search the turns where either side dynamaxes (Max Moves for both Pokemon)
+    dynamax_branches = False
+    # Selective expansion: the number of children kept at each ply (GameNode.prune_children), from
+    # my actions at the root (ply 0) and the opponent's replies (ply 1) on. Plies past the end use
+    # the last width, and None keeps every child
+    beam_widths = None
+    # Allocate search nodes from a NodeArena per battle, which recycles them between decisions
+    use_node_arena = False
+    # Most nodes a decision may allocate (needs the arena; setting it turns the arena on). Once the
+    # arena is full, nodes aren't expanded any more (see out_of_nodes). The cap only covers this
+    # process: the workers of parallel_search_root don't have one
+    node_cap = None
+    # Arena of the battle currently being searched
+    node_arena = None
+    # Search counters for the last decision, so the search modes can be compared
+    nodes_visited = 0
+    cutoffs = 0
+    completed_depth = 0
+    # Most nodes the last decision had at once, and their estimated size in bytes (with the arena)
+    peak_nodes = 0
+    peak_bytes = 0
+
+    supports_process_decisions = True
+    # depth_limit, deadline, transposition_table, search_tree, leaf_evaluator and node_arena belong
+    # to the search in progress
+    concurrent_decisions = False
+
+    def __init__(self, *args, use_alpha_beta=False, time_budget=None, max_iterative_depth=5, use_transposition_table=False, workers=1, batch_leaves=False, reuse_tree=False, dynamax_branches=False, beam_widths=None, use_node_arena=False, node_cap=None, executor=None, decision_timeout=None, decision_workers=None, **kwargs):
+        Player.__init__(self, *args, **kwargs)
+        self.use_alpha_beta = use_alpha_beta
+        self.time_budget = time_budget
+        self.max_iterative_depth = max_iterative_depth
+        self.use_transposition_table = use_transposition_table
+        self.workers = workers
+        self.batch_leaves = batch_leaves
+        self.reuse_tree = reuse_tree
+        self.dynamax_branches = dynamax_branches
+        self.beam_widths = beam_widths
+        self.use_node_arena = use_node_arena or node_cap is not None
+        self.node_cap = node_cap
+        # Maps battle tag -> (battle, TranspositionTable)
+        self.transposition_tables = {}
+        # Maps battle tag -> (battle, turn, node of the chosen action, tree_signature)
+        self.kept_trees = {}
+        # Maps battle tag -> (battle, NodeArena)
+        self.node_arenas = {}
+        self.setup_offloading(executor, decision_timeout, decision_workers)
+
+    # A MinimaxPlayer that is only used to run searches (in pool workers and benchmarks).
+    # It skips Player.__init__, so it has no server connection and can't play battles itself
+    @classmethod
+    def searcher(cls, maxDepth=1, use_alpha_beta=False, use_transposition_table=False, time_budget=None, max_iterative_depth=5, batch_leaves=False, dynamax_branches=False, beam_widths=None, use_node_arena=False, node_cap=None):
+        searcher = cls.__new__(cls)
+        searcher.maxDepth = maxDepth
+        searcher.use_alpha_beta = use_alpha_beta
+        searcher.use_transposition_table = use_transposition_table
+        searcher.time_budget = time_budget
+        searcher.max_iterative_depth = max_iterative_depth
+        searcher.batch_leaves = batch_leaves
+        searcher.dynamax_branches = dynamax_branches
+        searcher.beam_widths = beam_widths
+        searcher.use_node_arena = use_node_arena or node_cap is not None
+        searcher.node_cap = node_cap
+        searcher.transposition_tables = {}
+        searcher.kept_trees = {}
+        searcher.node_arenas = {}
+        return searcher
+
     # The nodes keep track of battle states, moves are transitions between states
     def choose_move(self, battle):
+        return self.choose_move_before(battle, None)
+
+    def choose_move_before(self, battle, deadline, token=None):
+        best_node = self.choose_node(battle, deadline)
+        with self.decision_lock:
+            # A late offloaded decision was replaced by the fallback order, which set previous_action
+            if not self.decision_is_current(battle, token):
+                return self.choose_default_move(battle)
+            self.previous_action = best_node.action if best_node is not None else None
+            if self.reuse_tree and best_node is not None:
+                self.keep_tree(battle, best_node)
+        if best_node == None: 
+            #print(f"Best node is none for some reason!")
+            return self.choose_default_move(battle)
+        #if isinstance(best_node.action, Pokemon): 
+            #print(f"Switching from {battle.active_pokemon} (type matchup score {BattleUtilities.get_defensive_type_multiplier(battle.active_pokemon, battle.opponent_active_pokemon)}) to {best_node.action} (type matchup score {BattleUtilities.get_defensive_type_multiplier(best_node.action, battle.opponent_active_pokemon)}) against {battle.opponent_active_pokemon}")
+        #else:
+        #    print(f"Pokemon {battle.active_pokemon} attacking with {best_node.action} against {battle.opponent_active_pokemon}")
+        return self.action_order(battle, best_node.action)
+
+    # The fallback is a move or switch without dynamax, which is its own action
+    def record_order(self, battle, order):
+        self.previous_action = getattr(order, "order", None)
+
+    # Runs the configured search and returns the chosen child of the root (or None).
+    # With a deadline (a time.time() value), the search deepens one ply at a time up to
+    # maxDepth, or max_iterative_depth if there is a time budget, and stops in time for it
+    def choose_node(self, battle, deadline=None):
+        BattleUtilities.damage_cache.sync(battle)
+        self.nodes_visited = 0
+        self.cutoffs = 0
+        if self.use_transposition_table:
+            self.transposition_table = self.get_transposition_table(battle)
+        if self.use_node_arena:
+            self.node_arena = self.get_node_arena(battle)
+        if self.reuse_tree:
+            self.search_tree = self.kept_root(battle)
+        if self.node_arena is not None:
+            # The last decision's nodes are recycled, except the tree that this one reuses
+            self.node_arena.reset(self.search_tree)
+        time_budget = self.time_budget
+        max_depth = self.max_iterative_depth
+        if deadline is not None:
+            deadline_budget = max(0, deadline - time.time()) * DEADLINE_SAFETY_MARGIN
+            if time_budget is None:
+                time_budget = deadline_budget
+                max_depth = self.maxDepth
+            else:
+                time_budget = min(time_budget, deadline_budget)
+        try:
+            if time_budget is None:
+                best_node = self.search_root(battle, self.maxDepth)
+                self.completed_depth = self.maxDepth
+            else:
+                best_node = self.iterative_deepening(battle, time_budget, max_depth)
+        finally:
+            self.search_tree = None
+            self.record_node_usage()
+        return best_node
+
+    # For decisions in a process pool: the search runs on a snapshot of the battle and sends back
+    # the index of the chosen root child. Transposition tables stay in this process, so workers don't use one
+    def decision_task(self, battle, deadline):
+        settings = {
+            "maxDepth": self.maxDepth,
+            "use_alpha_beta": self.use_alpha_beta,
+            "time_budget": self.time_budget,
+            "max_iterative_depth": self.max_iterative_depth,
+            "batch_leaves": self.batch_leaves,
+            "dynamax_branches": self.dynamax_branches,
+            "beam_widths": self.beam_widths,
+            "use_node_arena": self.use_node_arena,
+            "node_cap": self.node_cap,
+        }
+        return choose_root_child, (BattleSnapshot.from_battle(battle, self.previous_action), settings, deadline)
+
+    def decision_result(self, battle, child_index):
+        if child_index is None:
+            self.previous_action = None
+            return self.choose_default_move(battle)
+        children = self.root_children(self.build_root(battle))
+        self.previous_action = children[child_index].action
+        return self.action_order(battle, self.previous_action)
+
+    # Builds a fresh tree for the battle, searches it to the given depth and returns the best child of the root
+    def search_root(self, battle, depth):
+        if self.workers > 1:
+            return self.parallel_search_root(battle, depth)
+        self.depth_limit = depth
+        starting_node = self.search_tree if self.search_tree is not None else self.build_root(battle)
+        if self.reuse_tree:
+            self.search_tree = starting_node
+        self.leaf_evaluator = LeafEvaluator(starting_node) if self.batch_leaves else None
+        if battle.active_pokemon.current_hp <= 0: 
+        #    print(f"Pokemon {battle.active_pokemon} fainted")
+            self.pick_best_switch(starting_node, 0)
+        elif self.use_alpha_beta: 
+            self.alpha_beta(starting_node, 0, True, float('-inf'), float('inf'))
+        else: 
+            self.minimax(starting_node, 0, True)
+        return self.best_child(starting_node)
+
+    def build_root(self, battle):
         # HP values for you and your opponent's Pokemon are a dictionary that maps Pokemon to HP
         current_hp = {}
         for pokemon in battle.team.values():
@@ -71,12 +406,35 @@ class MinimaxPlayer(Player):
         opponent_hp = {}
         for pokemon in battle.opponent_team.values():
             opponent_hp.update({pokemon : pokemon.current_hp})
-        starting_node = GameNode(battle, battle.active_pokemon, current_hp, battle.opponent_active_pokemon, opponent_hp, None, not battle.can_dynamax, battle.active_pokemon.is_dynamaxed, not battle.opponent_can_dynamax, battle.opponent_active_pokemon.is_dynamaxed, float('-inf'), None, self.previous_action)
-        if battle.active_pokemon.current_hp <= 0: 
-        #    print(f"Pokemon {battle.active_pokemon} fainted")
-            self.pick_best_switch(starting_node, 0)
-        else: 
-            self.minimax(starting_node, 0, True)
+        return GameNode(battle, battle.active_pokemon, current_hp, battle.opponent_active_pokemon, opponent_hp, None, not battle.can_dynamax, battle.active_pokemon.is_dynamaxed, not battle.opponent_can_dynamax, battle.opponent_active_pokemon.is_dynamaxed, float('-inf'), None, self.previous_action, self.transposition_table is not None, self.node_arena)
+
+    # The root's children, in the order the search generates them
+    def root_children(self, starting_node):
+        if starting_node.battle.active_pokemon.current_hp <= 0: 
+            return starting_node.add_bot_switches()
+        return self.bot_children(starting_node, 0)
+
+    # A chosen Max Move is sent as its move with dynamax
+    def action_order(self, battle, action):
+        for move in battle.available_moves:
+            if action is move.dynamaxed:
+                return self.create_order(move, dynamax=True)
+        return self.create_order(action)
+
+    # Children of a node with the player's dynamax and selective expansion settings. My actions at
+    # depth d are ply 2d, the opponent's replies ply 2d + 1
+    def bot_children(self, node, depth):
+        return node.expand_bot_moves(self.beam_width(2 * depth), self.dynamax_branches)
+
+    def opponent_children(self, node, depth):
+        return node.expand_opponent_moves(self.beam_width(2 * depth + 1), self.dynamax_branches)
+
+    def beam_width(self, ply):
+        if self.beam_widths is None:
+            return None
+        return self.beam_widths[min(ply, len(self.beam_widths) - 1)]
+
+    def best_child(self, starting_node):
         child_nodes = starting_node.children
         best_score = float('-inf')
         best_node = None
@@ -84,38 +442,202 @@ class MinimaxPlayer(Player):
             if child.score >= best_score: 
                 best_score = child.score
                 best_node = child
-        if best_node == None: 
-            #print(f"Best node is none for some reason! Length of child_nodes is {len(child_nodes)}")
-            self.previous_action = None
-            return self.choose_default_move(battle)
-        #if isinstance(best_node.action, Pokemon): 
-            #print(f"Switching from {battle.active_pokemon} (type matchup score {BattleUtilities.get_defensive_type_multiplier(battle.active_pokemon, battle.opponent_active_pokemon)}) to {best_node.action} (type matchup score {BattleUtilities.get_defensive_type_multiplier(best_node.action, battle.opponent_active_pokemon)}) against {battle.opponent_active_pokemon}")
-        #else:
-        #    print(f"Pokemon {battle.active_pokemon} attacking with {best_node.action} against {battle.opponent_active_pokemon}")
-        self.previous_action = best_node.action
-        return self.create_order(best_node.action)
+        return best_node
+
+    # Same result as search_root, but every child of the root is searched in a worker process.
+    # Workers get a BattleSnapshot of the battle, rebuild the same root and search the child
+    # with the same index; the scores are copied back onto this process's root children.
+    # Children are searched with a full window, so alpha-beta gives the same scores as minimax.
+    # Transposition tables are not shared with the workers.
+    def parallel_search_root(self, battle, depth):
+        self.depth_limit = depth
+        starting_node = self.build_root(battle)
+        children = self.root_children(starting_node)
+        snapshot = BattleSnapshot.from_battle(battle, self.previous_action)
+        time_left = None
+        if self.deadline is not None:
+            time_left = self.deadline - time.perf_counter()
+        pool = get_search_pool(self.workers)
+        futures = [pool.submit(search_root_child, snapshot, i, depth, self.use_alpha_beta, time_left, self.batch_leaves, self.dynamax_branches, self.beam_widths) for i in range(len(children))]
+        try:
+            for child, future in zip(children, futures):
+                child.score, nodes_visited, cutoffs = future.result()
+                self.nodes_visited += nodes_visited
+                self.cutoffs += cutoffs
+        except SearchTimeout: 
+            for future in futures:
+                future.cancel()
+            raise
+        if children:
+            starting_node.score = max(child.score for child in children)
+        return self.best_child(starting_node)
+
+    # Searches depth 1, 2, 3, ... until the time budget runs out and returns the best child
+    # from the deepest search that finished. Depth 1 always runs to completion so there is
+    # always an answer; a deeper search that hits the deadline is thrown away.
+    def iterative_deepening(self, battle, time_budget, max_depth):
+        self.deadline = None
+        self.iteration_best = None
+        start = time.perf_counter()
+        best_node = self.search_root(battle, 1)
+        self.completed_depth = 1
+        self.deadline = start + time_budget
+        try:
+            for depth in range(2, max_depth + 1):
+                if time.perf_counter() >= self.deadline: 
+                    break
+                if best_node is not None: 
+                    self.iteration_best = best_node.action
+                best_node = self.search_root(battle, depth)
+                self.completed_depth = depth
+        except SearchTimeout: 
+            pass
+        finally:
+            self.deadline = None
+            self.iteration_best = None
+        return best_node
+
+    # One table per battle, kept for all of its turns. Tables of battles that finished are dropped
+    def get_transposition_table(self, battle):
+        if battle.battle_tag in self.transposition_tables:
+            return self.transposition_tables[battle.battle_tag][1]
+        for tag, (old_battle, table) in list(self.transposition_tables.items()):
+            if old_battle.finished:
+                del self.transposition_tables[tag]
+        table = TranspositionTable()
+        self.transposition_tables[battle.battle_tag] = (battle, table)
+        return table
+
+    # One arena per battle, like the transposition tables. Arenas of battles that finished are dropped
+    def get_node_arena(self, battle):
+        if battle.battle_tag in self.node_arenas:
+            return self.node_arenas[battle.battle_tag][1]
+        for tag, (old_battle, _) in list(self.node_arenas.items()):
+            if old_battle.finished:
+                del self.node_arenas[tag]
+        arena = NodeArena(self.node_cap)
+        self.node_arenas[battle.battle_tag] = (battle, arena)
+        return arena
+
+    # Records the decision's peak node usage and stops allocating from the battle's arena, so roots
+    # built outside of a decision (decision_result) are plain nodes
+    def record_node_usage(self):
+        if self.node_arena is not None:
+            self.peak_nodes = self.node_arena.peak_nodes()
+            self.peak_bytes = self.node_arena.peak_bytes()
+            self.node_arena = None
+
+    # With a node_cap, a node that still needs children can't get them once the arena is full.
+    # Iterative deepening throws the deeper search away, as at the deadline; other searches score
+    # the node as a leaf
+    def out_of_nodes(self, node):
+        if self.node_arena is None or node.children or not self.node_arena.full():
+            return False
+        if self.deadline is not None:
+            raise SearchTimeout()
+        return True
+
+    # The chosen node's subtree is all of the tree that the next turn can start from
+    def keep_tree(self, battle, node):
+        node.parent_node = None
+        self.kept_trees[battle.battle_tag] = (battle, battle.turn, node, tree_signature(battle))
+
+    # Root for this decision from the tree kept last turn (reuse_tree), or None to build a new one.
+    # The kept node's replies that lead to the battle's active Pokemon are the possible ways the turn
+    # went; the one whose HP estimates are closest becomes the root, with the battle's real HP values.
+    # The tree is only reused if it is the same as a new one: the battle's signature has to be the same
+    # as when it was generated, and reroot adds or removes switches if the previous action changed the switching rule
+    def kept_root(self, battle):
+        for tag, (old_battle, _, _, _) in list(self.kept_trees.items()):
+            if old_battle.finished:
+                del self.kept_trees[tag]
+        kept = self.kept_trees.pop(battle.battle_tag, None)
+        # Selective expansion ranks children by damage estimates, which change with boosts and what
+        # is revealed, so a pruned tree from last turn can have other children than a new one
+        if kept is None or self.beam_widths is not None or battle.active_pokemon.current_hp <= 0:
+            return None
+        _, turn, node, signature = kept
+        if battle.turn != turn + 1 or node.action is not self.previous_action:
+            return None
+        if signature != tree_signature(battle):
+            return None
+        root = self.build_root(battle)
+        flags = (root.has_dynamaxed, root.currently_dynamaxed, root.opponent_has_dynamaxed, root.opponent_currently_dynamaxed)
+        replies = [
+            child for child in node.children
+            if child.current_pokemon is root.current_pokemon and child.opponent_pokemon is root.opponent_pokemon
+            and (child.has_dynamaxed, child.currently_dynamaxed, child.opponent_has_dynamaxed, child.opponent_currently_dynamaxed) == flags
+            and child.team_slots == root.team_slots and child.opponent_slots == root.opponent_slots
+        ]
+        if not replies:
+            return None
+        switching_changed = isinstance(node.previous_action, POKEMON_CLASSES) != isinstance(self.previous_action, POKEMON_CLASSES)
+        return min(replies, key=lambda child: HP_distance(child, root)).reroot(root, switching_changed)
+
+    # Returns the stored score of a bot-turn node if the transposition table has one that can
+    # be used inside the (alpha, beta) window. The root is always searched so it has children
+    def probe_transposition(self, node, depth, alpha, beta):
+        if self.transposition_table is None or node.parent_node is None:
+            return None
+        entry = self.transposition_table.probe(node.state_hash, self.depth_limit - depth)
+        if entry is None:
+            return None
+        score, _, flag, _ = entry
+        if flag == EXACT or (flag == LOWER_BOUND and score > beta) or (flag == UPPER_BOUND and score < alpha):
+            return score
+        return None
+
+    def store_transposition(self, node, depth, score, flag, best_action):
+        if self.transposition_table is not None:
+            self.transposition_table.store(node.state_hash, score, self.depth_limit - depth, flag, best_action)
+
+    # Stops the current search once the deadline has passed. The clock is only read every 64 nodes
+    def check_deadline(self):
+        if self.deadline is not None and self.nodes_visited % 64 == 0 and time.perf_counter() > self.deadline: 
+            raise SearchTimeout()
 
 
 
-    def minimax(self, node, depth, is_bot_turn):
-        if depth == self.maxDepth or self.is_terminal(node): 
+    # leaves_scored: node is an opponent node whose children are already generated and scored (score_leaf_level)
+    def minimax(self, node, depth, is_bot_turn, leaves_scored=False):
+        self.nodes_visited += 1
+        self.check_deadline()
+        if is_bot_turn:
+            stored_score = self.probe_transposition(node, depth, float('-inf'), float('inf'))
+            if stored_score is not None:
+                node.score = stored_score
+                return stored_score
+        if depth == self.depth_limit or self.is_terminal(node): 
+            self.score(node)
+            if is_bot_turn:
+                self.store_transposition(node, depth, node.score, EXACT, None)
+            return node.score
+        # Scored like a leaf, but not stored: the score isn't searched to the remaining depth
+        if self.out_of_nodes(node):
             self.score(node)
             return node.score
         if is_bot_turn:
             score = float('-inf')
-            bot_moves = node.generate_bot_moves()
+            best_action = None
+            bot_moves = self.bot_children(node, depth)
+            leaves_scored = self.score_leaf_level(bot_moves, depth)
             for move in bot_moves: 
-                child_score = self.minimax(move, depth, False)
+                child_score = self.minimax(move, depth, False, leaves_scored)
+                if child_score > score:
+                    best_action = move.action
                 score = max(score, child_score)
-                print
             node.score = score
+            self.store_transposition(node, depth, score, EXACT, best_action)
             return score
         else: 
             score = float('inf')
-            opponent_moves = node.generate_opponent_moves()
+            opponent_moves = self.opponent_children(node, depth)
             if len(opponent_moves) > 0:
                 for move in opponent_moves: 
-                    child_score = self.minimax(move, depth + 1, True)
+                    if leaves_scored:
+                        child_score = self.scored_leaf(move, depth + 1)
+                    else:
+                        child_score = self.minimax(move, depth + 1, True)
                     score = min(score, child_score)
             else: 
                 score = float('-inf')
@@ -124,11 +646,121 @@ class MinimaxPlayer(Player):
 
 
 
+    # Same search as minimax, but skips children that can't change the result.
+    # Cutoffs only happen when a bound is strictly exceeded, so every child that could tie
+    # for the best score keeps its exact score and choose_move picks the same node as minimax.
+    # Children are searched in order of a cheap estimate but node.children keeps its order.
+    def alpha_beta(self, node, depth, is_bot_turn, alpha, beta):
+        self.nodes_visited += 1
+        self.check_deadline()
+        if is_bot_turn:
+            stored_score = self.probe_transposition(node, depth, alpha, beta)
+            if stored_score is not None:
+                node.score = stored_score
+                return stored_score
+        if depth == self.depth_limit or self.is_terminal(node): 
+            self.score(node)
+            if is_bot_turn:
+                self.store_transposition(node, depth, node.score, EXACT, None)
+            return node.score
+        # Scored like a leaf, but not stored: the score isn't searched to the remaining depth
+        if self.out_of_nodes(node):
+            self.score(node)
+            return node.score
+        if is_bot_turn:
+            original_alpha = alpha
+            score = float('-inf')
+            best_action = None
+            bot_moves = self.order_bot_moves(node, self.bot_children(node, depth))
+            for move in bot_moves: 
+                child_score = self.alpha_beta(move, depth, False, alpha, beta)
+                if child_score > score:
+                    best_action = move.action
+                score = max(score, child_score)
+                alpha = max(alpha, score)
+                if score > beta: 
+                    self.cutoffs += 1
+                    break
+            node.score = score
+            # A score outside the window is only a bound on the real score
+            if score < original_alpha:
+                flag = UPPER_BOUND
+            elif score > beta:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT
+            self.store_transposition(node, depth, score, flag, best_action)
+            return score
+        else: 
+            score = float('inf')
+            opponent_moves = self.opponent_children(node, depth)
+            if len(opponent_moves) > 0:
+                for move in self.order_opponent_moves(opponent_moves): 
+                    child_score = self.alpha_beta(move, depth + 1, True, alpha, beta)
+                    score = min(score, child_score)
+                    beta = min(beta, score)
+                    if score < alpha: 
+                        self.cutoffs += 1
+                        break
+            else: 
+                score = float('-inf')
+            node.score = score
+            return score
+
+    # With batch_leaves, when the children of bot_moves are the last ply of a minimax search,
+    # generates all of them and scores them in one LeafEvaluator pass. Returns whether it did.
+    # alpha_beta scores its leaves one by one: generating the whole ply up front would undo its pruning
+    def score_leaf_level(self, bot_moves, depth):
+        # With a node_cap, the ply is generated node by node so that it stops at the cap
+        if self.leaf_evaluator is None or self.use_alpha_beta or self.node_cap is not None or depth + 1 != self.depth_limit:
+            return False
+        leaves = [leaf for move in bot_moves for leaf in self.opponent_children(move, depth)]
+        if leaves:
+            _, scores = self.leaf_evaluator.evaluate(leaves)
+            for leaf, score in zip(leaves, scores):
+                leaf.score = score
+        return True
+
+    # The leaf step of minimax for a leaf that score_leaf_level already scored
+    def scored_leaf(self, node, depth):
+        self.nodes_visited += 1
+        self.check_deadline()
+        stored_score = self.probe_transposition(node, depth, float('-inf'), float('inf'))
+        if stored_score is not None:
+            node.score = stored_score
+            return stored_score
+        self.store_transposition(node, depth, node.score, EXACT, None)
+        return node.score
+
+    # Last turn's action (or the previous iteration's / transposition table's best action) first,
+    # then attacks by estimated damage, then switches
+    def order_bot_moves(self, node, bot_moves):
+        table_best = None
+        if self.transposition_table is not None:
+            table_best = self.transposition_table.best_action(node.state_hash)
+        def estimate(child):
+            if child.action is self.previous_action or child.action is self.iteration_best or (table_best is not None and child.action is table_best):
+                return float('inf')
+            if isinstance(child.action, MOVE_CLASSES):
+                return BattleUtilities.damage_cache.calculate_damage(child.action, node.current_pokemon, node.opponent_pokemon, True, True)
+            return -1
+        return sorted(bot_moves, key=estimate, reverse=True)
+
+    # Opponent actions that leave my active Pokemon with the least HP first
+    def order_opponent_moves(self, opponent_moves):
+        return sorted(opponent_moves, key=lambda child: child.current_HP_values[child.current_slot])
+
+
+
     def pick_best_switch(self, node, depth): 
-        switches = node.add_bot_switches()
+        switches = node.children if node.children else node.add_bot_switches()
+        leaves_scored = self.score_leaf_level(switches, depth)
         score = float('-inf')
         for switch in switches:
-            child_score = self.minimax(switch, depth, False)
+            if self.use_alpha_beta: 
+                child_score = self.alpha_beta(switch, depth, False, score, float('inf'))
+            else: 
+                child_score = self.minimax(switch, depth, False, leaves_scored)
             score = max(score, child_score)
         node.score = score
         return score
@@ -138,15 +770,17 @@ class MinimaxPlayer(Player):
     # This function determines if this is an end state and we should stop
     def is_terminal(self, node):
         all_fainted = True
-        for pokemon in node.current_HP.keys(): 
-            if node.current_HP[pokemon] > 0:
+        for HP in node.current_HP_values: 
+            if HP > 0:
                 all_fainted = False
+                break
         if all_fainted: 
             return True
         all_fainted = True
-        for pokemon in node.opponent_HP.keys():
-            if node.opponent_HP[pokemon]:
+        for HP in node.opponent_HP_values:
+            if HP:
                 all_fainted = False
+                break
         if all_fainted: 
             return True
         return False
@@ -156,21 +790,22 @@ class MinimaxPlayer(Player):
     def score(self, node):
         score = 0
         # Get positive points for dealing damage and knocking out opponent
-        for pokemon in node.opponent_HP.keys():
+        # HP values are stored in team slot order, which is the key order of the slot dictionaries
+        for pokemon, HP in zip(node.context.opponent_slots, node.opponent_HP_values):
             if pokemon.current_hp is not None:
-                if node.opponent_HP[pokemon] <= 0 and pokemon.current_hp > 0: 
+                if HP <= 0 and pokemon.current_hp > 0: 
                     score += 300
                 else:
-                    damage = pokemon.current_hp - node.opponent_HP[pokemon] 
+                    damage = pokemon.current_hp - HP 
                     score += 3 * damage
             #else: 
                 #print(f"Pokemon is {pokemon}, HP is None")
         # Lose points for taking damage or getting knocked out
-        for pokemon in node.current_HP.keys():
-            if node.current_HP[pokemon] <= 0 and pokemon.current_hp > 0: 
+        for pokemon, HP in zip(node.context.team_slots, node.current_HP_values):
+            if HP <= 0 and pokemon.current_hp > 0: 
                 score -= 100
             else: 
-                damage = (pokemon.current_hp / pokemon.max_hp) - (node.current_HP[pokemon] / pokemon.max_hp)
+                damage = (pokemon.current_hp / pokemon.max_hp) - (HP / pokemon.max_hp)
                 score -= damage
         # Lose points for getting outsped by opponent
         #if BattleUtilities.opponent_can_outspeed(node.current_pokemon, node.opponent_pokemon):
@@ -190,6 +825,224 @@ class MinimaxPlayer(Player):
         node.score = score
         return score
 
+# Process pools for parallel search, one per worker count, kept for the life of the process
+# and shared by every MinimaxPlayer
+search_pools = {}
+
+def get_search_pool(workers):
+    if workers not in search_pools:
+        search_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return search_pools[workers]
+
+# Executor for decisions offloaded to a thread, shared by every player (see OffloadedDecisions)
+decision_thread = None
+
+def get_decision_thread():
+    global decision_thread
+    if decision_thread is None:
+        decision_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decisions")
+    return decision_thread
+
+# Runs in a pool worker: makes a whole MinimaxPlayer decision on a snapshot and returns the index
+# of the chosen root child (or None)
+def choose_root_child(snapshot, settings, deadline):
+    BattleUtilities.damage_cache.clear()
+    searcher = MinimaxPlayer.searcher(**settings)
+    searcher.previous_action = snapshot.previous_action
+    best_node = searcher.choose_node(snapshot, deadline)
+    if best_node is None:
+        return None
+    return best_node.parent_node.children.index(best_node)
+
+# Runs in a pool worker: rebuilds the root from the snapshot and searches the root child at child_index.
+# Returns the child's score and the worker's node and cutoff counts
+def search_root_child(snapshot, child_index, depth, use_alpha_beta, time_left, batch_leaves=False, dynamax_branches=False, beam_widths=None):
+    # Snapshot objects are new in every task, so nothing cached for the last one can be reused
+    BattleUtilities.damage_cache.clear()
+    searcher = MinimaxPlayer.searcher(depth, use_alpha_beta, batch_leaves=batch_leaves, dynamax_branches=dynamax_branches, beam_widths=beam_widths)
+    searcher.previous_action = snapshot.previous_action
+    searcher.depth_limit = depth
+    if time_left is not None:
+        searcher.deadline = time.perf_counter() + time_left
+    starting_node = searcher.build_root(snapshot)
+    if batch_leaves:
+        searcher.leaf_evaluator = LeafEvaluator(starting_node)
+    children = searcher.root_children(starting_node)
+    leaves_scored = searcher.score_leaf_level([children[child_index]], 0)
+    if use_alpha_beta:
+        score = searcher.alpha_beta(children[child_index], 0, False, float('-inf'), float('inf'))
+    else:
+        score = searcher.minimax(children[child_index], 0, False, leaves_scored)
+    return score, searcher.nodes_visited, searcher.cutoffs
+
+# Monte Carlo tree search on the same GameNode tree as MinimaxPlayer. Each simulation walks down
+# from the root with UCT (my nodes pick the child with the best value, opponent nodes the worst,
+# as in minimax), expands the node it stops at by one child, plays random turns from there for
+# rollout_depth turns with the GameNode generators and scores the end with MinimaxPlayer.score.
+# Values are normalized to [0, 1] by the lowest and highest scores seen in the decision.
+# The decision stops after simulations simulations or time_budget seconds (whichever is first,
+# None for no limit on either), or in time for an offloaded decision's deadline. The root child
+# with the most visits is chosen.
+# With rollout_batch > 1, every expanded node gets rollout_batch rollouts at once, scored in one
+# LeafEvaluator pass (each rollout counts as a simulation).
+# MinimaxPlayer's alpha-beta, transposition table, tree reuse, leaf batching and root-parallel
+# (workers) options don't apply to MCTS, so they are rejected. dynamax_branches, beam_widths and
+# the node arena options are used.
+class MCTSPlayer(MinimaxPlayer):
+
+    simulations = 1000
+    exploration = 1.4
+    rollout_depth = 2
+    rollout_batch = 1
+    # Last decision's counters, and totals over every decision
+    simulations_run = 0
+    search_seconds = 0.0
+    total_simulations = 0
+    total_search_seconds = 0.0
+
+    # Decisions can't be rebuilt from a process pool's result like MinimaxPlayer's
+    supports_process_decisions = False
+
+    # Options of MinimaxPlayer's search that MCTS doesn't use, with their default values
+    UNUSED_OPTIONS = {"use_alpha_beta": False, "use_transposition_table": False, "reuse_tree": False, "batch_leaves": False, "workers": 1}
+
+    def __init__(self, *args, simulations=1000, time_budget=None, exploration=1.4, rollout_depth=2, rollout_batch=1, seed=None, **kwargs):
+        unused = [name for name, default in self.UNUSED_OPTIONS.items() if name in kwargs and kwargs[name] != default]
+        if unused:
+            raise ValueError(f"MCTSPlayer doesn't use {', '.join(unused)}")
+        MinimaxPlayer.__init__(self, *args, time_budget=time_budget, **kwargs)
+        if simulations is None and time_budget is None:
+            raise ValueError("MCTSPlayer needs a simulation or time budget")
+        self.simulations = simulations
+        self.exploration = exploration
+        self.rollout_depth = rollout_depth
+        self.rollout_batch = rollout_batch
+        self.rng = random.Random(seed)
+
+    def simulations_per_second(self):
+        return self.total_simulations / self.total_search_seconds if self.total_search_seconds else 0.0
+
+    def choose_node(self, battle, deadline=None):
+        BattleUtilities.damage_cache.sync(battle)
+        start = time.perf_counter()
+        time_budget = self.time_budget
+        if deadline is not None:
+            deadline_budget = max(0, deadline - time.time()) * DEADLINE_SAFETY_MARGIN
+            time_budget = deadline_budget if time_budget is None else min(time_budget, deadline_budget)
+        end = start + time_budget if time_budget is not None else None
+        if self.use_node_arena:
+            self.node_arena = self.get_node_arena(battle)
+            self.node_arena.reset()
+        try:
+            root = self.build_root(battle)
+            children = self.root_children(root)
+            self.leaf_evaluator = LeafEvaluator(root) if self.rollout_batch > 1 else None
+            # Visits and summed scores of every node in the tree
+            self.visits = {root: 0}
+            self.totals = {root: 0.0}
+            self.value_min = float('inf')
+            self.value_max = float('-inf')
+            self.simulations_run = 0
+            if len(children) > 1:
+                while self.simulations is None or self.simulations_run < self.simulations:
+                    # A deadline always leaves time for at least one simulation per root child
+                    if end is not None and self.simulations_run >= len(children) and time.perf_counter() >= end:
+                        break
+                    self.simulate(root)
+        finally:
+            self.record_node_usage()
+        self.search_seconds = time.perf_counter() - start
+        self.total_simulations += self.simulations_run
+        self.total_search_seconds += self.search_seconds
+        if not children:
+            return None
+        for child in children:
+            child.score = self.totals[child] / self.visits[child] if self.visits.get(child) else float('-inf')
+        return max(children, key=lambda child: (self.visits.get(child, 0), child.score))
+
+    def simulate(self, root):
+        path = self.select(root)
+        leaf, is_bot_turn = path[-1]
+        rollouts = max(1, self.rollout_batch if self.simulations is None else min(self.rollout_batch, self.simulations - self.simulations_run))
+        mark = self.node_arena.mark() if self.node_arena is not None else None
+        ends = [self.rollout(leaf, is_bot_turn) for _ in range(rollouts)]
+        if self.leaf_evaluator is not None:
+            _, values = self.leaf_evaluator.evaluate(ends)
+        else:
+            values = [self.score(end) for end in ends]
+        if mark is not None:
+            # The rollouts' nodes aren't part of the tree, so they go back to the arena right away
+            self.node_arena.rewind(mark)
+        self.value_min = min(self.value_min, min(values))
+        self.value_max = max(self.value_max, max(values))
+        total = sum(values)
+        for node, _ in path:
+            self.visits[node] += len(values)
+            self.totals[node] += total
+        self.simulations_run += len(values)
+
+    # Returns the (node, is_bot_turn) pairs from the root to the node the rollouts start from
+    def select(self, root):
+        node = root
+        is_bot_turn = True
+        path = [(root, True)]
+        while not self.is_terminal(node) and not self.out_of_nodes(node):
+            ply = len(path) - 1
+            if is_bot_turn:
+                children = node.expand_bot_moves(self.beam_width(ply), self.dynamax_branches)
+            else:
+                children = node.expand_opponent_moves(self.beam_width(ply), self.dynamax_branches)
+            if not children:
+                break
+            unvisited = [child for child in children if child not in self.visits]
+            if unvisited:
+                node = unvisited[0]
+                self.visits[node] = 0
+                self.totals[node] = 0.0
+                path.append((node, not is_bot_turn))
+                break
+            node = self.uct_child(node, children, is_bot_turn)
+            is_bot_turn = not is_bot_turn
+            path.append((node, is_bot_turn))
+        return path
+
+    def uct_child(self, node, children, is_bot_turn):
+        log_visits = math.log(self.visits[node])
+        value_range = self.value_max - self.value_min
+        best_child = None
+        best_bound = float('-inf')
+        for child in children:
+            visits = self.visits[child]
+            value = (self.totals[child] / visits - self.value_min) / value_range if value_range > 0 else 0.5
+            if not is_bot_turn:
+                value = 1 - value
+            bound = value + self.exploration * math.sqrt(log_visits / visits)
+            if bound > best_bound:
+                best_bound = bound
+                best_child = child
+        return best_child
+
+    # Plays random actions from node for rollout_depth turns (or until the battle ends) and returns
+    # the node it ends at. The nodes it generates are removed from the tree again
+    def rollout(self, node, is_bot_turn):
+        current = node
+        turns = 0
+        while not self.is_terminal(current):
+            if is_bot_turn:
+                if turns == self.rollout_depth:
+                    break
+                children = current.generate_bot_moves(self.dynamax_branches)
+                turns += 1
+            else:
+                children = current.generate_opponent_moves(self.dynamax_branches)
+            if not children:
+                break
+            current = self.rng.choice(children)
+            is_bot_turn = not is_bot_turn
+        if current is not node:
+            node.children = []
+        return current
+
 class SmartDamagePlayer(Player):
     prevDamagePercent = 100 
     currentdamagePercent = 100 
@@ -198,6 +1051,7 @@ class SmartDamagePlayer(Player):
     previousOpponent = None
 
     def choose_move(self, battle):
+        BattleUtilities.damage_cache.sync(battle)
         self.currentOpponent = battle.opponent_active_pokemon
         if self.currentOpponent != self.previousOpponent: 
             self.currentDamagePercent = 100
@@ -230,7 +1084,7 @@ class SmartDamagePlayer(Player):
 
         # finds the best move among available ones
         self.usedMovePreviously = True
-        best_move = max(battle.available_moves, key=lambda move: BattleUtilities.calculate_damage(move, battle.active_pokemon, battle.opponent_active_pokemon, True, True))
+        best_move = max(battle.available_moves, key=lambda move: BattleUtilities.damage_cache.calculate_damage(move, battle.active_pokemon, battle.opponent_active_pokemon, True, True))
         # print(f'Best move was {best_move}, Calculated damage value was {self.calculate_damage(best_move, battle)}')
         return self.create_order(best_move)
 
@@ -248,30 +1102,35 @@ class SmartDamagePlayer(Player):
                 best_switch = switch
         return best_switch
     
-    # Gets a number that determines how well the Pokemon matches up with opponent. Lower scores are better
+    # Gets a number that determines how well the Pokemon matches up with opponent. Lower scores are better.
+    # Uses the precomputed species matchup table when it has been built
     def get_matchup_score(self, my_pokemon, opponent_pokemon):
-        score = 0
-        defensive_multiplier = BattleUtilities.get_defensive_type_multiplier(my_pokemon, opponent_pokemon)
-        # A multiplier greater than 1 means we are at a type disadvantage. If there is a better type match, switch
-        if defensive_multiplier == 4:
-            score += 1
-        elif defensive_multiplier == 2:
-            score += 0.5
-        elif defensive_multiplier == 0.5:
-            score -= 0.5
-        elif defensive_multiplier == 0.25:
-            score -= 1
-        if BattleUtilities.opponent_can_outspeed(my_pokemon, opponent_pokemon):
-            score += 0.5
-        return score
+        matchup_table = SpeciesMatchups.get_matchup_table()
+        if matchup_table is None:
+            return BattleUtilities.get_matchup_score(my_pokemon, opponent_pokemon)
+        return matchup_table.matchup_score(my_pokemon, opponent_pokemon)
 
 
-class TrainedRLPlayer(Gen8EnvSinglePlayer):
+# model can be a Keras model, a NumpyModel, or the path of either (a .npz file is loaded as a
+# NumpyModel). Players built from the same path share the loaded model (see load_model).
+# TensorFlow is only imported when a Keras model has to be loaded here.
+# model.predict blocks, so decisions can be offloaded to a thread (not a process: the model stays here).
+# With inference="batched" (or a BatchedInference), predictions are instead batched with those of
+# every other player sharing the model, on the event loop
+class TrainedRLPlayer(OffloadedDecisions, Gen8EnvSinglePlayer):
     
-    def __init__(self, model, *args, **kwargs):
+    def __init__(self, model, *args, executor=None, decision_timeout=None, inference=None, **kwargs):
         Gen8EnvSinglePlayer.__init__(self, *args, **kwargs)
+        if isinstance(model, (str, os.PathLike)):
+            model = load_model(model)
         self.model = model
         self.model.summary()
+        self.setup_offloading(executor, decision_timeout)
+        if inference == "batched":
+            inference = get_batched_inference(model)
+        if inference is not None and executor is not None:
+            raise ValueError("Batched inference already runs on the event loop, it can't be used with an executor")
+        self.inference = inference
 
     def embed_battle(self, battle):
         # -1 indicates that the move does not have a base power
@@ -321,6 +1180,70 @@ class TrainedRLPlayer(Gen8EnvSinglePlayer):
             return super().choose_move(battle)
 
         embeded = self.embed_battle(battle)
-        prediction = self.model.predict(np.expand_dims([embeded], 0))
+        prediction = self.predict(embeded)
         action = np.argmax(prediction)
         return TrainedRLPlayer._action_to_move(self, action, battle)
+
+    # Q-values of a single embedding
+    def predict(self, embedding):
+        return self.model.predict(np.expand_dims([embedding], 0))
+
+    async def choose_move_async(self, battle):
+        if self.inference is None or self.model is None:
+            return await OffloadedDecisions.choose_move_async(self, battle)
+        prediction = self.inference.predict(self.embed_battle(battle))
+        if self.decision_timeout is not None:
+            try:
+                prediction = await asyncio.wait_for(prediction, self.decision_timeout)
+            except asyncio.TimeoutError:
+                self.decision_timeouts += 1
+                return self.choose_fallback_move(battle)
+        else:
+            prediction = await prediction
+        action = np.argmax(prediction)
+        return TrainedRLPlayer._action_to_move(self, action, battle)
+
+# Models loaded by load_model, by absolute path -> (modification time, model), so every player
+# built from the same file shares one model (and, with inference="batched", one queue)
+loaded_models = {}
+
+# Loads a model saved by the training script (Keras SavedModel directory) or its NumPy export.
+# A file that was saved again since it was loaded is loaded again
+def load_model(path):
+    path = os.path.abspath(path)
+    modified = os.path.getmtime(path)
+    if path in loaded_models and loaded_models[path][0] == modified:
+        return loaded_models[path][1]
+    if path.endswith(".npz"):
+        model = NumpyModel(path)
+    else:
+        import tensorflow as tf
+        model = tf.keras.models.load_model(path)
+    loaded_models[path] = (modified, model)
+    return model
+
+# Player classes by name, so players can be configured for other processes (evaluation workers, actors)
+PLAYER_CLASSES = {
+    "RandomPlayer": RandomPlayer,
+    "SelfBattler2": SelfBattler2,
+    "MaxDamagePlayer": MaxDamagePlayer,
+    "MinimaxPlayer": MinimaxPlayer,
+    "MCTSPlayer": MCTSPlayer,
+    "SmartDamagePlayer": SmartDamagePlayer,
+    "TrainedRLPlayer": TrainedRLPlayer,
+}
+
+# Every player that can be created without arguments (TrainedRLPlayer needs a model), for training
+# and evaluation opponents
+OPPONENT_POOL = tuple(name for name in PLAYER_CLASSES if name != "TrainedRLPlayer")
+
+# Default opponents for DQN training (ActorLearner): the pool without MCTSPlayer. With its default
+# 1000 simulations it takes about 60 ms a decision (RandomPlayer: about 0.005 ms), so it would set
+# the pace of every vector step of the actor it plays in. Pass its name explicitly to train against it
+TRAINING_POOL = tuple(name for name in OPPONENT_POOL if name != "MCTSPlayer")
+
+# A player for local battles (no server connection)
+def create_player(name, **kwargs):
+    if name not in PLAYER_CLASSES:
+        raise ValueError(f"Unknown player {name!r}")
+    return PLAYER_CLASSES[name](battle_format="gen8randombattle", start_listening=False, **kwargs)
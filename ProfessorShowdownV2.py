@@ -1,19 +1,18 @@
 import numpy as np
-import tensorflow as tf
 import os
+import sys
 import BattleUtilities
+import TypeChart
 
 from poke_env.player.env_player import Gen8EnvSinglePlayer
 from poke_env.player.random_player import RandomPlayer
 
-from rl.agents.dqn import DQNAgent
-from rl.policy import LinearAnnealedPolicy, EpsGreedyQPolicy
-from rl.memory import SequentialMemory
-from tensorflow.keras.layers import Dense, Flatten, Dropout
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras import layers
-from PlayerModels import SelfBattler2, MaxDamagePlayer, MinimaxPlayer, SmartDamagePlayer, TrainedRLPlayer
+from PlayerModels import SelfBattler2, MaxDamagePlayer, MinimaxPlayer, SmartDamagePlayer, TrainedRLPlayer, create_player
+from ActorLearner import train_actor_learner
+from Evaluation import evaluate, print_results, write_results
+from NumpyModel import export_model
+from ReplayMemory import KerasRLMemory, PrioritizedReplayMemory, ReplayMemory
+from VectorEnv import VectorBattleEnv, VectorDQN, masked_huber_loss
 
 # This will disable the gpu and make the training run on cpu
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
@@ -30,10 +29,7 @@ class SelfBattler1(Gen8EnvSinglePlayer):
                 move.base_power / 100
             )  # Simple rescaling to facilitate learning
             if move.type:
-                moves_dmg_multiplier[i] = move.type.damage_multiplier(
-                    battle.opponent_active_pokemon.type_1,
-                    battle.opponent_active_pokemon.type_2,
-                )
+                moves_dmg_multiplier[i] = TypeChart.move_multiplier(move, battle.opponent_active_pokemon)
 
         # We count how many pokemons have not fainted in each team
         remaining_mon_team = (
@@ -77,8 +73,21 @@ class SelfBattler1(Gen8EnvSinglePlayer):
 
 NB_TRAINING_STEPS = 10000
 NB_EVALUATION_EPISODES = 100
+# Number of battles to train on at once with the local simulator (VectorEnv) instead of the
+# Showdown server. 0 trains on the server with keras-rl
+N_LOCAL_ENVS = 0
+# Number of actor processes collecting local battles for one learner (ActorLearner), each playing
+# N_LOCAL_ENVS battles at once. 0 trains in this process only
+N_ACTORS = 0
+# PlayerModels.create_player names of the local training opponents, for both modes: the same
+# opponents as the server training
+LOCAL_OPPONENTS = ("SelfBattler2", "MaxDamagePlayer", "RandomPlayer")
+# Replay memory size. With a directory, the memory is kept in memory-mapped files there
+REPLAY_LIMIT = 10000
+REPLAY_DIRECTORY = None
+# Prioritized sampling (only updated by the local training, DQNAgent can't report TD errors)
+PRIORITIZED_REPLAY = False
 
-tf.random.set_seed(0)
 np.random.seed(0)
 
 
@@ -99,7 +108,47 @@ def dqn_evaluation(player, dqn, nb_episodes):
     )
 
 
+def create_replay_memory():
+    memory_class = PrioritizedReplayMemory if PRIORITIZED_REPLAY else ReplayMemory
+    return memory_class(REPLAY_LIMIT, 11, REPLAY_DIRECTORY)
+
+
+# Trains model on N_LOCAL_ENVS local battles at once against the same opponents as the server training
+# (LOCAL_OPPONENTS), in this process or in N_ACTORS actor processes
+def local_dqn_training(model, target_model, nb_steps):
+    dqn = VectorDQN(
+        model,
+        target_model,
+        len(SelfBattler1._ACTION_SPACE),
+        memory=create_replay_memory(),
+        nb_steps_warmup=1000,
+        gamma=2,
+        target_model_update=1,
+        value_max=1.0,
+        value_min=0.05,
+        nb_annealing_steps=10000,
+    )
+    if N_ACTORS:
+        print(train_actor_learner(dqn, SelfBattler1, LOCAL_OPPONENTS, nb_steps=nb_steps, n_actors=N_ACTORS, envs_per_actor=N_LOCAL_ENVS))
+    else:
+        env_player = SelfBattler1(battle_format="gen8randombattle", start_listening=False)
+        opponents = [create_player(name) for name in LOCAL_OPPONENTS]
+        env = VectorBattleEnv(env_player, [opponents[index % len(opponents)] for index in range(N_LOCAL_ENVS)])
+        print(dqn.fit(env, nb_steps))
+
+
 if __name__ == "__main__":
+    # TensorFlow and keras-rl are only imported for training, so importing SelfBattler1 stays cheap
+    import tensorflow as tf
+    from rl.agents.dqn import DQNAgent
+    from rl.policy import LinearAnnealedPolicy, EpsGreedyQPolicy
+    from tensorflow.keras.layers import Dense, Flatten, Dropout
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.optimizers import Adam
+    from tensorflow.keras import layers
+
+    tf.random.set_seed(0)
+
     # Defining the environment  agent
     env_player = SelfBattler1(battle_format="gen8randombattle")
     # I define model here so that I can run a already trained agent for training a new agent
@@ -141,7 +190,19 @@ if __name__ == "__main__":
 
     model.add(Dense(n_action, activation="linear"))
 
-    memory = SequentialMemory(limit=10000, window_length=1)
+    if N_LOCAL_ENVS:
+        model.compile(Adam(lr=0.001), loss=masked_huber_loss(0.01), metrics=["mae"])
+        # As many steps as the three runs against three opponents below
+        local_dqn_training(model, tf.keras.models.clone_model(model), 9 * NB_TRAINING_STEPS)
+        model.save("model_%d" % NB_TRAINING_STEPS)
+        # Evaluates the NumPy export of the trained model against every opponent at once
+        export_model("model_%d" % NB_TRAINING_STEPS, "model_%d.npz" % NB_TRAINING_STEPS)
+        results = evaluate(("TrainedRLPlayer", {"model": "model_%d.npz" % NB_TRAINING_STEPS}), n_battles=NB_EVALUATION_EPISODES)
+        print_results(results)
+        write_results(results, "evaluation_%d.json" % NB_TRAINING_STEPS)
+        sys.exit()
+
+    memory = KerasRLMemory(create_replay_memory())
 
     # Ssimple epsilon greedy
     policy = LinearAnnealedPolicy(
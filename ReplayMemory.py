@@ -0,0 +1,196 @@
+# Replay memory for DQN training, in preallocated NumPy arrays.
+# ReplayMemory is a ring buffer of the last limit transitions (observation, action, reward, next
+# observation, done), sized for the embedding when it is created. With a directory, the arrays are
+# memory-mapped .npy files in it instead, so millions of transitions don't grow the heap (the OS
+# pages them in and out as they are sampled).
+# PrioritizedReplayMemory samples transitions in proportion to priority ** alpha (a sum tree),
+# with importance sampling weights annealed from beta to 1, and new transitions get the current
+# maximum priority. sample returns the indices and weights with the batch; update_priorities takes
+# the TD errors of the trained batch. Both memories have the same interface, so VectorDQN trains
+# with either (the uniform memory's weights are all 1).
+# KerasRLMemory wraps either memory in the interface of keras-rl's SequentialMemory (window length
+# 1), so it can replace it in the DQNAgent of the training script. DQNAgent doesn't pass TD errors
+# back to its memory, so there the priorities stay at their initial value.
+
+import os
+
+from collections import namedtuple
+
+import numpy as np
+
+class ReplayMemory:
+
+    # Priorities only matter to PrioritizedReplayMemory
+    prioritized = False
+
+    def __init__(self, limit, observation_size, directory=None):
+        self.limit = limit
+        self.observation_size = observation_size
+        self.directory = directory
+        self.observations = self.new_array("observations", (limit, observation_size), np.float32)
+        self.next_observations = self.new_array("next_observations", (limit, observation_size), np.float32)
+        self.actions = self.new_array("actions", (limit,), np.int64)
+        self.rewards = self.new_array("rewards", (limit,), np.float32)
+        self.dones = self.new_array("dones", (limit,), bool)
+        self.position = 0
+        self.size = 0
+
+    def new_array(self, name, shape, dtype):
+        if self.directory is None:
+            return np.zeros(shape, dtype=dtype)
+        os.makedirs(self.directory, exist_ok=True)
+        return np.lib.format.open_memmap(os.path.join(self.directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+    def __len__(self):
+        return self.size
+
+    # Bytes held by the arrays (on disk for a memory-mapped memory)
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.observations, self.next_observations, self.actions, self.rewards, self.dones))
+
+    # Appends a batch of transitions and returns their indices
+    def append_batch(self, observations, actions, rewards, next_observations, dones):
+        indices = (self.position + np.arange(len(actions))) % self.limit
+        self.observations[indices] = observations
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_observations[indices] = next_observations
+        self.dones[indices] = dones
+        self.position = (self.position + len(actions)) % self.limit
+        self.size = min(self.size + len(actions), self.limit)
+        return indices
+
+    def append(self, observation, action, reward, next_observation, done):
+        return self.append_batch([observation], [action], [reward], [next_observation], [done])[0]
+
+    def sample_indices(self, batch_size, rng):
+        return rng.integers(self.size, size=batch_size), np.ones(batch_size, dtype=np.float32)
+
+    # Returns observations, actions, rewards, next observations, dones, indices and importance weights
+    def sample(self, batch_size, rng):
+        indices, weights = self.sample_indices(batch_size, rng)
+        return self.observations[indices], self.actions[indices], self.rewards[indices], self.next_observations[indices], self.dones[indices], indices, weights
+
+    def update_priorities(self, indices, errors):
+        pass
+
+    def flush(self):
+        for array in (self.observations, self.next_observations, self.actions, self.rewards, self.dones):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+# Sums of priorities over a complete binary tree in one array: node 1 is the root, the children
+# of node i are 2i and 2i + 1, and the leaves (one per transition) start at capacity
+class SumTree:
+
+    def __init__(self, limit):
+        self.capacity = 1
+        while self.capacity < limit:
+            self.capacity *= 2
+        self.depth = self.capacity.bit_length() - 1
+        self.tree = np.zeros(2 * self.capacity)
+
+    def total(self):
+        return self.tree[1]
+
+    def set(self, indices, priorities):
+        nodes = np.asarray(indices) + self.capacity
+        self.tree[nodes] = priorities
+        # Recomputes the parents of the changed leaves, one level at a time
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.capacity]
+
+    # Leaf indices at which the running sum of priorities reaches each value
+    def find(self, values):
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=float)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.capacity
+
+class PrioritizedReplayMemory(ReplayMemory):
+
+    prioritized = True
+
+    # alpha is how much priorities count (0 is uniform), beta the importance sampling correction,
+    # annealed to 1 over beta_steps samples. epsilon keeps transitions with no TD error sampleable
+    def __init__(self, limit, observation_size, directory=None, alpha=0.6, beta=0.4, beta_steps=100000, epsilon=0.01):
+        super().__init__(limit, observation_size, directory)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_steps = beta_steps
+        self.epsilon = epsilon
+        self.tree = SumTree(limit)
+        self.max_priority = 1.0
+        self.samples = 0
+
+    def append_batch(self, observations, actions, rewards, next_observations, dones):
+        indices = super().append_batch(observations, actions, rewards, next_observations, dones)
+        self.tree.set(indices, self.max_priority)
+        return indices
+
+    def current_beta(self):
+        return min(1.0, self.beta + (1.0 - self.beta) * self.samples / self.beta_steps) if self.beta_steps else 1.0
+
+    def sample_indices(self, batch_size, rng):
+        # One value in each of batch_size equal segments of the total priority
+        total = self.tree.total()
+        values = (np.arange(batch_size) + rng.random(batch_size)) * (total / batch_size)
+        indices = np.minimum(self.tree.find(values), self.size - 1)
+        probabilities = self.tree.get(indices) / total
+        weights = (self.size * probabilities) ** -self.current_beta()
+        self.samples += 1
+        return indices, (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, indices, errors):
+        priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+        self.tree.set(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+# Same fields as keras-rl's Experience
+Experience = namedtuple("Experience", "state0, action, reward, state1, terminal1")
+
+class KerasRLMemory:
+
+    # DQNAgent only uses windows of one observation with this memory
+    window_length = 1
+    ignore_episode_boundaries = False
+
+    def __init__(self, memory, seed=0):
+        self.memory = memory
+        self.rng = np.random.default_rng(seed)
+        # (observation, action, reward, terminal) of the last append, which becomes a transition once
+        # the next observation arrives, or None if that observation starts a new episode
+        self.last_entry = None
+
+    # DQNAgent appends observation, the action taken in it, the reward and whether the episode ended.
+    # After an episode it appends the final observation with terminal=False, which isn't a transition
+    def append(self, observation, action, reward, terminal, training=True):
+        if not training:
+            return
+        if self.last_entry is not None:
+            last_observation, last_action, last_reward, last_terminal = self.last_entry
+            self.memory.append(last_observation, last_action, last_reward, observation, last_terminal)
+        previous_terminal = self.last_entry is not None and self.last_entry[3]
+        self.last_entry = None if previous_terminal else (np.asarray(observation).ravel(), action, reward, terminal)
+
+    def get_recent_state(self, current_observation):
+        return [current_observation]
+
+    def sample(self, batch_size, batch_idxs=None):
+        observations, actions, rewards, next_observations, dones, _, _ = self.memory.sample(batch_size, self.rng)
+        return [Experience([observation], action, reward, [next_observation], done) for observation, action, reward, next_observation, done in zip(observations, actions, rewards, next_observations, dones)]
+
+    @property
+    def nb_entries(self):
+        return len(self.memory)
+
+    def get_config(self):
+        return {"window_length": self.window_length, "ignore_episode_boundaries": self.ignore_episode_boundaries, "limit": self.memory.limit}
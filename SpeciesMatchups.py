@@ -0,0 +1,114 @@
+# Precomputed type matchups between every pair of species, for switch selection.
+# The type part of BattleUtilities.get_matchup_score only depends on the two species, so
+# build_table stores it for every pair of gen 8 pokedex species in an int8 .npy file
+# (in half points: -2 to 2), and MatchupTable memory-maps it, so every worker process on a
+# machine shares the same pages instead of building its own copy.
+# The speed part compares my Pokemon's real speed stat with the opponent's estimated maximum speed,
+# which depends on their levels, so it is still calculated on each lookup.
+# A Pokemon whose species isn't in the table falls back to BattleUtilities.get_matchup_score.
+# The table is generated, not checked in: get_matchup_table builds it on first use (about 2 MB,
+# ignored by git). Rebuild it with: python SpeciesMatchups.py
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import BattleUtilities
+import TypeChart
+
+from poke_env.data import GEN8_POKEDEX
+from poke_env.environment.pokemon_type import PokemonType
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "species_matchups.npy")
+
+# Species order and types of the table rows, stored next to the table
+def species_path(table_path):
+    return os.path.splitext(table_path)[0] + ".json"
+
+def build_table(table_path=TABLE_PATH):
+    # Some placeholder entries (like MissingNo) have types that don't exist in battles
+    species = sorted(name_id for name_id, entry in GEN8_POKEDEX.items() if all(name.upper() in PokemonType.__members__ for name in entry["types"]))
+    types = [[TypeChart.TYPE_IDS[PokemonType.from_name(name)] for name in GEN8_POKEDEX[name_id]["types"]] for name_id in species]
+    type_1 = np.array([species_types[0] for species_types in types], dtype=np.intp)
+    type_2 = np.array([species_types[1] if len(species_types) > 1 else TypeChart.NO_TYPE for species_types in types], dtype=np.intp)
+    # Same as TypeChart.defensive_multipliers, for rows of my species and columns of opponent species
+    opponent_type_2 = np.where(type_2 == TypeChart.NO_TYPE, type_1, type_2)
+    first = TypeChart.DUAL_TYPE_MATRIX[type_1[None, :], type_1[:, None], type_2[:, None]]
+    second = TypeChart.DUAL_TYPE_MATRIX[opponent_type_2[None, :], type_1[:, None], type_2[:, None]]
+    multipliers = np.maximum(first, second)
+    # Same thresholds as get_matchup_score, in half points
+    scores = np.zeros(multipliers.shape, dtype=np.int8)
+    scores[multipliers == 4] = 2
+    scores[multipliers == 2] = 1
+    scores[multipliers == 0.5] = -1
+    scores[multipliers == 0.25] = -2
+    # The table goes last, as it marks a finished build
+    write_replacing(species_path(table_path), "w", lambda species_file: json.dump({"species": species, "types": [[int(first_type), int(second_type)] for first_type, second_type in zip(type_1, type_2)]}, species_file))
+    write_replacing(table_path, "wb", lambda table_file: np.save(table_file, scores))
+
+# Writes path through a temporary file of its own in the same directory, moved into place when it
+# is complete. So processes building the table at the same time don't write to the same file, and
+# a process loading it never sees a partial one
+def write_replacing(path, mode, write):
+    directory, name = os.path.split(path)
+    descriptor, temporary_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(descriptor, mode) as temporary_file:
+            write(temporary_file)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+class MatchupTable:
+
+    def __init__(self, table_path=TABLE_PATH):
+        self.scores = np.load(table_path, mmap_mode="r")
+        # Indexing a memoryview of the mapped array is much cheaper than indexing the array
+        # itself, which matters for the handful of lookups each decision makes
+        self.score_view = memoryview(self.scores)
+        with open(species_path(table_path)) as species_file:
+            contents = json.load(species_file)
+        self.index = {name : row for row, name in enumerate(contents["species"])}
+
+    # Same as BattleUtilities.get_matchup_score. poke_env takes a Pokemon's types from the
+    # pokedex entry of its species, so the species pair determines the type part
+    def matchup_score(self, my_pokemon, opponent_pokemon):
+        my_row = self.index.get(my_pokemon.species)
+        opponent_row = self.index.get(opponent_pokemon.species)
+        if my_row is None or opponent_row is None:
+            return BattleUtilities.get_matchup_score(my_pokemon, opponent_pokemon)
+        score = self.score_view[my_row, opponent_row] / 2
+        if BattleUtilities.opponent_can_outspeed(my_pokemon, opponent_pokemon):
+            score += 0.5
+        return score
+
+    # Type part of the matchup score for every pair of my_team (rows) and opponent_team (columns)
+    def type_scores(self, my_team, opponent_team):
+        rows = [self.index[pokemon.species] for pokemon in my_team]
+        columns = [self.index[pokemon.species] for pokemon in opponent_team]
+        return self.scores[np.ix_(rows, columns)] / 2
+
+# Table shared by the players of this process, loaded (and built if needed) on first use.
+# None if it couldn't be built (for example in a read-only checkout) or loaded (a damaged file),
+# in which case the players fall back to BattleUtilities.get_matchup_score
+matchup_table = None
+matchup_table_loaded = False
+
+def get_matchup_table():
+    global matchup_table, matchup_table_loaded
+    if not matchup_table_loaded:
+        try:
+            if not os.path.exists(TABLE_PATH):
+                build_table()
+            matchup_table = MatchupTable()
+        except (OSError, ValueError):
+            matchup_table = None
+        matchup_table_loaded = True
+    return matchup_table
+
+if __name__ == "__main__":
+    build_table()
@@ -0,0 +1,67 @@
+# Size-bounded transposition table for MinimaxPlayer.
+# Maps a GameNode state hash to the score, remaining search depth and best action
+# found the last time that state was searched. Scores from alpha-beta search can be
+# bounds instead of exact values, so every entry also records which kind it is.
+# Once the table is full the least recently used entry is dropped.
+
+import sys
+
+from collections import OrderedDict
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+TRANSPOSITION_TABLE_SIZE = 200000
+
+class TranspositionTable:
+
+    def __init__(self, max_size=TRANSPOSITION_TABLE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the (score, depth, flag, best_action) entry for a state if it was searched
+    # to exactly this remaining depth. Only using equal depths keeps the search result the
+    # same as searching without a table
+    def probe(self, state_hash, depth):
+        entry = self.entries.get(state_hash)
+        if entry is None or entry[1] != depth:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(state_hash)
+        return entry
+
+    # Best action stored for a state at any depth, used for move ordering
+    def best_action(self, state_hash):
+        entry = self.entries.get(state_hash)
+        if entry is None:
+            return None
+        return entry[3]
+
+    def store(self, state_hash, score, depth, flag, best_action):
+        if state_hash in self.entries:
+            self.entries.move_to_end(state_hash)
+        self.entries[state_hash] = (score, depth, flag, best_action)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    # Approximate size of the table in bytes (the dictionary and the entry tuples, not
+    # the actions they point to, which are owned by the battle)
+    def memory_usage(self):
+        return sys.getsizeof(self.entries) + sum(sys.getsizeof(key) + sys.getsizeof(entry) for key, entry in self.entries.items())
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.entries),
+            "bytes": self.memory_usage(),
+        }
@@ -0,0 +1,72 @@
+# Type effectiveness as arrays, built once from poke_env's TYPE_CHART.
+# Types are encoded as integer IDs in PokemonType order (TYPE_IDS), and NO_TYPE stands for a
+# missing second type or a typeless move.
+# * TYPE_MATRIX[attacking, defending] is the 18x18 type chart
+# * DUAL_TYPE_MATRIX[attacking, type_1, type_2] is the multiplier against a Pokemon with those
+#   types (type_2 can be NO_TYPE); the NO_TYPE attacking row is all 1s, like a typeless move
+# The scalar functions index a nested list copy of DUAL_TYPE_MATRIX, which is faster than
+# indexing the array one element at a time. Results are the same values as
+# Pokemon.damage_multiplier and PokemonType.damage_multiplier.
+
+import numpy as np
+
+from poke_env.data import TYPE_CHART
+from poke_env.environment.pokemon_type import PokemonType
+
+TYPES = list(PokemonType)
+NO_TYPE = len(TYPES)
+TYPE_IDS = {pokemon_type : index for index, pokemon_type in enumerate(TYPES)}
+TYPE_IDS[None] = NO_TYPE
+
+TYPE_MATRIX = np.array([[TYPE_CHART[attacking.name][defending.name] for defending in TYPES] for attacking in TYPES], dtype=float)
+
+def build_dual_type_matrix():
+    padded = np.ones((NO_TYPE + 1, NO_TYPE + 1))
+    padded[:NO_TYPE, :NO_TYPE] = TYPE_MATRIX
+    return padded[:, :, None] * padded[:, None, :]
+
+DUAL_TYPE_MATRIX = build_dual_type_matrix()
+DUAL_TYPE_LIST = DUAL_TYPE_MATRIX.tolist()
+
+def pokemon_type_ids(pokemon):
+    return TYPE_IDS[pokemon.type_1], TYPE_IDS[pokemon.type_2]
+
+# Same as defender.damage_multiplier(move)
+def move_multiplier(move, defender):
+    return DUAL_TYPE_LIST[TYPE_IDS.get(move.type, NO_TYPE)][TYPE_IDS[defender.type_1]][TYPE_IDS[defender.type_2]]
+
+# Same as defender.damage_multiplier(pokemon_type)
+def type_multiplier(pokemon_type, defender):
+    return DUAL_TYPE_LIST[TYPE_IDS.get(pokemon_type, NO_TYPE)][TYPE_IDS[defender.type_1]][TYPE_IDS[defender.type_2]]
+
+# Same as BattleUtilities.get_defensive_type_multiplier: the larger multiplier of
+# opponent_pokemon's types against my_pokemon
+def defensive_multiplier(my_pokemon, opponent_pokemon):
+    type_1 = TYPE_IDS[my_pokemon.type_1]
+    type_2 = TYPE_IDS[my_pokemon.type_2]
+    first_multiplier = DUAL_TYPE_LIST[TYPE_IDS[opponent_pokemon.type_1]][type_1][type_2]
+    if opponent_pokemon.type_2 is None:
+        return first_multiplier
+    second_multiplier = DUAL_TYPE_LIST[TYPE_IDS[opponent_pokemon.type_2]][type_1][type_2]
+    return first_multiplier if first_multiplier > second_multiplier else second_multiplier
+
+# Type IDs of several Pokemon as two arrays (first types, second types)
+def team_type_ids(team):
+    ids = np.array([pokemon_type_ids(pokemon) for pokemon in team], dtype=np.intp).reshape(-1, 2)
+    return ids[:, 0], ids[:, 1]
+
+# Multipliers of every move (rows) against every defender (columns). None moves count as typeless
+def move_multipliers(moves, defenders):
+    move_ids = np.array([TYPE_IDS.get(move.type, NO_TYPE) if move is not None else NO_TYPE for move in moves], dtype=np.intp)
+    type_1, type_2 = team_type_ids(defenders)
+    return DUAL_TYPE_MATRIX[move_ids[:, None], type_1[None, :], type_2[None, :]]
+
+# defensive_multiplier for every pair of my_team (rows) and opponent_team (columns)
+def defensive_multipliers(my_team, opponent_team):
+    my_type_1, my_type_2 = team_type_ids(my_team)
+    opponent_type_1, opponent_type_2 = team_type_ids(opponent_team)
+    # A single-typed opponent only attacks with its first type
+    opponent_type_2 = np.where(opponent_type_2 == NO_TYPE, opponent_type_1, opponent_type_2)
+    first = DUAL_TYPE_MATRIX[opponent_type_1[None, :], my_type_1[:, None], my_type_2[:, None]]
+    second = DUAL_TYPE_MATRIX[opponent_type_2[None, :], my_type_1[:, None], my_type_2[:, None]]
+    return np.maximum(first, second)
@@ -0,0 +1,232 @@
+# Vectorized DQN training on the local simulator: N battles stepped together.
+# VectorBattleEnv runs one LocalSimulator battle per opponent, with env_player (an EnvPlayer like
+# SelfBattler1) as the external side. reset() and step() return env_player's embed_battle
+# observations stacked into an (N, embedding size) array, so select_actions picks every action
+# with one batched forward pass. A finished battle is replaced by a new one in the same step;
+# its last observation is in info["terminal_observations"].
+# VectorDQN is the update of keras-rl's DQNAgent (target network, Huber loss on the chosen
+# action only, linear epsilon annealing) for batches of transitions, since DQNAgent.fit can only
+# step a single environment. The model needs predict_on_batch, train_on_batch, get_weights and
+# set_weights (a Keras model compiled with masked_huber_loss).
+# The opponents and env_player should be created with start_listening=False.
+
+import itertools
+import time
+
+import numpy as np
+
+from LocalSimulator import MAX_TURNS, new_battle
+from ReplayMemory import ReplayMemory
+
+class VectorBattleEnv:
+
+    def __init__(self, env_player, opponents, seed=0, team_size=6, level_range=(72, 88), max_turns=MAX_TURNS):
+        self.env_player = env_player
+        self.opponents = opponents
+        self.n_envs = len(opponents)
+        self.seeds = itertools.count(seed)
+        self.team_size = team_size
+        self.level_range = level_range
+        self.max_turns = max_turns
+        self.battles = [None] * self.n_envs
+        # LocalBattle.decisions generators, each waiting for env_player's next order
+        self.decisions = [None] * self.n_envs
+        self.episodes = self.wins = self.losses = self.ties = 0
+
+    def reset(self):
+        for battle in self.battles:
+            if battle is not None:
+                self.close_battle(battle)
+        return np.stack([self.start_battle(index) for index in range(self.n_envs)])
+
+    # Starts a new battle in environment index and returns its first observation
+    def start_battle(self, index):
+        battle = new_battle(self.env_player, self.opponents[index], next(self.seeds), self.team_size, self.level_range, self.max_turns, external_sides=(0,))
+        decisions = battle.decisions()
+        # Runs until env_player's first decision
+        next(decisions)
+        self.battles[index] = battle
+        self.decisions[index] = decisions
+        return self.env_player.embed_battle(battle.sides[0].battle)
+
+    # Drops the finished battle's views and reward state from both players
+    def close_battle(self, battle):
+        for side in battle.sides:
+            side.player._battles.pop(battle.battle_tag, None)
+        self.env_player._reward_buffer.pop(battle.sides[0].battle, None)
+
+    # Plays one action (an index of env_player's action space) in every battle.
+    # Returns the observations, rewards and dones of every environment, and the info dict
+    def step(self, actions):
+        observations = []
+        rewards = np.zeros(self.n_envs)
+        dones = np.zeros(self.n_envs, dtype=bool)
+        info = {"terminal_observations": {}}
+        for index, action in enumerate(actions):
+            battle = self.battles[index]
+            view = battle.sides[0].battle
+            order = self.env_player._action_to_move(int(action), view)
+            try:
+                self.decisions[index].send(order)
+            except StopIteration:
+                dones[index] = True
+            rewards[index] = self.env_player.compute_reward(view)
+            observation = self.env_player.embed_battle(view)
+            if dones[index]:
+                info["terminal_observations"][index] = observation
+                self.record_result(battle)
+                self.close_battle(battle)
+                observation = self.start_battle(index)
+            observations.append(observation)
+        return np.stack(observations), rewards, dones, info
+
+    def record_result(self, battle):
+        self.episodes += 1
+        if battle.winner == 0:
+            self.wins += 1
+        elif battle.winner == 1:
+            self.losses += 1
+        else:
+            self.ties += 1
+
+    def reset_results(self):
+        self.episodes = self.wins = self.losses = self.ties = 0
+
+# Greedy actions from one forward pass over every observation, each replaced by a random action
+# with probability epsilon
+def select_actions(model, observations, epsilon=0.0, rng=None):
+    # The models take a window of one observation per sample: (batch, 1, embedding size)
+    q_values = np.asarray(model.predict_on_batch(observations[:, np.newaxis]))
+    actions = q_values.argmax(axis=1)
+    if epsilon > 0:
+        rng = rng if rng is not None else np.random.default_rng()
+        explore = rng.random(len(actions)) < epsilon
+        actions[explore] = rng.integers(q_values.shape[1], size=int(explore.sum()))
+    return actions
+
+# Epsilon of LinearAnnealedPolicy after step steps
+def linear_epsilon(step, value_max, value_min, nb_steps):
+    fraction = min(step / nb_steps, 1.0) if nb_steps else 1.0
+    return value_max + (value_min - value_max) * fraction
+
+class VectorDQN:
+
+    # Same parameters as DQNAgent and the LinearAnnealedPolicy of the training script. Steps count
+    # environment steps, so one vector step of N battles is N steps.
+    # target_model has the model's architecture (tf.keras.models.clone_model). A target_model_update
+    # of 1 or more copies the weights every target_model_update steps, a smaller one is the rate
+    # of a soft update after every training batch.
+    # updates_per_step is the number of training batches per vector step. memory is a ReplayMemory
+    # or PrioritizedReplayMemory (a ReplayMemory of memory_limit transitions by default)
+    def __init__(self, model, target_model, nb_actions, memory=None, memory_limit=10000, nb_steps_warmup=1000, gamma=0.99, target_model_update=10000, batch_size=32, updates_per_step=1, value_max=1.0, value_min=0.05, nb_annealing_steps=10000, seed=0):
+        self.model = model
+        self.target_model = target_model
+        self.nb_actions = nb_actions
+        self.memory_limit = memory_limit
+        self.memory = memory
+        self.nb_steps_warmup = nb_steps_warmup
+        self.gamma = gamma
+        self.target_model_update = target_model_update
+        self.batch_size = batch_size
+        self.updates_per_step = updates_per_step
+        self.value_max = value_max
+        self.value_min = value_min
+        self.nb_annealing_steps = nb_annealing_steps
+        self.rng = np.random.default_rng(seed)
+        self.step = 0
+        self.updates = 0
+        self.last_target_update = 0
+        self.target_model.set_weights(self.model.get_weights())
+
+    def epsilon(self):
+        return linear_epsilon(self.step, self.value_max, self.value_min, self.nb_annealing_steps)
+
+    def setup_memory(self, observation_size):
+        if self.memory is None:
+            self.memory = ReplayMemory(self.memory_limit, observation_size)
+
+    # Hard target update every target_model_update steps (soft updates happen in train_batch)
+    def update_target(self):
+        if self.target_model_update >= 1 and self.step - self.last_target_update >= self.target_model_update:
+            self.target_model.set_weights(self.model.get_weights())
+            self.last_target_update = self.step
+
+    # Trains for nb_steps environment steps and returns the steps per second and results
+    def fit(self, env, nb_steps):
+        env.reset_results()
+        observations = env.reset()
+        self.setup_memory(observations.shape[1])
+        start = time.perf_counter()
+        first_step = self.step
+        total_reward = 0.0
+        while self.step - first_step < nb_steps:
+            actions = select_actions(self.model, observations, self.epsilon(), self.rng)
+            next_observations, rewards, dones, info = env.step(actions)
+            # The replay needs the last observation of a finished battle, not the new battle's first one
+            stored_observations = next_observations
+            if info["terminal_observations"]:
+                stored_observations = next_observations.copy()
+                for index, observation in info["terminal_observations"].items():
+                    stored_observations[index] = observation
+            self.memory.append_batch(observations, actions, rewards, stored_observations, dones)
+            self.step += env.n_envs
+            total_reward += rewards.sum()
+            if self.step > self.nb_steps_warmup:
+                for _ in range(self.updates_per_step):
+                    self.train_batch()
+            self.update_target()
+            observations = next_observations
+        elapsed = time.perf_counter() - start
+        steps = self.step - first_step
+        return {
+            "steps": steps,
+            "updates": self.updates,
+            "episodes": env.episodes,
+            "wins": env.wins,
+            "losses": env.losses,
+            "ties": env.ties,
+            "mean_reward": float(total_reward) / steps if steps else 0.0,
+            "seconds": elapsed,
+            "steps_per_second": steps / elapsed if elapsed else 0.0,
+        }
+
+    def train_batch(self):
+        observations, actions, rewards, next_observations, dones, indices, weights = self.memory.sample(self.batch_size, self.rng)
+        next_q_values = np.asarray(self.target_model.predict_on_batch(next_observations[:, np.newaxis]))
+        target_values = rewards + self.gamma * ~dones * next_q_values.max(axis=1)
+        if self.memory.prioritized:
+            q_values = np.asarray(self.model.predict_on_batch(observations[:, np.newaxis]))
+            self.memory.update_priorities(indices, target_values - q_values[np.arange(self.batch_size), actions])
+        # Only the chosen action has a target, the others are masked out of the loss with NaN
+        targets = np.full((self.batch_size, self.nb_actions), np.nan, dtype=np.float32)
+        targets[np.arange(self.batch_size), actions] = target_values
+        self.model.train_on_batch(observations[:, np.newaxis], targets, sample_weight=weights)
+        self.updates += 1
+        if self.target_model_update < 1:
+            tau = self.target_model_update
+            self.target_model.set_weights([tau * weights + (1 - tau) * target_weights for weights, target_weights in zip(self.model.get_weights(), self.target_model.get_weights())])
+
+    # Plays nb_episodes battles with the greedy policy and returns the results
+    def test(self, env, nb_episodes):
+        env.reset_results()
+        observations = env.reset()
+        while env.episodes < nb_episodes:
+            observations, _, _, _ = env.step(select_actions(self.model, observations))
+        return {"episodes": env.episodes, "wins": env.wins, "losses": env.losses, "ties": env.ties}
+
+# Keras loss for VectorDQN: the Huber loss of DQNAgent (clipped at delta_clip) on the targets that
+# aren't NaN, summed over actions
+def masked_huber_loss(delta_clip=np.inf):
+    # Only training needs TensorFlow
+    import tensorflow as tf
+
+    def loss(y_true, y_pred):
+        mask = tf.math.is_finite(y_true)
+        error = tf.where(mask, y_true - y_pred, tf.zeros_like(y_pred))
+        if np.isinf(delta_clip):
+            return tf.reduce_sum(0.5 * tf.square(error), axis=-1)
+        abs_error = tf.abs(error)
+        quadratic = tf.minimum(abs_error, delta_clip)
+        return tf.reduce_sum(0.5 * tf.square(quadratic) + delta_clip * (abs_error - quadratic), axis=-1)
+
+    return loss